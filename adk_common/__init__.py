@@ -0,0 +1,6 @@
+"""
+adk_common - Codice condiviso tra le app Streamlit e gli agenti ADK.
+
+I sottomoduli si importano singolarmente: nessuno viene caricato qui,
+così le app non pagano l'import di dipendenze che non usano.
+"""
@@ -0,0 +1,146 @@
+"""
+Controllo di ammissione lato client per le chiamate agli agenti (/run).
+
+Quando Gemini o l'api_server sono saturi una raffica di click diventa una
+cascata di 429/503. Qui:
+
+- AdaptiveLimiter limita le chiamate in corso nel processo con un limite
+  AIMD: +1 ogni `limit` successi, dimezzato a ogni 429/503
+- le richieste oltre il limite aspettano in coda FIFO; la posizione viene
+  notificata a un callback (le app la mostrano nella pagina)
+- backoff_delay calcola l'attesa prima di un nuovo tentativo: esponenziale
+  con jitter, oppure Retry-After se il server lo indica
+
+Configurazione:
+
+- ADK_RUN_CONCURRENCY: limite iniziale (default 4)
+- ADK_RUN_MAX_CONCURRENCY: limite massimo (default 16)
+- ADK_RUN_MAX_RETRIES: nuovi tentativi su 429/503 (default 4)
+- ADK_RUN_BACKOFF_BASE / ADK_RUN_BACKOFF_MAX: secondi (default 0.5 / 8)
+"""
+
+import os
+import random
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Iterator, Optional
+
+RUN_CONCURRENCY = float(os.environ.get("ADK_RUN_CONCURRENCY", "4"))
+RUN_MAX_CONCURRENCY = float(os.environ.get("ADK_RUN_MAX_CONCURRENCY", "16"))
+RUN_MAX_RETRIES = int(os.environ.get("ADK_RUN_MAX_RETRIES", "4"))
+BACKOFF_BASE = float(os.environ.get("ADK_RUN_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.environ.get("ADK_RUN_BACKOFF_MAX", "8"))
+
+# Status che indicano sovraccarico: si riprova e si riduce il limite
+RETRY_STATUSES = frozenset({429, 503})
+
+QueueCallback = Callable[[int], None]
+
+
+class AdaptiveLimiter:
+    """
+    Semaforo con limite adattivo (AIMD) e coda FIFO.
+
+    Uso:
+        with limiter.slot(on_wait=lambda position: ...):
+            response = ...
+        limiter.on_success() / limiter.on_overload()
+    """
+
+    def __init__(self, initial: float = RUN_CONCURRENCY, min_limit: float = 1,
+                 max_limit: float = RUN_MAX_CONCURRENCY, decrease_factor: float = 0.5):
+        self.min_limit = min_limit
+        self.max_limit = max(max_limit, min_limit)
+        self.decrease_factor = decrease_factor
+        self.limit = min(max(initial, min_limit), self.max_limit)
+        self.in_flight = 0
+        self._queue: deque = deque()
+        self._condition = threading.Condition()
+
+    def _admissible(self, ticket: object) -> bool:
+        return self._queue[0] is ticket and self.in_flight < int(self.limit)
+
+    @contextmanager
+    def slot(self, on_wait: Optional[QueueCallback] = None) -> Iterator[None]:
+        """
+        Occupa uno slot, aspettando il proprio turno in coda.
+
+        on_wait riceve la posizione in coda (1 = prossimo) mentre si aspetta
+        e 0 quando la richiesta viene ammessa dopo aver aspettato.
+        """
+        ticket = object()
+        with self._condition:
+            self._queue.append(ticket)
+        waited = False
+        admitted = False
+        last_position = None
+        try:
+            while True:
+                with self._condition:
+                    if self._admissible(ticket):
+                        self._queue.popleft()
+                        self.in_flight += 1
+                        admitted = True
+                        # Il prossimo in coda potrebbe avere uno slot libero anche lui
+                        self._condition.notify_all()
+                        break
+                    position = self._queue.index(ticket) + 1
+                    waited = True
+                    if on_wait is None or position == last_position:
+                        self._condition.wait(timeout=1.0)
+                        continue
+                # Callback fuori dal lock: in Streamlit può sollevare (rerun, stop)
+                on_wait(position)
+                last_position = position
+        finally:
+            if not admitted:
+                # Un ticket rimasto in testa alla coda bloccherebbe tutte le richieste successive
+                with self._condition:
+                    if ticket in self._queue:
+                        self._queue.remove(ticket)
+                    self._condition.notify_all()
+        try:
+            if waited and on_wait is not None:
+                on_wait(0)
+            yield
+        finally:
+            with self._condition:
+                self.in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self) -> None:
+        """Aumento additivo: circa +1 ogni `limit` risposte andate a buon fine"""
+        with self._condition:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def on_overload(self) -> None:
+        """Diminuzione moltiplicativa dopo un 429/503"""
+        with self._condition:
+            self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+
+def queue_indicator(placeholder) -> QueueCallback:
+    """Callback on_wait che mostra la posizione in coda in un placeholder Streamlit (st.empty())"""
+    def show(position: int) -> None:
+        if position:
+            placeholder.info(f"⏳ Richiesta in coda: posizione {position}")
+        else:
+            placeholder.empty()
+    return show
+
+
+def backoff_delay(attempt: int, retry_after: Optional[str] = None,
+                  base: float = BACKOFF_BASE, cap: float = BACKOFF_MAX) -> float:
+    """Attesa prima del tentativo `attempt` (da 0): Retry-After se presente, altrimenti full jitter"""
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass  # Retry-After come data HTTP: si usa il backoff
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,79 @@
+"""
+Scadenze delle richieste di approval.
+
+request_human_approval restituisce l'ora di creazione e una scadenza che
+dipende dal livello di rischio: più l'azione è rischiosa, meno a lungo la
+richiesta resta valida. Scaduta la deadline l'approval è considerato
+rifiutato: adk_server (vedi adk_server.approval_expiry) invia all'agente una
+functionResponse di rifiuto e le app smettono di mostrare i pulsanti.
+
+Deadline in secondi per livello: ADK_APPROVAL_TTL_LOW / _MEDIUM / _HIGH
+(default 1800 / 900 / 300).
+"""
+
+import os
+import time
+from typing import Any, Dict, Iterable, Optional
+
+APPROVAL_TOOL_NAME = "request_human_approval"
+
+APPROVAL_DEADLINES = {
+    "low": float(os.environ.get("ADK_APPROVAL_TTL_LOW", "1800")),
+    "medium": float(os.environ.get("ADK_APPROVAL_TTL_MEDIUM", "900")),
+    "high": float(os.environ.get("ADK_APPROVAL_TTL_HIGH", "300")),
+}
+
+# Risposte dell'utente che chiudono un approval ("dettagli" lo lascia aperto)
+APPROVAL_DECISIONS = frozenset({"si", "no"})
+
+
+def approval_deadline(risk_level: Optional[str], created_at: float) -> float:
+    """Timestamp di scadenza (livello sconosciuto = medium)"""
+    ttl = APPROVAL_DEADLINES.get((risk_level or "medium").lower(), APPROVAL_DEADLINES["medium"])
+    return created_at + ttl
+
+
+def expired_response(expires_at: float) -> Dict[str, Any]:
+    """Risposta del tool con cui un approval scaduto viene chiuso come rifiutato"""
+    return {
+        "status": "rejected",
+        "reason": "expired",
+        "approved": False,
+        "expires_at": expires_at,
+        "message": "⌛ Richiesta di approvazione scaduta senza risposta: azione rifiutata automaticamente",
+    }
+
+
+def with_deadline(approval_details: Optional[Dict[str, Any]], events: Iterable[Dict[str, Any]] = (),
+                  now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Completa i dettagli di un approval (spesso gli args della functionCall)
+    con created_at/expires_at presi dalla functionResponse del tool, oppure
+    calcolati dal livello di rischio se la risposta non c'è.
+    """
+    details = dict(approval_details or {})
+    if "expires_at" in details:
+        return details
+    for event in events:
+        for part in event.get("content", {}).get("parts", []):
+            response = part.get("functionResponse") or {}
+            if response.get("name") == APPROVAL_TOOL_NAME and "expires_at" in (response.get("response") or {}):
+                details.setdefault("created_at", response["response"].get("timestamp"))
+                details["expires_at"] = response["response"]["expires_at"]
+                return details
+    created_at = now if now is not None else time.time()
+    details.setdefault("created_at", created_at)
+    details["expires_at"] = approval_deadline(details.get("risk_level"), created_at)
+    return details
+
+
+def seconds_left(approval_details: Optional[Dict[str, Any]], now: Optional[float] = None) -> Optional[float]:
+    """Secondi alla scadenza (negativi se scaduto), None se l'approval non ha deadline"""
+    if not approval_details or not approval_details.get("expires_at"):
+        return None
+    return approval_details["expires_at"] - (now if now is not None else time.time())
+
+
+def is_expired(approval_details: Optional[Dict[str, Any]], now: Optional[float] = None) -> bool:
+    remaining = seconds_left(approval_details, now)
+    return remaining is not None and remaining <= 0
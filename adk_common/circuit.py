@@ -0,0 +1,110 @@
+"""
+Circuit breaker per il backend ADK.
+
+Se l'api_server è giù ogni click aspetterebbe il fallimento della connessione
+TCP, tenendo occupato il thread dello script Streamlit. Il breaker:
+
+- CLOSED: le richieste passano; dopo `failure_threshold` errori di
+  connessione consecutivi passa a OPEN
+- OPEN: le richieste falliscono subito (BackendUnavailable) per `reset_timeout` secondi
+- HALF_OPEN: scaduto il timeout un solo chiamante esegue la probe di
+  readiness (GET leggera con timeout breve); se va bene si torna a CLOSED,
+  altrimenti di nuovo OPEN
+
+Configurazione: ADK_BREAKER_FAILURES (default 2), ADK_BREAKER_RESET (secondi, default 5).
+"""
+
+import os
+import threading
+import time
+from enum import Enum
+from typing import Callable
+
+import requests
+
+BREAKER_FAILURES = int(os.environ.get("ADK_BREAKER_FAILURES", "2"))
+BREAKER_RESET = float(os.environ.get("ADK_BREAKER_RESET", "5"))
+
+
+class BackendUnavailable(requests.ConnectionError):
+    """Backend noto come non raggiungibile: la richiesta non è stata inviata"""
+
+
+class BackendTimeout(requests.ReadTimeout):
+    """
+    Il backend ha accettato la richiesta ma non ha risposto entro il read
+    timeout: potrebbe essere ancora in esecuzione, quindi non va reinviata
+    """
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """
+    Args:
+        probe: Funzione senza argomenti che restituisce True se il backend è pronto
+        failure_threshold: Errori consecutivi che aprono il circuito
+        reset_timeout: Secondi in OPEN prima di una nuova probe
+    """
+
+    def __init__(self, probe: Callable[[], bool], failure_threshold: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET):
+        self.probe = probe
+        self.failure_threshold = max(failure_threshold, 1)
+        self.reset_timeout = reset_timeout
+        self.state = CircuitState.CLOSED
+        self.failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True se una richiesta può partire; in HALF_OPEN esegue la probe"""
+        with self._lock:
+            if self.state is CircuitState.CLOSED:
+                return True
+            if self.state is CircuitState.HALF_OPEN or time.monotonic() < self._retry_at:
+                # Circuito aperto, oppure un altro thread sta già facendo la probe
+                return False
+            self.state = CircuitState.HALF_OPEN
+
+        try:
+            healthy = self.probe()
+        except Exception:
+            healthy = False
+        if healthy:
+            self.record_success()
+        else:
+            self._open()
+        return healthy
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = CircuitState.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.failures < self.failure_threshold and self.state is CircuitState.CLOSED:
+                return
+        self._open()
+
+    def _open(self) -> None:
+        with self._lock:
+            self.state = CircuitState.OPEN
+            self._retry_at = time.monotonic() + self.reset_timeout
+
+    @property
+    def is_open(self) -> bool:
+        return self.state is not CircuitState.CLOSED
+
+    @property
+    def retry_in(self) -> float:
+        """Secondi alla prossima probe (0 se il circuito è chiuso o la probe è dovuta)"""
+        if self.state is CircuitState.CLOSED:
+            return 0.0
+        return max(self._retry_at - time.monotonic(), 0.0)
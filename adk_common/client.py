@@ -0,0 +1,246 @@
+"""
+Client HTTP condiviso dalle app Streamlit verso l'ADK API server.
+
+- riusa le connessioni (una requests.Session per thread)
+- negozia la compressione delle risposte (Accept-Encoding: br se brotli è
+  installato, altrimenti gzip); la decompressione la fa urllib3
+- opzionalmente comprime con gzip i body delle richieste sopra una soglia
+  (ADK_COMPRESS_REQUESTS=1): il server deve supportarlo, come adk_server
+- le chiamate agli agenti (/run, /run_sse) passano dal limiter adattivo
+  condiviso e vengono ritentate su 429/503 (vedi adk_common.admission)
+- con il backend giù le richieste falliscono subito con BackendUnavailable
+  (circuit breaker con probe di readiness, vedi adk_common.circuit); un
+  read timeout diventa BackendTimeout: il server ha già la richiesta, non
+  si reinvia; lo stesso vale per il body delle risposte in streaming,
+  letto con iter_events/decode_events
+- ogni richiesta è uno span client e porta l'header `traceparent` della
+  trace corrente (vedi adk_common.tracing)
+- conteggi e latenze delle chiamate agli agenti finiscono nel registry
+  delle metriche del processo (vedi adk_common.metrics)
+"""
+
+import gzip
+import os
+import threading
+import time
+from typing import Any, Dict, Iterator, List, Optional
+
+import requests
+import urllib3
+
+from adk_common.admission import (
+    RETRY_STATUSES, RUN_MAX_RETRIES, AdaptiveLimiter, QueueCallback, backoff_delay,
+)
+from adk_common.circuit import BackendTimeout, BackendUnavailable, CircuitBreaker
+from adk_common.decoding import dumps, iter_run_events, iter_sse_events
+from adk_common.metrics import RUN_DURATION, RUN_REQUESTS, TURNS, gauge, start_metrics_server
+from adk_common.tracing import client_span, record_status, setup_tracing
+
+try:
+    import brotli  # noqa: F401  (urllib3 lo usa per decodificare "br")
+    ACCEPT_ENCODING = "br, gzip"
+except ImportError:
+    ACCEPT_ENCODING = "gzip"
+
+COMPRESS_REQUESTS = os.environ.get("ADK_COMPRESS_REQUESTS", "0") == "1"
+COMPRESS_MIN_SIZE = int(os.environ.get("ADK_COMPRESS_MIN_SIZE", "1024"))
+
+CONNECT_TIMEOUT = float(os.environ.get("ADK_CONNECT_TIMEOUT", "2"))
+READ_TIMEOUT = float(os.environ.get("ADK_READ_TIMEOUT", "300"))
+PROBE_TIMEOUT = float(os.environ.get("ADK_PROBE_TIMEOUT", "1"))
+# adk_server espone /healthz; con `adk api_server` risponde 404, che basta
+# comunque a dire che il server è su
+HEALTH_PATH = os.environ.get("ADK_HEALTH_PATH", "/healthz")
+
+# Endpoint che eseguono l'agente (e quindi chiamano il modello)
+LIMITED_PATHS = frozenset({"/run", "/run_sse"})
+
+CLIENT_IN_FLIGHT = gauge("adk_client_in_flight", "Chiamate all'agente in corso", ("backend",))
+CLIENT_QUEUED = gauge("adk_client_queued", "Chiamate all'agente in coda nel limiter", ("backend",))
+CLIENT_LIMIT = gauge("adk_client_concurrency_limit", "Limite di concorrenza adattivo", ("backend",))
+CLIENT_BREAKER_OPEN = gauge("adk_client_breaker_open", "1 se il circuit breaker è aperto", ("backend",))
+
+
+class AdkClient:
+    """Client per un ADK API server (es. http://localhost:8000)"""
+
+    def __init__(self, base_url: str, compress_requests: bool = COMPRESS_REQUESTS,
+                 compress_min_size: int = COMPRESS_MIN_SIZE, max_retries: int = RUN_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.compress_requests = compress_requests
+        self.compress_min_size = compress_min_size
+        self.max_retries = max_retries
+        # Condiviso da tutti i thread (= utenti Streamlit) del processo
+        self.limiter = AdaptiveLimiter()
+        self.breaker = CircuitBreaker(self._probe)
+        self._local = threading.local()
+        CLIENT_IN_FLIGHT.labels(backend=self.base_url).set_function(lambda: self.limiter.in_flight)
+        CLIENT_QUEUED.labels(backend=self.base_url).set_function(lambda: self.limiter.queued)
+        CLIENT_LIMIT.labels(backend=self.base_url).set_function(lambda: self.limiter.limit)
+        CLIENT_BREAKER_OPEN.labels(backend=self.base_url).set_function(lambda: int(self.breaker.is_open))
+
+    @property
+    def session(self) -> requests.Session:
+        # Streamlit esegue ogni sessione utente in un thread diverso
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.headers["Accept-Encoding"] = ACCEPT_ENCODING
+            self._local.session = session
+        return session
+
+    def _probe(self) -> bool:
+        """Readiness probe: qualsiasi risposta sotto 500 vuol dire server raggiungibile"""
+        try:
+            return self.session.get(f"{self.base_url}{HEALTH_PATH}", timeout=PROBE_TIMEOUT).status_code < 500
+        except requests.RequestException:
+            return False
+
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        if not self.breaker.allow():
+            raise BackendUnavailable(f"Backend ADK non raggiungibile ({self.base_url})")
+        kwargs.setdefault("timeout", (CONNECT_TIMEOUT, READ_TIMEOUT))
+        headers = dict(kwargs.pop("headers", None) or {})
+        with client_span(method, path, headers) as span:
+            try:
+                response = self.session.request(method, f"{self.base_url}{path}", headers=headers, **kwargs)
+            except requests.ConnectionError as error:
+                # Comprende ConnectTimeout: la richiesta non è arrivata al server
+                self.breaker.record_failure()
+                raise BackendUnavailable(f"Backend ADK non raggiungibile ({self.base_url}): {error}") from error
+            except requests.ReadTimeout as error:
+                # Server raggiungibile ma lento: niente breaker, e /run non è idempotente
+                raise BackendTimeout(f"Nessuna risposta dal backend ADK entro {READ_TIMEOUT:.0f}s: {error}") from error
+            record_status(span, response.status_code)
+        self.breaker.record_success()
+        return response
+
+    def backend_available(self) -> bool:
+        """Stato del backend senza inviare richieste (salvo la probe, se dovuta)"""
+        return self.breaker.allow()
+
+    @property
+    def degraded(self) -> bool:
+        return self.breaker.is_open
+
+    def _encode_body(self, payload: Any) -> tuple:
+        body = dumps(payload)
+        headers = {"Content-Type": "application/json"}
+        if self.compress_requests and len(body) >= self.compress_min_size:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        return body, headers
+
+    def post_json(self, path: str, payload: Any, stream: bool = False,
+                  headers: Optional[Dict[str, str]] = None,
+                  on_wait: Optional[QueueCallback] = None) -> requests.Response:
+        """
+        POST JSON. Per /run e /run_sse: ammissione tramite il limiter
+        (on_wait riceve la posizione in coda) e nuovi tentativi su 429/503.
+        """
+        body, request_headers = self._encode_body(payload)
+        request_headers.update(headers or {})
+        if path not in LIMITED_PATHS:
+            return self._send("POST", path, data=body, headers=request_headers, stream=stream)
+
+        TURNS.labels(app=payload.get("app_name", "")).inc()
+        attempt = 0
+        while True:
+            # Lo slot copre la richiesta fino agli header: /run risponde solo
+            # a esecuzione dell'agente terminata
+            with self.limiter.slot(on_wait), RUN_DURATION.labels(path=path).time():
+                response = self._send("POST", path, data=body, headers=request_headers, stream=stream)
+            RUN_REQUESTS.labels(path=path, status=response.status_code).inc()
+            if response.status_code not in RETRY_STATUSES:
+                if response.ok:
+                    self.limiter.on_success()
+                return response
+            self.limiter.on_overload()
+            if attempt >= self.max_retries:
+                return response
+            delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+            response.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def iter_events(self, response: requests.Response, sse: bool = False, **kwargs) -> Iterator[Dict[str, Any]]:
+        """
+        Eventi di una risposta ottenuta con stream=True da /run (o /run_sse
+        con sse=True); kwargs (slim, on_event) come in adk_common.decoding.
+
+        Il body si legge dopo che post_json è tornato: gli errori di rete a
+        metà lettura vengono tradotti come in _send, BackendUnavailable (e un
+        fallimento per il breaker) se la connessione cade, BackendTimeout se
+        il server smette di scrivere.
+        """
+        decode = iter_sse_events if sse else iter_run_events
+        try:
+            yield from decode(response, **kwargs)
+        except (requests.RequestException, urllib3.exceptions.HTTPError, OSError) as error:
+            if _is_read_timeout(error):
+                raise BackendTimeout(f"Risposta del backend ADK interrotta, nessun dato entro {READ_TIMEOUT:.0f}s: {error}") from error
+            self.breaker.record_failure()
+            raise BackendUnavailable(f"Connessione al backend ADK interrotta ({self.base_url}): {error}") from error
+        finally:
+            response.close()
+
+    def decode_events(self, response: requests.Response, **kwargs) -> List[Dict[str, Any]]:
+        """Sostituto di `response.json()` per /run, con gli errori di iter_events"""
+        return list(self.iter_events(response, **kwargs))
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self._send("GET", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self._send("DELETE", path, **kwargs)
+
+    def delete_session(self, app_name: str, user_id: str, session_id: str) -> bool:
+        """
+        Elimina una sessione ADK non più usata, così il server libera memoria.
+
+        Best effort: un errore non deve bloccare la creazione della nuova sessione.
+        """
+        try:
+            return self.delete(f"/apps/{app_name}/users/{user_id}/sessions/{session_id}").status_code == 200
+        except requests.RequestException:
+            return False
+
+    def approval_status(self, app_name: str, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Stato dell'approval aperto secondo adk_server (vedi
+        adk_server.approval_expiry.approval_status); None se il server non
+        risponde: in quel caso l'approval resta com'è.
+        """
+        try:
+            response = self.get(f"/apps/{app_name}/users/{user_id}/sessions/{session_id}/approval")
+        except requests.RequestException:
+            return None
+        return response.json() if response.status_code == 200 else None
+
+
+def _is_read_timeout(error: BaseException) -> bool:
+    # A metà body requests incapsula il ReadTimeoutError di urllib3 in un
+    # ConnectionError; ijson legge response.raw e lo riceve così com'è
+    cause = error.args[0] if isinstance(error, requests.ConnectionError) and error.args else error
+    return isinstance(cause, (requests.Timeout, urllib3.exceptions.ReadTimeoutError, TimeoutError))
+
+
+def describe_error(response: requests.Response) -> str:
+    """Dettaglio d'errore da mostrare all'utente per una risposta non 200"""
+    if response.status_code in RETRY_STATUSES:
+        return "servizio sovraccarico, riprova tra qualche secondo"
+    return response.text
+
+
+_clients: Dict[str, AdkClient] = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(base_url: str) -> AdkClient:
+    """Client condiviso per base_url: sopravvive ai rerun di Streamlit"""
+    with _clients_lock:
+        if base_url not in _clients:
+            setup_tracing("adk-frontend", deferred=True)
+            start_metrics_server()
+            _clients[base_url] = AdkClient(base_url)
+        return _clients[base_url]
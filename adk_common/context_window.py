@@ -0,0 +1,167 @@
+"""
+Finestra di contesto per le sessioni lunghe.
+
+ADK manda al modello tutta la storia della sessione a ogni chiamata, quindi
+latenza e token crescono con la lunghezza della conversazione. ContextWindow
+è un before_model_callback che:
+
+- tiene verbatim gli ultimi `max_turns` turni (un turno inizia con un
+  messaggio di testo dell'utente)
+- riassume i turni più vecchi in un riassunto incrementale salvato nello
+  stato di sessione, aggiunto alle istruzioni di sistema (o in testa ai
+  contents, se le istruzioni sono già in cache: vedi adk_common.prompt_cache)
+- non riassume mai un turno con una chiamata di approval ancora aperta (né
+  quelli successivi), altrimenti il modello non saprebbe a cosa si riferisce
+  un "si"/"no" dell'utente
+
+Il riassunto è estrattivo (nessuna chiamata extra al modello) e limitato a
+`summary_max_chars` caratteri: le righe più vecchie vengono scartate per prime.
+"""
+
+from typing import List, Optional, Sequence
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from adk_common.approvals import APPROVAL_DECISIONS, APPROVAL_TOOL_NAME
+
+SUMMARY_STATE_KEY = "context_window:summary"
+FOLDED_STATE_KEY = "context_window:folded_turns"
+
+_PREVIEW_CHARS = 200
+
+
+def _is_user_text(content: types.Content) -> bool:
+    return content.role == "user" and any(part.text for part in content.parts or [])
+
+
+def _split_turns(contents: Sequence[types.Content]) -> List[List[types.Content]]:
+    turns: List[List[types.Content]] = []
+    for content in contents:
+        if not turns or _is_user_text(content):
+            turns.append([])
+        turns[-1].append(content)
+    return turns
+
+
+def _preview(text: str) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= _PREVIEW_CHARS else text[:_PREVIEW_CHARS] + "..."
+
+
+def summarize_turn(turn: Sequence[types.Content]) -> str:
+    """Riassunto estrattivo di un turno: testo utente, tool chiamati, risposta"""
+    lines = []
+    for content in turn:
+        for part in content.parts or []:
+            if part.text:
+                speaker = "Utente" if content.role == "user" else "Assistente"
+                lines.append(f"{speaker}: {_preview(part.text)}")
+            elif part.function_call:
+                lines.append(f"Tool {part.function_call.name}({_preview(str(part.function_call.args or {}))})")
+            elif part.function_response:
+                status = (part.function_response.response or {}).get("status", "ok")
+                lines.append(f"Esito {part.function_response.name}: {status}")
+    return "- " + "\n  ".join(lines) if lines else ""
+
+
+class ContextWindow:
+    """
+    before_model_callback che limita il contesto agli ultimi turni.
+
+    Args:
+        max_turns: Turni mantenuti verbatim
+        pinned_tools: Tool le cui chiamate aperte allargano la finestra fino al loro turno
+        summary_max_chars: Lunghezza massima del riassunto
+        decisions: Risposte dell'utente che chiudono un approval ("dettagli" lo lascia aperto)
+    """
+
+    def __init__(self, max_turns: int = 20, pinned_tools: Sequence[str] = (APPROVAL_TOOL_NAME,),
+                 summary_max_chars: int = 4000, decisions: Sequence[str] = APPROVAL_DECISIONS):
+        self.max_turns = max(max_turns, 1)
+        self.pinned_tools = frozenset(pinned_tools)
+        self.summary_max_chars = summary_max_chars
+        self.decisions = frozenset(decisions)
+
+    def _open_approval_turn(self, turns: List[List[types.Content]]) -> Optional[int]:
+        """
+        Indice dell'ultimo turno con una chiamata a un pinned tool ancora aperta:
+        senza risposta del tool, oppure ancora "pending_approval" e senza un
+        turno successivo in cui l'utente ha deciso (si/no) e il modello ha già
+        risposto. Una risposta definitiva (es. rifiuto per scadenza) la chiude.
+        """
+        for index in range(len(turns) - 1, -1, -1):
+            calls = {
+                part.function_call.id
+                for content in turns[index] for part in content.parts or []
+                if part.function_call and part.function_call.name in self.pinned_tools
+            }
+            if not calls:
+                continue
+            responses = [
+                part.function_response
+                for turn in turns[index:] for content in turn for part in content.parts or []
+                if part.function_response and part.function_response.id in calls
+            ]
+            responded = {response.id for response in responses}
+            resolved = {
+                response.id for response in responses
+                if (response.response or {}).get("status") != "pending_approval"
+            }
+            decided = any(self._is_decision_turn(turn) for turn in turns[index + 1:])
+            if not calls <= responded:
+                return index
+            return None if decided or calls <= resolved else index
+        return None
+
+    def _is_decision_turn(self, turn: List[types.Content]) -> bool:
+        user_text = " ".join(part.text for part in turn[0].parts or [] if part.text).strip().lower()
+        answered = any(
+            content.role == "model" and any(part.text for part in content.parts or []) for content in turn[1:]
+        )
+        return user_text in self.decisions and answered
+
+    def _summary(self, callback_context: CallbackContext, foldable: List[List[types.Content]]) -> str:
+        state = callback_context.state
+        summary = state.get(SUMMARY_STATE_KEY, "")
+        folded = state.get(FOLDED_STATE_KEY, 0)
+        if folded > len(foldable):
+            # La finestra è cambiata (es. nuova configurazione): si riparte da zero
+            summary, folded = "", 0
+
+        new_lines = [line for line in (summarize_turn(turn) for turn in foldable[folded:]) if line]
+        if not new_lines:
+            return summary
+
+        summary = "\n".join(filter(None, [summary, *new_lines]))
+        if len(summary) > self.summary_max_chars:
+            summary = summary[-self.summary_max_chars:]
+            summary = summary[summary.find("\n- ") + 1:] if "\n- " in summary else summary
+        state[SUMMARY_STATE_KEY] = summary
+        state[FOLDED_STATE_KEY] = len(foldable)
+        return summary
+
+    def before_model_callback(self, callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+        turns = _split_turns(llm_request.contents)
+        if len(turns) <= self.max_turns:
+            return None
+
+        # Con un approval aperto la finestra si allarga fino a includerlo:
+        # il riassunto resta così sempre un prefisso della conversazione
+        cut = len(turns) - self.max_turns
+        pinned_index = self._open_approval_turn(turns)
+        if pinned_index is not None:
+            cut = min(cut, pinned_index)
+
+        summary = self._summary(callback_context, turns[:cut])
+        llm_request.contents = [content for turn in turns[cut:] for content in turn]
+        if summary:
+            summary = "Riassunto della parte precedente della conversazione (turni più vecchi non inclusi):\n" + summary
+            if llm_request.config and llm_request.config.cached_content:
+                # Istruzioni in cache (PromptCache): l'API non accetta anche
+                # system_instruction, il riassunto apre la conversazione
+                llm_request.contents.insert(0, types.Content(role="user", parts=[types.Part(text=summary)]))
+            else:
+                llm_request.append_instructions([summary])
+        return None
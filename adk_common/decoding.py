@@ -0,0 +1,221 @@
+"""
+Decodifica veloce e incrementale delle risposte di /run (e di /run_sse).
+
+/run restituisce un array JSON di eventi che può pesare diversi MB
+(output dei tool). Invece di `response.json()` le app usano
+`decode_run_response()`, che:
+
+- legge il body in streaming, un evento alla volta
+- tiene di ogni evento solo i campi che le app usano (vedi `slim_event`)
+
+Il log eventi (adk_common.event_store) vuole invece gli eventi interi
+(author, id, actions, risposte dei tool): le app passano ai decoder
+`on_event=EventRecorder(...)`, che scrive ogni evento intero appena
+decodificato; in memoria resta solo la versione ridotta, mai la lista degli
+eventi interi.
+
+Backend, in ordine di preferenza (dipendenze opzionali, `pip install .[fast]`):
+
+- ijson: parsing in streaming vero, memoria limitata al singolo evento
+- orjson: parsing dell'intero body, molto più veloce di json
+- json (stdlib): parser incrementale basato su raw_decode
+"""
+
+import codecs
+import itertools
+import json
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+CHUNK_SIZE = 64 * 1024
+
+# functionResponse di cui le app leggono il contenuto: per gli altri tool si
+# tengono solo name/id, così gli output giganti non restano in memoria
+FULL_RESPONSE_TOOLS = frozenset({"request_human_approval"})
+
+_WHITESPACE = " \t\n\r"
+
+
+def loads(data):
+    """json.loads con orjson quando disponibile"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """Serializzazione compatta in bytes UTF-8, con orjson quando disponibile"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def slim_event(event: Dict[str, Any], full_response_tools=FULL_RESPONSE_TOOLS) -> Dict[str, Any]:
+    """
+    Riduce un evento ADK ai soli campi usati dalle app:
+    content.role, parti text/functionCall/functionResponse, longRunningToolIds,
+    usageMetadata (conteggio token, vedi adk_common.usage) e i flag di streaming.
+    """
+    slim = {}
+    content = event.get("content")
+    if isinstance(content, dict):
+        parts = []
+        for part in content.get("parts") or []:
+            if "text" in part:
+                parts.append({"text": part["text"]})
+            elif "functionCall" in part:
+                parts.append({"functionCall": part["functionCall"]})
+            elif "functionResponse" in part:
+                function_response = part["functionResponse"]
+                if function_response.get("name") in full_response_tools:
+                    parts.append({"functionResponse": function_response})
+                else:
+                    parts.append({"functionResponse": {
+                        "id": function_response.get("id"),
+                        "name": function_response.get("name"),
+                    }})
+        slim["content"] = {"role": content.get("role")}
+        # Contenuti senza parti (es. finish SAFETY o risposta vuota) restano senza "parts"
+        if parts:
+            slim["content"]["parts"] = parts
+    if event.get("longRunningToolIds"):
+        slim["longRunningToolIds"] = event["longRunningToolIds"]
+    if event.get("usageMetadata"):
+        slim["usageMetadata"] = event["usageMetadata"]
+    # Segnali di streaming (/run_sse, /run_live)
+    for flag in ("partial", "turnComplete", "interrupted"):
+        if event.get(flag):
+            slim[flag] = True
+    return slim
+
+
+def _emit(event: Dict[str, Any], slim: bool, on_event: Optional[Callable[[Dict[str, Any]], Any]]) -> Dict[str, Any]:
+    """Passa l'evento intero a on_event (es. il log eventi) e restituisce quello da tenere in memoria"""
+    if on_event is not None:
+        on_event(event)
+    return slim_event(event) if slim else event
+
+
+def iter_json_array(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """
+    Parser incrementale (solo stdlib) per un array JSON di oggetti.
+
+    Restituisce un elemento appena è completo. Dopo un tentativo fallito su
+    un elemento parziale riprova solo quando il buffer è raddoppiato, per
+    non riparsare di continuo un evento da diversi MB.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    started = False
+    finished = False
+    retry_at = 0
+
+    def parse_available(final: bool):
+        nonlocal buffer, position, started, finished, retry_at
+        while not finished:
+            while position < len(buffer) and buffer[position] in _WHITESPACE:
+                position += 1
+            if position >= len(buffer):
+                return
+            char = buffer[position]
+            if not started:
+                if char != "[":
+                    raise ValueError(f"Atteso un array JSON, trovato {char!r}")
+                started = True
+                position += 1
+                continue
+            if char == "]":
+                finished = True
+                return
+            if char == ",":
+                position += 1
+                continue
+            if not final and len(buffer) < retry_at:
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                if final:
+                    raise
+                retry_at = len(buffer) * 2
+                return
+            # Un numero/letterale che finisce a fine buffer potrebbe essere troncato
+            if end == len(buffer) and not final and not isinstance(item, (dict, list, str)):
+                retry_at = len(buffer) + 1
+                return
+            position = end
+            retry_at = 0
+            yield item
+
+    for chunk in chunks:
+        buffer = buffer[position:] + text_decoder.decode(chunk)
+        position = 0
+        yield from parse_available(final=False)
+    buffer = buffer[position:] + text_decoder.decode(b"", final=True)
+    position = 0
+    yield from parse_available(final=True)
+
+    if not started or not finished:
+        raise ValueError("Array JSON incompleto")
+
+
+def iter_run_events(response, slim: bool = True,
+                    on_event: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Itera gli eventi di una risposta /run ottenuta con `requests.post(..., stream=True)`.
+    `on_event` riceve ogni evento intero prima della riduzione.
+    """
+    if ijson is not None:
+        response.raw.decode_content = True
+        items = ijson.items(response.raw, "item", use_float=True)
+    elif orjson is not None:
+        items = orjson.loads(response.content)
+    else:
+        items = iter_json_array(response.iter_content(chunk_size=CHUNK_SIZE))
+
+    for event in items:
+        yield _emit(event, slim, on_event)
+
+
+class StreamError(RuntimeError):
+    """Errore riportato dal server dentro lo stream di /run_sse ({"error": ...})"""
+
+
+def iter_sse_events(response, slim: bool = True,
+                    on_event: Optional[Callable[[Dict[str, Any]], Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Itera gli eventi di una risposta /run_sse (text/event-stream) appena
+    arrivano, chunk parziali compresi (`"partial": true`). `on_event` come
+    in iter_run_events.
+    """
+    data_lines = []
+    # chunk_size=None: i dati arrivano appena il server li scrive, senza buffer fissi
+    # b"" finale: chiude l'ultimo evento anche senza riga vuota di terminazione
+    for line in itertools.chain(response.iter_lines(chunk_size=None), [b""]):
+        if line.startswith(b"data:"):
+            data_lines.append(line[5:].strip())
+            continue
+        if line or not data_lines:
+            continue  # commenti, campi event:/id:, righe vuote in più
+        event = loads(b"\n".join(data_lines))
+        data_lines = []
+        if "error" in event and len(event) == 1:
+            raise StreamError(event["error"])
+        yield _emit(event, slim, on_event)
+
+
+def decode_run_response(response, slim: bool = True,
+                        on_event: Optional[Callable[[Dict[str, Any]], Any]] = None) -> List[Dict[str, Any]]:
+    """Sostituto di `response.json()` per /run: lista di eventi (ridotti se slim=True)"""
+    return list(iter_run_events(response, slim=slim, on_event=on_event))
@@ -0,0 +1,236 @@
+"""
+Event store append-only per le risposte di /run.
+
+Ogni sessione ha due file sotto EVENT_LOG_DIR/<app>/<user_id>/:
+
+- <session_id>.log: record con prefisso di lunghezza (uint32 LE) + JSON compatto
+- <session_id>.idx: un entry a dimensione fissa per record (offset, batch, timestamp)
+
+Il reader mappa entrambi i file in memoria (mmap) e decodifica solo la
+pagina richiesta, quindi la pagina di debug può scorrere migliaia di
+eventi storici senza caricarli tutti.
+"""
+
+import json
+import mmap
+import os
+import struct
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+EVENT_LOG_DIR = Path(os.environ.get("ADK_EVENT_LOG_DIR", ".event_logs"))
+
+_LENGTH = struct.Struct("<I")
+# offset del record nel .log, numero del batch, timestamp di scrittura
+_INDEX_ENTRY = struct.Struct("<QId")
+
+
+def _session_paths(app_name: str, user_id: str, session_id: str, base_dir: Optional[Path] = None) -> Tuple[Path, Path]:
+    for part in (app_name, user_id, session_id):
+        # Ogni parte diventa un componente del path: niente separatori né ".."
+        if not part or part in (".", "..") or "/" in part or "\\" in part or "\0" in part:
+            raise ValueError(f"Componente non valido per il log eventi: {part!r}")
+    directory = (base_dir or EVENT_LOG_DIR) / app_name / user_id
+    return directory / f"{session_id}.log", directory / f"{session_id}.idx"
+
+
+class EventLogWriter:
+    """
+    Scrive batch di eventi in coda al log di una sessione.
+
+    Un solo writer per sessione: l'offset di ogni record viene letto dalla
+    dimensione del file prima della scrittura.
+    """
+
+    def __init__(self, app_name: str, user_id: str, session_id: str, base_dir: Optional[Path] = None):
+        self.log_path, self.index_path = _session_paths(app_name, user_id, session_id, base_dir)
+        self.log_path.parent.mkdir(parents=True, exist_ok=True)
+
+    def _next_batch(self) -> int:
+        size = self.index_path.stat().st_size if self.index_path.exists() else 0
+        count = size // _INDEX_ENTRY.size
+        if count == 0:
+            return 0
+        with open(self.index_path, "rb") as index_file:
+            index_file.seek((count - 1) * _INDEX_ENTRY.size)
+            _, last_batch, _ = _INDEX_ENTRY.unpack(index_file.read(_INDEX_ENTRY.size))
+        return last_batch + 1
+
+    def append_batch(self, events: List[Dict[str, Any]], batch: Optional[int] = None) -> int:
+        """
+        Accoda un batch di eventi e restituisce il numero del batch; con
+        `batch` gli eventi si aggiungono a un batch già aperto
+        """
+        if batch is None:
+            batch = self._next_batch()
+        timestamp = time.time()
+        records = bytearray()
+        entries = bytearray()
+
+        with open(self.log_path, "ab") as log_file:
+            offset = log_file.seek(0, os.SEEK_END)
+            for event in events:
+                payload = json.dumps(event, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+                entries += _INDEX_ENTRY.pack(offset + len(records), batch, timestamp)
+                records += _LENGTH.pack(len(payload))
+                records += payload
+            log_file.write(records)
+
+        # L'indice viene scritto dopo il log: un crash a metà lascia al più
+        # record non indicizzati, mai entry che puntano a dati mancanti
+        with open(self.index_path, "ab") as index_file:
+            index_file.write(entries)
+
+        return batch
+
+
+class EventLogReader:
+    """
+    Accesso in sola lettura, tramite mmap, al log di una sessione.
+
+    Usare come context manager per chiudere le mappe:
+
+        with EventLogReader(app, user_id, session_id) as reader:
+            events = reader.page(0, 50)
+    """
+
+    def __init__(self, app_name: str, user_id: str, session_id: str, base_dir: Optional[Path] = None):
+        self.log_path, self.index_path = _session_paths(app_name, user_id, session_id, base_dir)
+        self._files = []
+        self._log = self._map(self.log_path)
+        self._index = self._map(self.index_path)
+        index_size = len(self._index) if self._index is not None else 0
+        # Ignora un eventuale entry parziale in coda (scrittura interrotta)
+        self._count = index_size // _INDEX_ENTRY.size
+
+    def _map(self, path: Path) -> Optional[mmap.mmap]:
+        if not path.exists() or path.stat().st_size == 0:
+            return None
+        handle = open(path, "rb")
+        self._files.append(handle)
+        return mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __enter__(self) -> "EventLogReader":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for mapped in (self._log, self._index):
+            if mapped is not None:
+                mapped.close()
+        for handle in self._files:
+            handle.close()
+        self._log = self._index = None
+        self._files = []
+        self._count = 0
+
+    def entry(self, position: int) -> Tuple[int, int, float]:
+        """Restituisce (offset, batch, timestamp) dell'evento in posizione `position`"""
+        if not 0 <= position < self._count:
+            raise IndexError(position)
+        return _INDEX_ENTRY.unpack_from(self._index, position * _INDEX_ENTRY.size)
+
+    def event(self, position: int) -> Dict[str, Any]:
+        offset, _, _ = self.entry(position)
+        (length,) = _LENGTH.unpack_from(self._log, offset)
+        start = offset + _LENGTH.size
+        return json.loads(self._log[start:start + length])
+
+    def page(self, start: int, count: int) -> List[Dict[str, Any]]:
+        """
+        Decodifica gli eventi [start, start + count).
+
+        Ogni elemento contiene position, batch, timestamp ed event.
+        """
+        end = min(start + count, self._count)
+        page = []
+        for position in range(max(start, 0), end):
+            _, batch, timestamp = self.entry(position)
+            page.append({
+                "position": position,
+                "batch": batch,
+                "timestamp": timestamp,
+                "event": self.event(position),
+            })
+        return page
+
+    def iter_events(self) -> Iterator[Dict[str, Any]]:
+        for position in range(self._count):
+            yield self.event(position)
+
+
+def record_events(app_name: str, user_id: str, session_id: str, events: List[Dict[str, Any]]) -> bool:
+    """
+    Salva un batch di eventi nel log della sessione.
+
+    Il log è solo uno strumento di indagine: un errore di scrittura non deve
+    mai interrompere la chat, quindi restituisce False invece di sollevare.
+    """
+    if not session_id or not events:
+        return False
+    try:
+        EventLogWriter(app_name, user_id, session_id).append_batch(events)
+        return True
+    except OSError:
+        return False
+
+
+class EventRecorder:
+    """
+    Registra gli eventi interi di un turno uno alla volta, appena decodificati,
+    nello stesso batch. Si passa come `on_event` ai decoder di
+    adk_common.decoding: l'evento intero va su disco e in memoria resta solo
+    quello ridotto.
+
+    I chunk parziali dello streaming non vengono registrati (il testo completo
+    arriva nell'evento finale). Sulle connessioni live un evento turnComplete
+    chiude il batch: il turno successivo ne apre uno nuovo. Come record_events
+    non solleva mai: al primo errore di scrittura smette di registrare.
+
+    Uso:
+        events = client.decode_events(response, on_event=EventRecorder(app, user_id, session_id))
+    """
+
+    def __init__(self, app_name: str, user_id: str, session_id: str, base_dir: Optional[Path] = None):
+        self._location = (app_name, user_id, session_id, base_dir)
+        self._writer: Optional[EventLogWriter] = None
+        self._batch: Optional[int] = None
+        self.enabled = bool(session_id)
+        self.count = 0
+
+    def __call__(self, event: Dict[str, Any]) -> None:
+        if not self.enabled or event.get("partial"):
+            return
+        try:
+            if self._writer is None:
+                self._writer = EventLogWriter(*self._location)
+            self._batch = self._writer.append_batch([event], batch=self._batch)
+        except (OSError, ValueError):
+            self.enabled = False
+            return
+        self.count += 1
+        if event.get("turnComplete"):
+            self._batch = None
+
+
+def list_logged_apps(base_dir: Optional[Path] = None) -> List[str]:
+    """Elenca le app con almeno un log sotto EVENT_LOG_DIR, in ordine alfabetico"""
+    log_dir = base_dir or EVENT_LOG_DIR
+    if not log_dir.exists():
+        return []
+    return sorted(app_dir.name for app_dir in log_dir.iterdir() if app_dir.is_dir() and any(app_dir.glob("*/*.idx")))
+
+
+def list_logged_sessions(app_name: str, base_dir: Optional[Path] = None) -> List[Tuple[str, str]]:
+    """Elenca le coppie (user_id, session_id) con un log, dalla più recente"""
+    app_dir = (base_dir or EVENT_LOG_DIR) / app_name
+    if not app_dir.exists():
+        return []
+    logs = sorted(app_dir.glob("*/*.idx"), key=lambda path: path.stat().st_mtime, reverse=True)
+    return [(path.parent.name, path.stem) for path in logs]
@@ -0,0 +1,194 @@
+"""
+Parsing degli eventi ADK restituiti da /run (e, evento per evento, da /run_sse).
+
+Funzioni pure (nessuna dipendenza da Streamlit), condivise dalle app e
+dai benchmark in benchmarks/.
+"""
+
+import time
+from typing import Dict, Any, Tuple, Optional
+
+
+def detect_approval_structured(events) -> Tuple[bool, Optional[Dict[str, Any]]]:
+    """
+    🎯 RILEVAMENTO STRUTTURATO CORRETTO: Basato sulla struttura ADK reale
+    
+    Returns:
+        Tuple[bool, Optional[Dict]]: (approval_detected, approval_details)
+    """
+    approval_detected = False
+    approval_details = None
+    
+    for event in events:
+        if "content" in event and "parts" in event["content"]:
+            for part in event["content"]["parts"]:
+                
+                # ✅ METODO 1: functionCall (quando l'agente chiama il tool)
+                if "functionCall" in part:  # ← camelCase!
+                    function_call = part["functionCall"]
+                    # Controlliamo se ha i parametri dell'approval
+                    if "args" in function_call:
+                        args = function_call["args"]
+                        # Se ha action/details, probabilmente è approval
+                        if "action" in args or "details" in args:
+                            approval_detected = True
+                            approval_details = args
+                            break
+                
+                # ✅ METODO 2: functionResponse (risposta del tool - più preciso)
+                if "functionResponse" in part:  # ← camelCase!
+                    function_response = part["functionResponse"]
+                    if function_response.get("name") == "request_human_approval":
+                        approval_detected = True
+                        # I dettagli sono nella response
+                        approval_details = function_response.get("response", {})
+                        break
+        
+        # Se abbiamo trovato approval, interrompi
+        if approval_detected:
+            break
+    
+    return approval_detected, approval_details
+
+def approval_from_event(event) -> Optional[Dict[str, Any]]:
+    """
+    Dettagli dell'approval se questo singolo evento lo contiene, per chi
+    consuma il turno in streaming: functionCall di un tool long-running
+    (longRunningToolIds) o di request_human_approval, altrimenti il
+    rilevamento strutturato. None se l'evento non riguarda un approval.
+    """
+    long_running_ids = set(event.get("longRunningToolIds") or ())
+    for part in event.get("content", {}).get("parts", []):
+        function_call = part.get("functionCall")
+        if function_call and (function_call.get("id") in long_running_ids
+                              or function_call.get("name") == "request_human_approval"):
+            return function_call.get("args") or {}
+    approval_detected, approval_details = detect_approval_structured([event])
+    return (approval_details or {}) if approval_detected else None
+
+def extract_assistant_message(events) -> str:
+    """
+    Estrae il messaggio dell'assistente dagli eventi
+    """
+    assistant_message = ""
+    
+    for event in events:
+        # Cerca messaggi del modello
+        if (event.get("content", {}).get("role") == "model" and 
+            "parts" in event.get("content", {})):
+            parts = event["content"]["parts"]
+            for part in parts:
+                if "text" in part:
+                    assistant_message = part["text"]
+                    break
+            if assistant_message:
+                break
+    
+    return assistant_message
+
+def create_rich_approval_message(approval_details: Optional[Dict[str, Any]]) -> str:
+    """
+    Crea un messaggio di approval ricco di dettagli REALI
+    """
+    if not approval_details:
+        return "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
+    
+    # Estrai dettagli reali dall'ADK
+    action = approval_details.get("action", "Azione sconosciuta")
+    details = approval_details.get("details", "Nessun dettaglio disponibile")
+    risk_level = approval_details.get("risk_level", "medium")
+    status = approval_details.get("status", "pending")
+    expires_at = approval_details.get("expires_at")
+    
+    # Normalizza risk_level
+    risk_level_upper = risk_level.upper() if risk_level else "MEDIUM"
+    
+    # Emoji per livello di rischio
+    risk_emoji = {
+        "LOW": "🟢",
+        "MEDIUM": "🟡", 
+        "HIGH": "🔴"
+    }
+    
+    # Tronca testi troppo lunghi per UI
+    action_display = action[:50] + "..." if len(action) > 50 else action
+    details_display = details[:100] + "..." if len(details) > 100 else details
+    
+    # Scadenza (vedi adk_common.approvals), se presente
+    expiry_line = ""
+    if isinstance(expires_at, (int, float)):
+        expiry_line = f"\n⌛ **Scade alle:** {time.strftime('%H:%M:%S', time.localtime(expires_at))}"
+    
+    message = f"""🚨 **RICHIESTA APPROVAZIONE**
+
+{risk_emoji.get(risk_level_upper, '⚠️')} **Livello Rischio:** {risk_level_upper}
+🎯 **Azione:** {action_display}
+📋 **Dettagli:** {details_display}
+📊 **Status:** {status}{expiry_line}
+
+**Usa i pulsanti sotto per rispondere:**
+✅ **SI** - Approva l'azione
+❌ **NO** - Rifiuta l'azione  
+ℹ️ **DETTAGLI** - Richiedi più informazioni"""
+    
+    return message
+
+def debug_approval_detection(events):
+    """
+    🔍 DEBUG: Analizza dove appare esattamente request_human_approval
+    """
+    approval_found_locations = []
+    
+    for i, event in enumerate(events):
+        event_str = str(event)
+        
+        # Ricerca grezza (che funziona)
+        if "request_human_approval" in event_str.lower():
+            approval_found_locations.append({
+                "event_index": i,
+                "method": "string_search",
+                "event_keys": list(event.keys()) if isinstance(event, dict) else "not_dict",
+                "event_preview": str(event)[:200] + "..." if len(str(event)) > 200 else str(event)
+            })
+        
+        # Analisi strutturata per debug
+        if isinstance(event, dict):
+            # Check content.parts
+            if "content" in event and "parts" in event.get("content", {}):
+                for part in event["content"]["parts"]:
+                    if "function_call" in part:
+                        approval_found_locations.append({
+                            "event_index": i,
+                            "method": "content.parts.function_call",
+                            "function_name": part["function_call"].get("name"),
+                            "event_preview": str(part)[:200]
+                        })
+            
+            # Check actions
+            if "actions" in event:
+                approval_found_locations.append({
+                    "event_index": i,
+                    "method": "actions",
+                    "actions_content": str(event["actions"])[:200],
+                    "event_preview": str(event)[:200]
+                })
+            
+            # Check tool_use
+            if "tool_use" in event:
+                approval_found_locations.append({
+                    "event_index": i,
+                    "method": "tool_use",
+                    "tool_content": str(event["tool_use"])[:200],
+                    "event_preview": str(event)[:200]
+                })
+            
+            # Check long_running_tool_ids
+            if "long_running_tool_ids" in event:
+                approval_found_locations.append({
+                    "event_index": i,
+                    "method": "long_running_tool_ids",
+                    "tool_ids": event["long_running_tool_ids"],
+                    "event_preview": str(event)[:200]
+                })
+    
+    return approval_found_locations
@@ -0,0 +1,379 @@
+"""
+Modello finto e deterministico per test e benchmark senza rete.
+
+FakeLlm implementa l'interfaccia BaseLlm di ADK e risponde con regole fisse,
+così Runner, sessioni e tool si possono misurare anche su macchine CI senza
+accesso a Gemini. È registrato nel LLMRegistry per i nomi "fake" e
+"fake-...": gli agenti lo scelgono da configurazione
+(SIMPLE_AGENT_MODEL / APPROVAL_AGENT_MODEL, vedi resolve_model).
+
+Risposte, nell'ordine:
+
+1. ultimo contenuto = functionResponse -> testo che riassume il risultato
+2. regole dello script (ADK_FAKE_LLM_SCRIPT, file JSON) che corrispondono
+   all'ultimo testo dell'utente: testo fisso o functionCall
+3. "si"/"no" dopo una richiesta di approval -> conferma o annullamento
+4. due numeri e un'operazione, se l'agente ha calcola_operazione
+   -> functionCall a calcola_operazione
+5. verbi "rischiosi" (elimina, trasferisci, pubblica, ...), se l'agente ha
+   request_human_approval -> functionCall con il livello di rischio
+6. altrimenti ADK_FAKE_LLM_TEXT (default: eco del prompt)
+
+Formato dello script:
+
+    [{"match": "(?i)backup", "text": "Backup completato"},
+     {"match": "(?i)spegni", "call": {"name": "request_human_approval",
+                                       "args": {"action": "Spegnimento", "details": "...", "risk_level": "high"}}}]
+
+Latenza e streaming:
+- ADK_FAKE_LLM_LATENCY: secondi prima della prima risposta (default 0)
+- ADK_FAKE_LLM_CHUNK_WORDS: parole per chunk parziale in streaming (default 4)
+- ADK_FAKE_LLM_CHUNK_DELAY: secondi tra un chunk e l'altro (default 0)
+
+I token in usage_metadata sono contati come parole (istruzioni di sistema
+e dichiarazioni dei tool comprese): abbastanza per far funzionare budget e
+ledger (adk_common.usage) nei benchmark.
+
+Context caching (adk_common.prompt_cache): create_cached_content tiene il
+prefisso in una cache locale con TTL e le richieste con cached_content
+riportano quei token in cached_content_token_count, come Gemini. Un nome
+sconosciuto o scaduto fa fallire la richiesta come l'API vera.
+ADK_FAKE_LLM_CACHE=0 simula un backend senza caching.
+
+Live API (runner.run_live, /run_live, adk_common.live): connect() apre una
+FakeLlmConnection che tiene la storia della conversazione e risponde a ogni
+contenuto dell'utente (o functionResponse) con le stesse regole, chunk
+parziali compresi; la risposta finale di testo chiude il turno
+(turn_complete). Solo testo: send_realtime (audio/video) non è supportato.
+"""
+
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import re
+import time
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple, Union
+
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+from adk_common.approvals import APPROVAL_DECISIONS, APPROVAL_TOOL_NAME
+
+FAKE_LLM_LATENCY = float(os.environ.get("ADK_FAKE_LLM_LATENCY", "0"))
+FAKE_LLM_CHUNK_WORDS = int(os.environ.get("ADK_FAKE_LLM_CHUNK_WORDS", "4"))
+FAKE_LLM_CHUNK_DELAY = float(os.environ.get("ADK_FAKE_LLM_CHUNK_DELAY", "0"))
+FAKE_LLM_TEXT = os.environ.get("ADK_FAKE_LLM_TEXT", "Risposta simulata a: {prompt}")
+FAKE_LLM_SCRIPT = os.environ.get("ADK_FAKE_LLM_SCRIPT", "")
+FAKE_LLM_CACHE = os.environ.get("ADK_FAKE_LLM_CACHE", "1") == "1"
+
+CALCULATOR_TOOL_NAME = "calcola_operazione"
+
+_OPERATIONS = (
+    (re.compile(r"\+|\bpiù\b|\bpiu\b|\bplus\b|\bsomma"), "addizione"),
+    (re.compile(r"(?<=\d)\s*-\s*(?=\d)|\bmeno\b|\bminus\b|\bsottra"), "sottrazione"),
+    (re.compile(r"(?<=\d)\s*[x×*]\s*(?=\d)|\bper\b|\btimes\b|\bmoltiplic"), "moltiplicazione"),
+    (re.compile(r"(?<=\d)\s*[/:÷]\s*(?=\d)|\bdiviso\b|\bdivided\b|\bdivid"), "divisione"),
+)
+_NUMBER = re.compile(r"-?\d+(?:[.,]\d+)?")
+_WORD = re.compile(r"\w+")
+
+# Contenuti in cache: nome -> (token del prefisso, scadenza in time.monotonic)
+_cached_contents: Dict[str, Tuple[int, float]] = {}
+_cache_ids = itertools.count(1)
+
+
+def _prune_cached_contents(now: float) -> None:
+    """Toglie i contenuti scaduti: il registro è globale e vive quanto il processo"""
+    for name in [name for name, (_, expires_at) in _cached_contents.items() if now >= expires_at]:
+        del _cached_contents[name]
+
+
+# Verbo -> livello di rischio, come da istruzioni di agent_approval
+_RISKY_ACTIONS = (
+    (re.compile(r"\b(elimin|cancell|trasfer|pagament|paga|bonific|modific)\w*", re.IGNORECASE), "high"),
+    (re.compile(r"\b(invia|manda|pubblic|installa|scarica|crea\w* (un )?account|registra)\w*", re.IGNORECASE), "medium"),
+)
+
+
+def _last_user_text(llm_request: LlmRequest) -> str:
+    for content in reversed(llm_request.contents):
+        if content.role == "user" and content.parts:
+            texts = [part.text for part in content.parts if part.text]
+            if texts:
+                return " ".join(texts).strip()
+    return ""
+
+
+def _last_function_response(llm_request: LlmRequest) -> Optional[types.FunctionResponse]:
+    if not llm_request.contents:
+        return None
+    for part in llm_request.contents[-1].parts or []:
+        if part.function_response:
+            return part.function_response
+    return None
+
+
+def _has_pending_approval(llm_request: LlmRequest) -> bool:
+    """C'è una richiesta di approval ancora in attesa prima dell'ultimo messaggio?"""
+    for content in reversed(llm_request.contents[:-1]):
+        for part in content.parts or []:
+            if part.function_response and part.function_response.name == APPROVAL_TOOL_NAME:
+                return (part.function_response.response or {}).get("status") == "pending_approval"
+    return False
+
+
+def _number(text: str) -> Union[int, float]:
+    value = float(text.replace(",", "."))
+    return int(value) if value.is_integer() else value
+
+
+def parse_operation(text: str) -> Optional[Dict[str, Any]]:
+    """Argomenti per calcola_operazione da un testo con due numeri e un'operazione"""
+    numbers = _NUMBER.findall(text)
+    if len(numbers) < 2:
+        return None
+    for pattern, operation in _OPERATIONS:
+        if pattern.search(text.lower()):
+            return {"operazione": operation, "numero1": _number(numbers[0]), "numero2": _number(numbers[1])}
+    return None
+
+
+def classify_risk(text: str) -> Optional[str]:
+    for pattern, risk_level in _RISKY_ACTIONS:
+        if pattern.search(text):
+            return risk_level
+    return None
+
+
+def _prefix_tokens(llm_request: LlmRequest) -> int:
+    """Token (parole) di istruzioni di sistema e dichiarazioni dei tool"""
+    config = llm_request.config
+    if config is None:
+        return 0
+    tokens = len(str(config.system_instruction or "").split())
+    for tool in config.tools or []:
+        tokens += len(_WORD.findall(tool.model_dump_json(exclude_none=True)))
+    return tokens
+
+
+def _load_script(path: str) -> List[Dict[str, Any]]:
+    if not path:
+        return []
+    with open(path, encoding="utf-8") as script_file:
+        rules = json.load(script_file)
+    for rule in rules:
+        rule["pattern"] = re.compile(rule.get("match", ".*"))
+    return rules
+
+
+class FakeLlm(BaseLlm):
+    """
+    Modello scriptato: stesso input, stessa risposta, nessuna chiamata di rete.
+
+    Uso:
+        Agent(model=FakeLlm(), ...)        # oppure
+        Agent(model="fake", ...)            # dopo aver importato adk_common.fake_llm
+    """
+
+    model: str = "fake"
+    text: str = FAKE_LLM_TEXT
+    latency: float = FAKE_LLM_LATENCY
+    chunk_words: int = FAKE_LLM_CHUNK_WORDS
+    chunk_delay: float = FAKE_LLM_CHUNK_DELAY
+    script: List[Dict[str, Any]] = []
+    cache: bool = FAKE_LLM_CACHE
+
+    def __init__(self, **data: Any):
+        super().__init__(**data)
+        if not self.script and FAKE_LLM_SCRIPT:
+            self.script = _load_script(FAKE_LLM_SCRIPT)
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"fake", r"fake-.*"]
+
+    def respond(self, llm_request: LlmRequest) -> Union[str, types.FunctionCall]:
+        """Risposta per la richiesta: testo oppure una functionCall"""
+        function_response = _last_function_response(llm_request)
+        if function_response is not None:
+            return self._describe_response(function_response)
+
+        prompt = _last_user_text(llm_request)
+        tools = llm_request.tools_dict
+
+        for rule in self.script:
+            if rule["pattern"].search(prompt):
+                if "call" in rule:
+                    return types.FunctionCall(name=rule["call"]["name"], args=dict(rule["call"].get("args", {})))
+                return rule.get("text", "").format(prompt=prompt)
+
+        if prompt.lower() in APPROVAL_DECISIONS and _has_pending_approval(llm_request):
+            return ("✅ Approvato: procedo con l'azione richiesta." if prompt.lower() == "si"
+                    else "❌ Azione annullata come richiesto.")
+
+        if CALCULATOR_TOOL_NAME in tools:
+            args = parse_operation(prompt)
+            if args:
+                return types.FunctionCall(name=CALCULATOR_TOOL_NAME, args=args)
+
+        if APPROVAL_TOOL_NAME in tools:
+            risk_level = classify_risk(prompt)
+            if risk_level:
+                return types.FunctionCall(name=APPROVAL_TOOL_NAME, args={
+                    "action": prompt[:80],
+                    "details": f"Eseguirei la richiesta: {prompt}",
+                    "risk_level": risk_level,
+                })
+
+        return self.text.format(prompt=prompt)
+
+    @staticmethod
+    def _describe_response(function_response: types.FunctionResponse) -> str:
+        response = function_response.response or {}
+        if function_response.name == CALCULATOR_TOOL_NAME:
+            return response.get("spiegazione") or response.get("error_message") or str(response)
+        if function_response.name == APPROVAL_TOOL_NAME:
+            if response.get("status") == "pending_approval":
+                return "Ho richiesto l'approvazione. Rispondi con si, no o dettagli."
+            return response.get("message") or f"Richiesta chiusa ({response.get('status')})."
+        return f"Risultato di {function_response.name}: {json.dumps(response, ensure_ascii=False, default=str)}"
+
+    async def create_cached_content(self, llm_request: LlmRequest, ttl: float) -> str:
+        """Mette in cache istruzioni e tool della richiesta (vedi adk_common.prompt_cache)"""
+        if not self.cache:
+            raise NotImplementedError("FakeLlm configurato senza context caching (ADK_FAKE_LLM_CACHE=0)")
+        now = time.monotonic()
+        _prune_cached_contents(now)
+        name = f"cachedContents/fake-{next(_cache_ids)}"
+        _cached_contents[name] = (_prefix_tokens(llm_request), now + ttl)
+        return name
+
+    @staticmethod
+    def _cached_tokens(llm_request: LlmRequest) -> int:
+        name = llm_request.config.cached_content if llm_request.config else None
+        if not name:
+            return 0
+        _prune_cached_contents(time.monotonic())
+        if name not in _cached_contents:
+            raise ValueError(f"404 NOT_FOUND: CachedContent {name} inesistente o scaduto")
+        return _cached_contents[name][0]
+
+    @staticmethod
+    def _usage(llm_request: LlmRequest, output: str, cached_tokens: int) -> types.GenerateContentResponseUsageMetadata:
+        # Con cached_content istruzioni e tool non sono nella config: li conta la cache
+        prompt_tokens = _prefix_tokens(llm_request) + cached_tokens + sum(
+            len(part.text.split())
+            for content in llm_request.contents for part in content.parts or [] if part.text
+        )
+        output_tokens = len(output.split())
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached_tokens or None,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        cached_tokens = self._cached_tokens(llm_request)
+        answer = self.respond(llm_request)
+        if isinstance(answer, types.FunctionCall):
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(function_call=answer)]),
+                usage_metadata=self._usage(llm_request, json.dumps(answer.args or {}), cached_tokens),
+            )
+            return
+
+        if stream and self.chunk_words > 0:
+            words = answer.split(" ")
+            for start in range(0, len(words), self.chunk_words):
+                chunk = " ".join(words[start:start + self.chunk_words])
+                if start + self.chunk_words < len(words):
+                    chunk += " "
+                yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=chunk)]), partial=True)
+                if self.chunk_delay:
+                    await asyncio.sleep(self.chunk_delay)
+
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text=answer)]),
+            usage_metadata=self._usage(llm_request, answer, cached_tokens),
+            turn_complete=True,
+        )
+
+    @contextlib.asynccontextmanager
+    async def connect(self, llm_request: LlmRequest) -> AsyncGenerator[BaseLlmConnection, None]:
+        connection = FakeLlmConnection(self, llm_request)
+        try:
+            yield connection
+        finally:
+            await connection.close()
+
+
+class FakeLlmConnection(BaseLlmConnection):
+    """Connessione live di FakeLlm: le risposte finiscono in una coda letta da receive()"""
+
+    def __init__(self, llm: FakeLlm, llm_request: LlmRequest):
+        self._llm = llm
+        self._llm_request = llm_request
+        self._history: List[types.Content] = []
+        self._responses: "asyncio.Queue[Optional[LlmResponse]]" = asyncio.Queue()
+        self._closed = False
+
+    async def _answer(self) -> None:
+        llm_request = self._llm_request.model_copy(update={"contents": list(self._history)})
+        async for llm_response in self._llm.generate_content_async(llm_request, stream=True):
+            if not llm_response.partial and llm_response.content:
+                # Come la Live API: la sessione ricorda anche le risposte del modello
+                self._history.append(llm_response.content)
+            self._responses.put_nowait(llm_response)
+
+    async def send_history(self, history: List[types.Content]) -> None:
+        self._history = list(history)
+        if self._history and self._history[-1].role == "user":
+            await self._answer()
+
+    async def send_content(self, content: types.Content) -> None:
+        self._history.append(content)
+        await self._answer()
+
+    async def send_realtime(self, blob: types.Blob) -> None:
+        raise NotImplementedError("FakeLlm live supporta solo testo")
+
+    async def receive(self) -> AsyncGenerator[LlmResponse, None]:
+        # ConnectionClosedOK è il segnale di fine che il flow live di ADK si aspetta
+        from websockets.exceptions import ConnectionClosedOK
+
+        while not self._closed:
+            llm_response = await self._responses.get()
+            if llm_response is None:
+                break
+            yield llm_response
+        raise ConnectionClosedOK(None, None)
+
+    async def close(self) -> None:
+        if not self._closed:
+            self._closed = True
+            self._responses.put_nowait(None)
+
+
+LLMRegistry.register(FakeLlm)
+
+
+def resolve_model(env_var: str, default: str = "gemini-2.0-flash") -> Union[str, BaseLlm]:
+    """
+    Modello di un agente da configurazione: il nome in `env_var` (default
+    `default`). Con "fake"/"fake-..." restituisce un FakeLlm, altrimenti il
+    nome, che ADK risolve come sempre.
+    """
+    name = os.environ.get(env_var, default)
+    if re.fullmatch(r"fake(-.*)?", name):
+        return FakeLlm(model=name)
+    return name
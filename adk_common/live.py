@@ -0,0 +1,220 @@
+"""
+Modalità live: una connessione websocket persistente per sessione ADK.
+
+Con /run ogni turno è una richiesta HTTP separata e il server non può
+mandare nulla fuori dalle risposte. Con /run_live (runner.run_live lato
+server) la connessione resta aperta: i turni e le risposte agli approval
+viaggiano sullo stesso websocket e gli eventi arrivano appena prodotti.
+
+Protocollo, lo stesso di google.adk.cli.fast_api e di adk_server:
+
+- client -> server: LiveRequest JSON, {"content": {...}} oppure {"close": true}
+- server -> client: un evento ADK JSON per messaggio; la fine del turno è
+  un evento con "turnComplete": true
+
+Serve un modello che supporti la Live API (es. gemini-2.0-flash-live-001)
+oppure FakeLlm (adk_common.fake_llm) per provare il percorso senza rete.
+Timeout di un turno: ADK_LIVE_TURN_TIMEOUT secondi (default 120).
+"""
+
+import os
+import queue
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence
+from urllib.parse import urlencode
+
+from adk_common.decoding import dumps, loads, slim_event
+from adk_common.tracing import client_span
+
+LIVE_TURN_TIMEOUT = float(os.environ.get("ADK_LIVE_TURN_TIMEOUT", "120"))
+LIVE_CONNECT_TIMEOUT = float(os.environ.get("ADK_CONNECT_TIMEOUT", "2"))
+
+# Messo in coda dal reader quando il websocket si chiude
+_CLOSED = object()
+
+
+def _read_loop(live_ref: "weakref.ref[LiveSession]", connection, events: "queue.Queue[Any]", slim: bool,
+               on_event: Optional[Callable[[Dict[str, Any]], Any]]) -> None:
+    """
+    Thread reader: tiene solo un riferimento debole alla LiveSession, così
+    quando Streamlit scarta la sessione (e il suo session_state) la
+    LiveSession può essere raccolta e il suo finalizer chiude il websocket
+    """
+    from websockets.exceptions import ConnectionClosed
+
+    close_reason = None
+    try:
+        for message in connection:
+            event = loads(message)
+            if on_event is not None:
+                on_event(event)
+            events.put(slim_event(event) if slim else event)
+    except ConnectionClosed as closed:
+        close_reason = closed.rcvd.reason if closed.rcvd else None
+    finally:
+        live = live_ref()
+        if live is not None:
+            live.close_reason = live.close_reason or close_reason or "connessione chiusa"
+        events.put(_CLOSED)
+
+
+class LiveUnavailable(ConnectionError):
+    """Connessione live non disponibile (server giù, sessione inesistente, chiusura)"""
+
+
+class LiveSession:
+    """
+    Connessione /run_live per una sessione ADK.
+
+    Un thread legge gli eventi in background e li mette in coda, così anche
+    gli eventi arrivati tra un turno e l'altro (iniziativa dell'agente) non
+    vanno persi: si leggono con `drain()`.
+
+    Uso:
+        live = LiveSession(API_BASE_URL, APP_NAME, user_id, session_id)
+        live.connect()
+        live.send_text("Ciao")
+        events = live.collect_turn()
+    """
+
+    def __init__(self, base_url: str, app_name: str, user_id: str, session_id: str,
+                 modalities: Sequence[str] = ("TEXT",), slim: bool = True,
+                 on_event: Optional[Callable[[Dict[str, Any]], Any]] = None):
+        self.base_url = base_url.rstrip("/")
+        self.app_name = app_name
+        self.user_id = user_id
+        self.session_id = session_id
+        self.modalities = list(modalities)
+        self.slim = slim
+        # Chiamata dal thread reader con ogni evento intero (es. EventRecorder)
+        self.on_event = on_event
+        self.close_reason: Optional[str] = None
+        self._connection = None
+        self._events: "queue.Queue[Any]" = queue.Queue()
+        self._reader: Optional[threading.Thread] = None
+        self._finalizer: Optional[weakref.finalize] = None
+
+    @property
+    def url(self) -> str:
+        scheme, _, rest = self.base_url.partition("://")
+        query = urlencode({
+            "app_name": self.app_name,
+            "user_id": self.user_id,
+            "session_id": self.session_id,
+            "modalities": self.modalities,
+        }, doseq=True)
+        return f"{'wss' if scheme == 'https' else 'ws'}://{rest}/run_live?{query}"
+
+    @property
+    def connected(self) -> bool:
+        return self._connection is not None and self.close_reason is None
+
+    def connect(self) -> "LiveSession":
+        # websockets solo quando si apre davvero una sessione live: le app
+        # che non usano la modalità live non ne pagano l'import
+        from websockets.exceptions import WebSocketException
+        from websockets.sync.client import connect
+
+        headers = {}
+        try:
+            # La connessione live appartiene alla trace dell'azione che l'ha aperta
+            with client_span("WEBSOCKET", "/run_live", headers):
+                self._connection = connect(self.url, open_timeout=LIVE_CONNECT_TIMEOUT, max_size=None,
+                                           additional_headers=headers)
+        except (OSError, WebSocketException) as error:
+            raise LiveUnavailable(f"Connessione live non disponibile: {error}") from error
+        # Fine della sessione Streamlit senza close(): il websocket si chiude
+        # quando la LiveSession viene raccolta, e con lui il thread reader
+        self._finalizer = weakref.finalize(self, self._connection.close)
+        self._reader = threading.Thread(
+            target=_read_loop, args=(weakref.ref(self), self._connection, self._events, self.slim, self.on_event),
+            name=f"live-{self.session_id}", daemon=True,
+        )
+        self._reader.start()
+        return self
+
+    def _send(self, request: Dict[str, Any]) -> None:
+        if not self.connected:
+            raise LiveUnavailable(f"Sessione live chiusa: {self.close_reason or 'non connessa'}")
+        from websockets.exceptions import WebSocketException
+
+        try:
+            self._connection.send(dumps(request).decode("utf-8"))
+        except (OSError, WebSocketException) as error:
+            raise LiveUnavailable(f"Invio live fallito: {error}") from error
+
+    def send_text(self, text: str) -> None:
+        """Nuovo turno dell'utente (messaggio o decisione di approval)"""
+        self._send({"content": {"role": "user", "parts": [{"text": text}]}})
+
+    def iter_turn(self, timeout: float = LIVE_TURN_TIMEOUT) -> Iterator[Dict[str, Any]]:
+        """Eventi del turno in corso, appena arrivano, fino a turnComplete"""
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"Nessuna fine turno entro {timeout:.0f}s")
+            try:
+                event = self._events.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if event is _CLOSED:
+                raise LiveUnavailable(f"Sessione live chiusa: {self.close_reason}")
+            yield event
+            if event.get("turnComplete"):
+                return
+
+    def collect_turn(self, timeout: float = LIVE_TURN_TIMEOUT) -> List[Dict[str, Any]]:
+        """Eventi finali del turno (senza i chunk di testo parziali), come la lista di /run"""
+        return [event for event in self.iter_turn(timeout) if not event.get("partial")]
+
+    def drain(self) -> List[Dict[str, Any]]:
+        """Eventi già arrivati fuori da un turno, senza attendere"""
+        events = []
+        while True:
+            try:
+                event = self._events.get_nowait()
+            except queue.Empty:
+                return events
+            if event is not _CLOSED:
+                events.append(event)
+
+    def close(self) -> None:
+        if self.connected:
+            try:
+                self._send({"close": True})
+            except LiveUnavailable:
+                pass
+        if self._finalizer is not None:
+            self._finalizer()
+        if self._reader is not None and self._reader is not threading.current_thread():
+            self._reader.join(timeout=LIVE_CONNECT_TIMEOUT)
+
+
+def live_session_for(session_state, base_url: str, app_name: str,
+                     on_event: Optional[Callable[[Dict[str, Any]], Any]] = None) -> LiveSession:
+    """
+    LiveSession della connessione Streamlit corrente (in session_state.live_session),
+    riaperta se chiusa o se la sessione ADK è cambiata. `on_event` riceve gli
+    eventi interi (es. EventRecorder per il log eventi), in coda restano quelli ridotti.
+    """
+    live = session_state.get("live_session")
+    if live is not None and live.connected and live.session_id == session_state.session_id:
+        return live
+    if live is not None:
+        live.close()
+    session_state.live_session = None
+    live = LiveSession(base_url, app_name, session_state.user_id, session_state.session_id,
+                       on_event=on_event).connect()
+    session_state.live_session = live
+    return live
+
+
+def close_live_session(session_state) -> None:
+    """Chiude la connessione live della sessione Streamlit, se c'è (es. live mode disattivata)"""
+    live = session_state.get("live_session")
+    session_state.live_session = None
+    if live is not None:
+        live.close()
@@ -0,0 +1,45 @@
+"""
+Rappresentazione compatta dei messaggi della chat.
+
+Ogni messaggio era un dict {"role": ..., "content": ...}, con il ruolo
+ripetuto come stringa e i messaggi di approval che contenevano tutto il
+markdown di create_rich_approval_message(). ChatMessage usa __slots__,
+un Role enum (un solo oggetto per ruolo) e per gli approval tiene solo il
+riferimento ai dettagli: il markdown viene generato al momento del render.
+"""
+
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Optional, Tuple
+
+from adk_common.events import create_rich_approval_message
+
+
+class Role(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+    SYSTEM = "system"
+    DEBUG = "debug"
+
+
+@dataclass(slots=True)
+class ChatMessage:
+    role: Role
+    content: str = ""
+    # Dettagli dell'approval (stesso dict di st.session_state.approval_details)
+    approval: Optional[Dict[str, Any]] = None
+
+    def render(self) -> str:
+        """Testo da mostrare nella chat"""
+        if self.approval is not None:
+            return create_rich_approval_message(self.approval)
+        return self.content
+
+    def to_row(self) -> Tuple[str, str, Optional[Dict[str, Any]]]:
+        """Serializzazione compatta: (role, content, approval)"""
+        return self.role.value, self.content, self.approval
+
+    @classmethod
+    def from_row(cls, row) -> "ChatMessage":
+        role, content, approval = row
+        return cls(Role(role), content, approval)
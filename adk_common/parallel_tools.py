@@ -0,0 +1,172 @@
+"""
+Esecuzione concorrente delle chiamate parallele a function tool sincroni.
+
+Quando il modello emette più functionCall nella stessa risposta (es.
+"calcola questi cinque totali") ADK le esegue una dopo l'altra. Questo
+modulo si aggancia come `before_tool_callback` dell'agente:
+
+1. alla prima chiamata di un evento legge tutte le functionCall dello
+   stesso evento e sottomette quelle idonee a un thread pool limitato
+2. ogni callback attende (senza bloccare l'event loop) il proprio risultato
+   e lo restituisce ad ADK, che salta l'esecuzione inline del tool
+
+ADK costruisce le risposte nell'ordine delle chiamate, quindi l'ordine
+dei risultati è preservato. Un'eccezione resta confinata alla propria
+chiamata e diventa una risposta {"status": "error", ...}.
+
+Sono esclusi: tool long-running (es. request_human_approval), funzioni
+async e funzioni che ricevono tool_context (lo stato di sessione non è
+thread-safe) e tool CPU-bound (vedi adk_common.process_tools). Con una
+sola chiamata idonea si resta sul percorso inline.
+
+Uso:
+    parallel_tools = ParallelToolExecutor([calcola_operazione])
+    root_agent = Agent(..., tools=[calcola_operazione],
+                       before_tool_callback=parallel_tools.before_tool_callback)
+"""
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from importlib.metadata import version
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
+
+from google.genai import types
+
+if TYPE_CHECKING:
+    from google.adk.events import Event
+
+logger = logging.getLogger(__name__)
+
+MAX_TOOL_THREADS = int(os.environ.get("ADK_TOOL_THREADS", "8"))
+
+# ADK 1.x non espone gli eventi della sessione a tool e callback: si passa
+# dal contesto d'invocazione privato, solo sulle versioni verificate.
+# Versione dai metadati: i worker di process_tools importano questo modulo
+# e non devono caricare google.adk
+ADK_VERSION = version("google-adk")
+_SESSION_EVENTS_VERSIONS = ("1.",)
+
+
+def _is_parallelizable(func: Callable) -> bool:
+    # I tool CPU-bound vanno nel process pool, non nei thread (import locale: process_tools importa questo modulo)
+    from adk_common.process_tools import is_cpu_bound
+    return (not inspect.iscoroutinefunction(func) and "tool_context" not in inspect.signature(func).parameters
+            and not is_cpu_bound(func))
+
+
+def call_tool_function(func: Callable, args: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Esegue un function tool fuori dal flusso di ADK: parametri mancanti ed
+    eccezioni diventano risposte {"status": "error", ...}
+    """
+    name = func.__name__
+    parameters = inspect.signature(func).parameters
+    missing = [
+        param.name for param in parameters.values()
+        if param.default is inspect.Parameter.empty and param.name not in args
+    ]
+    if missing:
+        return {"status": "error", "error_message": f"Parametri mancanti per {name}: {', '.join(missing)}"}
+    try:
+        result = func(**{key: value for key, value in args.items() if key in parameters})
+    except Exception as e:
+        return {"status": "error", "error_message": f"Errore in {name}: {e}"}
+    # ADK considera "nessuna risposta" un valore falsy e rieseguirebbe il tool
+    return result if isinstance(result, dict) and result else {"result": result}
+
+
+def session_events(context) -> List["Event"]:
+    """
+    Eventi della sessione corrente visti da un ToolContext o CallbackContext.
+
+    Unico accesso all'attributo privato `_invocation_context`: con una
+    versione di ADK non verificata, o se l'attributo manca, restituisce []
+    e i chiamanti ripiegano sul percorso normale (tool inline, modello).
+    """
+    events = None
+    if ADK_VERSION.startswith(_SESSION_EVENTS_VERSIONS):
+        session = getattr(getattr(context, "_invocation_context", None), "session", None)
+        events = getattr(session, "events", None)
+    if not isinstance(events, list):
+        logger.warning("Eventi di sessione non accessibili con google-adk %s", ADK_VERSION)
+        return []
+    return events
+
+
+def sibling_function_calls(tool_context) -> Tuple[List[types.FunctionCall], Set[str]]:
+    """
+    FunctionCall dell'evento che contiene la chiamata corrente (lei compresa)
+    e gli id delle chiamate long-running di quell'evento
+    """
+    call_id = tool_context.function_call_id
+    for event in reversed(session_events(tool_context)):
+        function_calls = event.get_function_calls()
+        if any(function_call.id == call_id for function_call in function_calls):
+            return function_calls, set(event.long_running_tool_ids or ())
+    return [], set()
+
+
+class ParallelToolExecutor:
+    """Esegue in un thread pool le chiamate parallele ai function tool registrati"""
+
+    def __init__(self, functions: List[Callable], max_workers: int = MAX_TOOL_THREADS):
+        self._functions: Dict[str, Callable] = {
+            func.__name__: func for func in functions if _is_parallelizable(func)
+        }
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adk-tool")
+        self._pending: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _call(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        return call_tool_function(self._functions[name], args)
+
+    def _submit_parallel_calls(self, tool_context) -> None:
+        """Sottomette tutte le chiamate idonee dell'evento che contiene la chiamata corrente"""
+        function_calls, long_running_ids = sibling_function_calls(tool_context)
+        eligible = [
+            function_call for function_call in function_calls
+            if function_call.name in self._functions and function_call.id not in long_running_ids
+        ]
+        if len(eligible) < 2:
+            return
+
+        with self._lock:
+            if self._closed:
+                return
+            for function_call in eligible:
+                if function_call.id not in self._pending:
+                    # Il contesto (trace corrente compresa) segue la chiamata nel thread
+                    self._pending[function_call.id] = self._pool.submit(
+                        contextvars.copy_context().run, self._call, function_call.name, dict(function_call.args or {})
+                    )
+
+    async def before_tool_callback(self, tool, args, tool_context) -> Optional[Dict[str, Any]]:
+        if self._closed or tool.is_long_running or tool.name not in self._functions:
+            return None
+
+        call_id = tool_context.function_call_id
+        with self._lock:
+            future = self._pending.pop(call_id, None)
+        if future is None:
+            self._submit_parallel_calls(tool_context)
+            with self._lock:
+                future = self._pending.pop(call_id, None)
+        if future is None:
+            # Chiamata singola: ADK esegue il tool inline
+            return None
+        return await asyncio.wrap_future(future)
+
+    def shutdown(self) -> None:
+        """
+        Chiude il pool: le chiamate già sottomesse finiscono, le successive
+        (stream ancora in corso) girano inline
+        """
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=False)
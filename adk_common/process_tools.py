@@ -0,0 +1,193 @@
+"""
+Process pool per i function tool CPU-bound.
+
+Un tool sincrono eseguito inline (o nel thread pool di parallel_tools)
+occupa l'event loop / il GIL del worker: un calcolo pesante di un utente
+rallenta tutte le altre sessioni dello stesso server. I tool marcati come
+CPU-bound girano invece in un ProcessPoolExecutor:
+
+- argomenti e risultato passano via pickle (gli args del modello sono JSON,
+  la funzione viene re-importata nel worker per nome qualificato)
+- ogni chiamata ha un timeout; un worker bloccato viene terminato e il pool
+  ricreato, le altre chiamate in corso sul vecchio pool vengono riprovate
+- i worker vengono riciclati ogni ADK_TOOL_MAX_TASKS_PER_CHILD chiamate
+  (memoria che cresce, stato globale sporco)
+- le chiamate CPU-bound della stessa risposta del modello partono insieme,
+  una per core
+
+I tool leggeri restano sul percorso inline: il callback restituisce None.
+
+Marcare un tool:
+    @cpu_bound(timeout=60)
+    def fattorizza(n: int) -> dict: ...
+
+oppure da configurazione: ADK_CPU_BOUND_TOOLS=calcola_operazione,altro_tool
+
+Configurazione: ADK_TOOL_PROCESSES (default: numero di core),
+ADK_TOOL_TIMEOUT (secondi, default 30), ADK_TOOL_MAX_TASKS_PER_CHILD (100).
+
+Uso:
+    process_tools = ProcessToolExecutor([fattorizza, calcola_operazione])
+    root_agent = Agent(..., before_tool_callback=[process_tools.before_tool_callback, ...])
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from adk_common.parallel_tools import call_tool_function, sibling_function_calls
+
+logger = logging.getLogger(__name__)
+
+CPU_BOUND_TOOLS = frozenset(
+    name.strip() for name in os.environ.get("ADK_CPU_BOUND_TOOLS", "").split(",") if name.strip()
+)
+TOOL_PROCESSES = int(os.environ.get("ADK_TOOL_PROCESSES", str(os.cpu_count() or 2)))
+TOOL_TIMEOUT = float(os.environ.get("ADK_TOOL_TIMEOUT", "30"))
+TOOL_MAX_TASKS_PER_CHILD = int(os.environ.get("ADK_TOOL_MAX_TASKS_PER_CHILD", "100"))
+
+
+def cpu_bound(func: Optional[Callable] = None, *, timeout: Optional[float] = None):
+    """
+    Marca un function tool come CPU-bound. Restituisce la funzione stessa
+    (serve per il pickle nel worker), con o senza argomenti:
+    `@cpu_bound` oppure `@cpu_bound(timeout=60)`.
+    """
+    def mark(function: Callable) -> Callable:
+        function.__adk_cpu_bound__ = True
+        function.__adk_tool_timeout__ = timeout
+        return function
+    return mark(func) if func is not None else mark
+
+
+def is_cpu_bound(func: Callable) -> bool:
+    return getattr(func, "__adk_cpu_bound__", False) or getattr(func, "__name__", "") in CPU_BOUND_TOOLS
+
+
+def _terminate_workers(pool: ProcessPoolExecutor) -> None:
+    """
+    Termina subito i worker di `pool`: shutdown() da solo aspetterebbe che
+    un worker bloccato finisca. API pubblica da Python 3.14; prima l'unico
+    accesso ai processi è l'attributo privato `_processes`, se non c'è i
+    worker restano e terminano a fine chiamata.
+    """
+    if sys.version_info >= (3, 14):
+        pool.terminate_workers()
+        return
+    processes = getattr(pool, "_processes", None)
+    if not isinstance(processes, dict):
+        logger.warning("Worker del process pool non raggiungibili: verranno chiusi a fine chiamata")
+        return
+    for process in list(processes.values()):
+        process.terminate()
+
+
+class ProcessToolExecutor:
+    """Esegue in un process pool le chiamate ai tool CPU-bound tra quelli registrati"""
+
+    def __init__(self, functions: List[Callable], max_workers: int = TOOL_PROCESSES,
+                 timeout: float = TOOL_TIMEOUT, max_tasks_per_child: int = TOOL_MAX_TASKS_PER_CHILD):
+        self._functions: Dict[str, Callable] = {
+            func.__name__: func for func in functions
+            if is_cpu_bound(func) and not asyncio.iscoroutinefunction(func)
+        }
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self.max_tasks_per_child = max_tasks_per_child
+        # Il pool nasce alla prima chiamata: l'import dell'agente non avvia processi
+        self._pool: Optional[ProcessPoolExecutor] = None
+        # Future concurrent, non asyncio: l'executor può servire più event loop
+        # (ogni loop li avvolge con wrap_future quando li attende)
+        self._ready: Tuple[Future, ...] = ()
+        self._pool_lock = threading.Lock()
+        self._pending: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+        self._closed = False
+
+    def _get_pool(self) -> Tuple[ProcessPoolExecutor, Tuple[Future, ...]]:
+        """Pool corrente e i future che si completano quando i suoi worker sono avviati"""
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn: max_tasks_per_child non è compatibile con fork, e un
+                # fork di un server con thread e event loop attivi non è sicuro
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    max_tasks_per_child=self.max_tasks_per_child,
+                )
+                # Un task vuoto per worker: l'avvio dei processi (import dei
+                # moduli) non deve consumare il timeout della prima chiamata
+                self._ready = tuple(self._pool.submit(os.getpid) for _ in range(self.max_workers))
+            return self._pool, self._ready
+
+    def _recycle(self, pool: ProcessPoolExecutor) -> None:
+        """Termina i worker di `pool` (es. bloccati oltre il timeout); il prossimo submit crea un pool nuovo"""
+        with self._pool_lock:
+            if self._pool is not pool:
+                return  # già sostituito da un'altra chiamata
+            self._pool = None
+        _terminate_workers(pool)
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _timeout_for(self, name: str) -> float:
+        return getattr(self._functions[name], "__adk_tool_timeout__", None) or self.timeout
+
+    async def _run(self, name: str, args: Dict[str, Any]) -> Dict[str, Any]:
+        loop = asyncio.get_running_loop()
+        timeout = self._timeout_for(name)
+        deadline = None
+        # Un secondo tentativo se il pool si rompe sotto i piedi (worker morto o
+        # riciclato per il timeout di un'altra chiamata), entro la stessa deadline
+        for _ in range(2):
+            pool, ready = self._get_pool()
+            try:
+                await asyncio.gather(*map(asyncio.wrap_future, ready))
+                deadline = deadline if deadline is not None else loop.time() + timeout
+                future = pool.submit(call_tool_function, self._functions[name], args)
+                return await asyncio.wait_for(asyncio.wrap_future(future), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                logger.warning("Tool %s oltre %.0fs: worker terminati, pool ricreato", name, timeout)
+                self._recycle(pool)
+                return {"status": "error", "error_message": f"{name}: tempo massimo di {timeout:.0f}s superato"}
+            except (BrokenProcessPool, RuntimeError) as e:
+                # RuntimeError: submit su un pool già chiuso da _recycle
+                logger.warning("Pool dei tool non disponibile durante %s: %s", name, e)
+                self._recycle(pool)
+        return {"status": "error", "error_message": f"{name}: il processo di calcolo è terminato in modo anomalo"}
+
+    def _submit_calls(self, tool_context) -> None:
+        """Avvia tutte le chiamate CPU-bound dell'evento che contiene la chiamata corrente"""
+        function_calls, long_running_ids = sibling_function_calls(tool_context)
+        for function_call in function_calls:
+            if (function_call.name in self._functions and function_call.id not in long_running_ids
+                    and function_call.id not in self._pending):
+                self._pending[function_call.id] = asyncio.ensure_future(
+                    self._run(function_call.name, dict(function_call.args or {}))
+                )
+
+    async def before_tool_callback(self, tool, args, tool_context) -> Optional[Dict[str, Any]]:
+        if self._closed or tool.is_long_running or tool.name not in self._functions:
+            return None  # tool leggero (o executor chiuso): percorso inline
+
+        call_id = tool_context.function_call_id
+        task = self._pending.pop(call_id, None)
+        if task is None:
+            self._submit_calls(tool_context)
+            task = self._pending.pop(call_id, None)
+        if task is None:
+            # Chiamata non trovata tra gli eventi (es. invocata fuori dal flusso normale)
+            return await self._run(tool.name, dict(args))
+        return await task
+
+    def shutdown(self) -> None:
+        """Termina i worker; dopo lo shutdown i tool girano inline e il pool non viene ricreato"""
+        with self._pool_lock:
+            self._closed = True
+            pool, self._pool, self._ready = self._pool, None, ()
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,296 @@
+"""
+Context caching del prefisso statico delle richieste al modello.
+
+Istruzioni di sistema e dichiarazioni dei tool di un agente sono identiche
+in ogni richiesta di ogni sessione: per i turni brevi (es. "si"/"no" agli
+approval) sono la maggior parte dei token di input. PromptCache è un
+before_model_callback che:
+
+- calcola un'impronta del prefisso (modello, istruzioni, tool, tool_config)
+- alla prima richiesta crea sul backend un contenuto in cache con quel
+  prefisso (Gemini: client.caches.create; FakeLlm: cache locale finta) e lo
+  ricrea poco prima che scada il TTL
+- nelle richieste successive toglie istruzioni e tool dalla config e la fa
+  puntare al contenuto in cache (config.cached_content)
+
+Fallback: se il backend non supporta il caching (modello non Gemini,
+prefisso sotto la soglia minima di token, errore dell'API) la richiesta
+parte intera come prima e per ADK_PROMPT_CACHE_RETRY secondi non si
+riprova con quel prefisso. Se il backend rifiuta un contenuto in cache già
+creato (rimosso o scaduto prima del TTL locale: 404/400 "CachedContent"),
+il modello avvolto da `prompt_cache.wrap()` invalida la voce per
+ADK_PROMPT_CACHE_RETRY secondi e ripete subito la richiesta senza
+cached_content, con istruzioni e tool rimessi al loro posto.
+
+after_model_callback conta hit e miss (risposte con o senza token serviti
+dalla cache, compreso il caching implicito di Gemini) in
+adk_cache_requests_total{cache="prompt_prefix"}.
+
+Va messo PRIMA degli altri before_model_callback: quelli che aggiungono
+istruzioni dinamiche (es. ContextWindow) con una richiesta in cache le
+spostano nei contents, perché l'API non accetta system_instruction insieme
+a cached_content.
+
+Configurazione: ADK_PROMPT_CACHE=0 lo disattiva, ADK_PROMPT_CACHE_TTL
+(secondi, default 3600), ADK_PROMPT_CACHE_RETRY (secondi, default 600).
+
+Uso:
+    prompt_cache = PromptCache()
+    root_agent = Agent(model=prompt_cache.wrap(resolve_model(...)), ...,
+        before_model_callback=[prompt_cache.before_model_callback, ...],
+        after_model_callback=prompt_cache.after_model_callback)
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Callable, Dict, Optional, Tuple, Union
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import BaseLlm, LlmRequest, LlmResponse
+from google.adk.models.base_llm_connection import BaseLlmConnection
+from google.adk.models.google_llm import Gemini
+from google.adk.models.registry import LLMRegistry
+from google.genai import types
+
+from adk_common.metrics import CACHE_REQUESTS, counter
+from adk_common.tracing import annotate
+
+logger = logging.getLogger(__name__)
+
+PROMPT_CACHE_ENABLED = os.environ.get("ADK_PROMPT_CACHE", "1") == "1"
+PROMPT_CACHE_TTL = float(os.environ.get("ADK_PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_RETRY = float(os.environ.get("ADK_PROMPT_CACHE_RETRY", "600"))
+
+# Un contenuto in cache che scade entro questo margine viene già ricreato
+_REFRESH_MARGIN = 60.0
+
+PROMPT_CACHE_CREATED = counter(
+    "adk_prompt_cache_created_total", "Prefissi statici messi in cache sul backend del modello", ("model",)
+)
+PROMPT_CACHE_FALLBACKS = counter(
+    "adk_prompt_cache_fallbacks_total", "Richieste inviate senza cache esplicita del prefisso", ("reason",)
+)
+
+
+class CachingUnsupported(Exception):
+    """Il backend del modello non supporta il context caching esplicito"""
+
+
+@dataclass
+class _CacheEntry:
+    name: Optional[str]
+    expires_at: float  # per name=None: quando riprovare la creazione
+    fallback_reason: str = ""
+    key: str = ""
+    # system_instruction, tools, tool_config tolti dalle richieste: servono al fallback
+    prefix: Optional[Tuple[Any, Any, Any]] = None
+
+
+def is_cache_rejected(error: Exception) -> bool:
+    """Errore del backend per un contenuto in cache inesistente, scaduto o non valido"""
+    message = str(error).lower().replace("_", "").replace(" ", "")
+    code = getattr(error, "code", None)
+    return "cachedcontent" in message and (code in (400, 403, 404) or "404" in message or "notfound" in message)
+
+
+def prefix_fingerprint(llm_request: LlmRequest) -> str:
+    """Impronta del prefisso statico: cambia se cambiano modello, istruzioni o tool"""
+    config = llm_request.config
+    digest = hashlib.sha256()
+    digest.update((llm_request.model or "").encode("utf-8"))
+    digest.update(b"\0" + str(config.system_instruction or "").encode("utf-8"))
+    for tool in config.tools or []:
+        digest.update(b"\0" + tool.model_dump_json(exclude_none=True).encode("utf-8"))
+    if config.tool_config:
+        digest.update(b"\0" + config.tool_config.model_dump_json(exclude_none=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+async def create_cached_prefix(llm: BaseLlm, llm_request: LlmRequest, ttl: float) -> str:
+    """Crea sul backend di `llm` il contenuto in cache con il prefisso statico; ne restituisce il nome"""
+    config = llm_request.config
+    if isinstance(llm, PromptCachedLlm):
+        llm = llm.base
+    create = getattr(llm, "create_cached_content", None)
+    if create is not None:
+        # Modelli che gestiscono da sé la cache (es. FakeLlm)
+        return await create(llm_request, ttl)
+    if not isinstance(llm, Gemini):
+        raise CachingUnsupported(f"{type(llm).__name__} non supporta il context caching")
+    cached = await llm.api_client.aio.caches.create(
+        model=llm_request.model,
+        config=types.CreateCachedContentConfig(
+            system_instruction=config.system_instruction,
+            tools=config.tools,
+            tool_config=config.tool_config,
+            ttl=f"{int(ttl)}s",
+            display_name=f"adk-prefix-{prefix_fingerprint(llm_request)[:12]}",
+        ),
+    )
+    return cached.name
+
+
+class PromptCache:
+    """
+    Callback before/after_model che mettono in cache il prefisso statico.
+
+    Args:
+        ttl: Durata del contenuto in cache sul backend (secondi)
+        retry_after: Dopo un fallimento, secondi prima di riprovare con lo stesso prefisso
+        enabled: False = solo conteggio di hit/miss, nessuna cache esplicita
+    """
+
+    def __init__(self, ttl: float = PROMPT_CACHE_TTL, retry_after: float = PROMPT_CACHE_RETRY,
+                 enabled: bool = PROMPT_CACHE_ENABLED, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.enabled = enabled
+        self._clock = clock
+        self._entries: Dict[str, _CacheEntry] = {}
+        # Per nome del contenuto in cache: voce e prefisso da rimettere se il backend lo rifiuta
+        self._by_name: Dict[str, _CacheEntry] = {}
+        self._lock = asyncio.Lock()
+        self._llm: Optional[BaseLlm] = None
+        # Senza wrap(): modelli risolti dal nome nella richiesta, come fa l'agente
+        self._resolved: Dict[str, BaseLlm] = {}
+
+    def wrap(self, model: Union[str, BaseLlm]) -> "PromptCachedLlm":
+        """Modello dell'agente con il fallback senza cache quando il backend rifiuta il contenuto"""
+        base = LLMRegistry.new_llm(model) if isinstance(model, str) else model
+        self._llm = base
+        return PromptCachedLlm(model=base.model, base=base, prompt_cache=self)
+
+    def invalidate(self, name: str) -> Optional[Tuple[Any, Any, Any]]:
+        """
+        Il backend ha rifiutato il contenuto `name`: niente cache per quel
+        prefisso per retry_after secondi. Restituisce il prefisso da
+        rimettere nella richiesta (None se il nome non è di questa cache).
+        """
+        entry = self._by_name.pop(name, None)
+        if entry is None:
+            return None
+        if self._entries.get(entry.key) is entry:
+            self._entries[entry.key] = _CacheEntry(None, self._clock() + self.retry_after, "rejected", entry.key)
+        logger.info("Contenuto in cache %s rifiutato dal backend: richiesta ripetuta senza cache", name)
+        PROMPT_CACHE_FALLBACKS.labels(reason="rejected").inc()
+        return entry.prefix
+
+    def _lookup(self, key: str) -> Tuple[bool, Optional[_CacheEntry]]:
+        """(ancora valida, voce): una voce non valida va (ri)creata"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        if entry.name is None:
+            return self._clock() < entry.expires_at, entry
+        return self._clock() < entry.expires_at - _REFRESH_MARGIN, entry
+
+    async def _entry(self, llm: BaseLlm, llm_request: LlmRequest) -> _CacheEntry:
+        key = prefix_fingerprint(llm_request)
+        valid, entry = self._lookup(key)
+        if valid:
+            return entry
+
+        # Un solo create per prefisso anche con molte sessioni che partono insieme
+        async with self._lock:
+            valid, entry = self._lookup(key)
+            if valid:
+                return entry
+            now = self._clock()
+            try:
+                name = await create_cached_prefix(llm, llm_request, self.ttl)
+            except Exception as e:
+                logger.info("Context caching non disponibile per %s: %s", llm_request.model, e)
+                reason = "unsupported" if isinstance(e, (CachingUnsupported, NotImplementedError)) else "error"
+                entry = self._entries[key] = _CacheEntry(None, now + self.retry_after, reason)
+                return entry
+            config = llm_request.config
+            entry = self._entries[key] = _CacheEntry(
+                name, now + self.ttl, key=key,
+                prefix=(config.system_instruction, config.tools, config.tool_config),
+            )
+            # I nomi scaduti sul backend non servono più al fallback
+            for stale in [stale for stale, old in self._by_name.items() if old.expires_at <= now]:
+                del self._by_name[stale]
+            self._by_name[name] = entry
+            PROMPT_CACHE_CREATED.labels(model=llm_request.model or "").inc()
+            return entry
+
+    async def before_model_callback(self, callback_context: CallbackContext,
+                                    llm_request: LlmRequest) -> Optional[LlmResponse]:
+        config = llm_request.config
+        if not self.enabled or config is None or config.cached_content:
+            return None
+        if not config.system_instruction and not config.tools:
+            return None
+
+        llm = self._llm
+        if llm is None:
+            if not llm_request.model:
+                return None
+            llm = self._resolved.get(llm_request.model)
+            if llm is None:
+                llm = self._resolved[llm_request.model] = LLMRegistry.new_llm(llm_request.model)
+        entry = await self._entry(llm, llm_request)
+        if entry.name is None:
+            # Richiesta intera, come senza cache
+            PROMPT_CACHE_FALLBACKS.labels(reason=entry.fallback_reason).inc()
+            return None
+
+        name = config.cached_content = entry.name
+        config.system_instruction = None
+        config.tools = None
+        config.tool_config = None
+        annotate(**{"llm.cached_content": name})
+        return None
+
+    def after_model_callback(self, callback_context: CallbackContext,
+                             llm_response: LlmResponse) -> Optional[LlmResponse]:
+        usage = llm_response.usage_metadata
+        if usage is None or llm_response.partial:
+            return None
+        cached_tokens = usage.cached_content_token_count or 0
+        CACHE_REQUESTS.labels(cache="prompt_prefix", result="hit" if cached_tokens else "miss").inc()
+        annotate(**{"llm.prompt_tokens": usage.prompt_token_count or 0, "llm.cached_tokens": cached_tokens})
+        return None
+
+
+class PromptCachedLlm(BaseLlm):
+    """
+    Modello creato da PromptCache.wrap(): inoltra tutto al modello `base` e,
+    se il backend rifiuta il contenuto in cache della richiesta prima di
+    aver risposto, la ripete una volta senza cache (vedi PromptCache.invalidate).
+    """
+
+    base: BaseLlm
+    prompt_cache: PromptCache
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        name = llm_request.config.cached_content if llm_request.config else None
+        responded = False
+        try:
+            async for llm_response in self.base.generate_content_async(llm_request, stream=stream):
+                responded = True
+                yield llm_response
+            return
+        except Exception as error:
+            if not name or responded or not is_cache_rejected(error):
+                raise
+            prefix = self.prompt_cache.invalidate(name)
+            if prefix is None:
+                raise
+
+        config = llm_request.config
+        config.cached_content = None
+        config.system_instruction, config.tools, config.tool_config = prefix
+        annotate(**{"llm.cached_content": "", "llm.cache_fallback": "rejected"})
+        async for llm_response in self.base.generate_content_async(llm_request, stream=stream):
+            yield llm_response
+
+    def connect(self, llm_request: LlmRequest) -> BaseLlmConnection:
+        return self.base.connect(llm_request)
@@ -0,0 +1,252 @@
+"""
+Stato delle chat esternalizzato rispetto a st.session_state.
+
+st.session_state vive in un singolo processo ed è legato alla connessione
+websocket: con più repliche Streamlit dietro un load balancer, o dopo un
+redeploy, la conversazione andrebbe persa. Qui lo stato per utente è
+salvato in un backend condiviso:
+
+- conversations: una riga per (app, user_id) con session_id, pending_approval,
+  approval_details
+- messages: una riga per messaggio, scritta in append (delta) a ogni messaggio
+
+L'utente viene riconosciuto tramite il query param `uid`, quindi si ritrova
+la propria conversazione anche se la riconnessione finisce su un'altra replica.
+La lettura dal backend avviene solo al primo run di una connessione.
+
+Backend disponibili: SQLiteStateBackend (file locale o volume condiviso).
+Per un altro storage basta implementare StateBackend.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from adk_common.messages import ChatMessage
+
+STATE_DB_PATH = os.environ.get("ADK_STATE_DB", ".chat_state.sqlite3")
+
+# Lo uid arriva dall'URL e finisce in path (event_store) e URL del backend
+_VALID_UID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    pending_approval INTEGER NOT NULL DEFAULT 0,
+    approval_details TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (app_name, user_id)
+);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    approval TEXT
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (app_name, user_id, session_id, id);
+"""
+
+
+class StateBackend(ABC):
+    """Interfaccia di un backend di stato delle chat"""
+
+    @abstractmethod
+    def load_conversation(self, app_name: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Restituisce session_id, pending_approval, approval_details oppure None"""
+
+    @abstractmethod
+    def update_conversation(self, app_name: str, user_id: str, **fields) -> None:
+        """Aggiorna solo i campi passati (session_id, pending_approval, approval_details)"""
+
+    @abstractmethod
+    def load_messages(self, app_name: str, user_id: str, session_id: Optional[str]) -> List[ChatMessage]:
+        """Messaggi della sessione, in ordine di inserimento"""
+
+    @abstractmethod
+    def append_message(self, app_name: str, user_id: str, session_id: Optional[str], message: ChatMessage) -> None:
+        """Aggiunge un messaggio in coda (scrittura delta)"""
+
+    @abstractmethod
+    def clear_messages(self, app_name: str, user_id: str, session_id: Optional[str]) -> None:
+        """Elimina i messaggi della sessione"""
+
+
+class SQLiteStateBackend(StateBackend):
+    """Backend su file SQLite (WAL), condivisibile tra processi sullo stesso host/volume"""
+
+    _FIELDS = ("session_id", "pending_approval", "approval_details")
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(messages)")}
+            if "approval" not in columns:
+                # Database creati prima di ChatMessage
+                connection.execute("ALTER TABLE messages ADD COLUMN approval TEXT")
+
+    def _connection(self) -> sqlite3.Connection:
+        # Una connessione per thread: Streamlit esegue ogni utente in un thread diverso
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def load_conversation(self, app_name, user_id):
+        row = self._connection().execute(
+            "SELECT session_id, pending_approval, approval_details FROM conversations "
+            "WHERE app_name = ? AND user_id = ?",
+            (app_name, user_id),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "session_id": row[0],
+            "pending_approval": bool(row[1]),
+            "approval_details": json.loads(row[2]) if row[2] else None,
+        }
+
+    def update_conversation(self, app_name, user_id, **fields):
+        unknown = set(fields) - set(self._FIELDS)
+        if unknown:
+            raise ValueError(f"Campi non supportati: {', '.join(sorted(unknown))}")
+        values = {
+            "session_id": fields.get("session_id"),
+            "pending_approval": int(bool(fields.get("pending_approval", False))),
+            "approval_details": json.dumps(fields["approval_details"]) if fields.get("approval_details") else None,
+        }
+        assignments = ", ".join(f"{name} = excluded.{name}" for name in fields)
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO conversations (app_name, user_id, session_id, pending_approval, approval_details, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                f"ON CONFLICT (app_name, user_id) DO UPDATE SET {assignments}{', ' if assignments else ''}"
+                "updated_at = excluded.updated_at",
+                (app_name, user_id, values["session_id"], values["pending_approval"],
+                 values["approval_details"], time.time()),
+            )
+
+    def load_messages(self, app_name, user_id, session_id):
+        rows = self._connection().execute(
+            "SELECT role, content, approval FROM messages "
+            "WHERE app_name = ? AND user_id = ? AND session_id IS ? ORDER BY id",
+            (app_name, user_id, session_id),
+        ).fetchall()
+        return [
+            ChatMessage.from_row((role, content, json.loads(approval) if approval is not None else None))
+            for role, content, approval in rows
+        ]
+
+    def append_message(self, app_name, user_id, session_id, message):
+        role, content, approval = message.to_row()
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO messages (app_name, user_id, session_id, role, content, approval) VALUES (?, ?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, role, content, json.dumps(approval) if approval is not None else None),
+            )
+
+    def clear_messages(self, app_name, user_id, session_id):
+        with self._connection() as connection:
+            connection.execute(
+                "DELETE FROM messages WHERE app_name = ? AND user_id = ? AND session_id IS ?",
+                (app_name, user_id, session_id),
+            )
+
+
+_backend: Optional[StateBackend] = None
+_backend_lock = threading.Lock()
+
+
+def get_state_backend() -> StateBackend:
+    """Backend condiviso dal processo (SQLite su ADK_STATE_DB)"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = SQLiteStateBackend()
+        return _backend
+
+
+class ChatState:
+    """
+    Facciata usata dalle app: tiene st.session_state come cache del run
+    corrente e scrive ogni modifica nel backend.
+
+    Uso:
+        chat_state = ChatState(st.session_state, st.query_params, APP_NAME)
+        chat_state.append_message(ChatMessage(Role.USER, "Ciao"))
+    """
+
+    def __init__(self, session_state, query_params, app_name: str, backend: Optional[StateBackend] = None):
+        self.session_state = session_state
+        self.app_name = app_name
+        self.backend = backend or get_state_backend()
+
+        if "user_id" not in session_state:
+            # Primo run della connessione: ripristina dal backend (lazy, una volta sola)
+            user_id = query_params.get("uid") or ""
+            if not _VALID_UID.fullmatch(user_id):
+                # Assente o non valido (es. "../../x"): nuovo utente
+                user_id = f"user-{uuid.uuid4()}"
+            query_params["uid"] = user_id
+            session_state.user_id = user_id
+            conversation = self.backend.load_conversation(app_name, user_id) or {}
+            session_state.session_id = conversation.get("session_id")
+            session_state.pending_approval = conversation.get("pending_approval", False)
+            session_state.approval_details = conversation.get("approval_details")
+            session_state.messages = self.backend.load_messages(app_name, user_id, session_state.session_id)
+        if "retry_queue" not in session_state:
+            # Messaggi da reinviare quando il backend ADK torna raggiungibile (solo locale)
+            session_state.retry_queue = []
+
+    @property
+    def user_id(self) -> str:
+        return self.session_state.user_id
+
+    def start_session(self, session_id: str) -> None:
+        """Nuova sessione ADK: messaggi e approval ripartono da zero"""
+        self.session_state.session_id = session_id
+        self.session_state.messages = []
+        self.session_state.pending_approval = False
+        self.session_state.approval_details = None
+        self.backend.update_conversation(
+            self.app_name, self.user_id, session_id=session_id, pending_approval=False, approval_details=None
+        )
+
+    def append_message(self, message: ChatMessage) -> None:
+        self.session_state.messages.append(message)
+        self.backend.append_message(self.app_name, self.user_id, self.session_state.session_id, message)
+
+    def set_approval(self, pending: bool, details: Optional[Dict[str, Any]] = None) -> None:
+        self.session_state.pending_approval = pending
+        self.session_state.approval_details = details
+        self.backend.update_conversation(
+            self.app_name, self.user_id, pending_approval=pending, approval_details=details
+        )
+
+    def queue_retry(self, message: str) -> None:
+        """Il messaggio è già in chat ma non è arrivato all'agente: va reinviato"""
+        self.session_state.retry_queue.append(message)
+
+    def pop_retries(self) -> List[str]:
+        retries, self.session_state.retry_queue = self.session_state.retry_queue, []
+        return retries
+
+    def clear_messages(self) -> None:
+        self.session_state.messages = []
+        self.backend.clear_messages(self.app_name, self.user_id, self.session_state.session_id)
+        self.set_approval(False)
@@ -0,0 +1,106 @@
+"""
+Export degli span su file in formato OTLP JSON, per adk_common.tracing.
+
+Modulo separato perché dipende dall'SDK di OpenTelemetry: lo importa solo
+setup_tracing, quando l'export è davvero attivo.
+"""
+
+import json
+import os
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Sequence
+
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from adk_common.tracing import TRACE_FILE
+
+
+def _any_value(value: Any) -> Dict[str, Any]:
+    """Valore di un attributo nel formato AnyValue di OTLP JSON"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    if isinstance(value, (list, tuple)):
+        return {"arrayValue": {"values": [_any_value(item) for item in value]}}
+    return {"stringValue": str(value)}
+
+
+def _attributes(attributes) -> list:
+    return [{"key": key, "value": _any_value(value)} for key, value in (attributes or {}).items()]
+
+
+def _span_to_otlp(span: ReadableSpan) -> Dict[str, Any]:
+    context = span.get_span_context()
+    encoded = {
+        "traceId": format(context.trace_id, "032x"),
+        "spanId": format(context.span_id, "016x"),
+        "name": span.name,
+        # SpanKind di OTLP parte da 1 (INTERNAL), quello dell'SDK da 0
+        "kind": span.kind.value + 1,
+        "startTimeUnixNano": str(span.start_time),
+        "endTimeUnixNano": str(span.end_time),
+        "attributes": _attributes(span.attributes),
+        "status": {"code": span.status.status_code.value},
+    }
+    if span.parent is not None:
+        encoded["parentSpanId"] = format(span.parent.span_id, "016x")
+    if span.status.description:
+        encoded["status"]["message"] = span.status.description
+    if span.events:
+        encoded["events"] = [
+            {"timeUnixNano": str(event.timestamp), "name": event.name, "attributes": _attributes(event.attributes)}
+            for event in span.events
+        ]
+    return encoded
+
+
+class OtlpJsonFileExporter(SpanExporter):
+    """Accoda gli span a un file JSONL, una ExportTraceServiceRequest OTLP per riga"""
+
+    def __init__(self, path: Path = TRACE_FILE):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def encode(spans: Sequence[ReadableSpan]) -> Dict[str, Any]:
+        grouped: Dict[Any, Dict[Any, list]] = defaultdict(lambda: defaultdict(list))
+        resources = {}
+        for span in spans:
+            resource_key = id(span.resource)
+            resources[resource_key] = span.resource
+            scope = span.instrumentation_scope
+            grouped[resource_key][(scope.name, scope.version) if scope else ("", None)].append(_span_to_otlp(span))
+        return {"resourceSpans": [
+            {
+                "resource": {"attributes": _attributes(resources[resource_key].attributes)},
+                "scopeSpans": [
+                    {"scope": {"name": name, **({"version": version} if version else {})}, "spans": encoded_spans}
+                    for (name, version), encoded_spans in scopes.items()
+                ],
+            }
+            for resource_key, scopes in grouped.items()
+        ]}
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        line = (json.dumps(self.encode(spans), separators=(",", ":"), default=str) + "\n").encode("utf-8")
+        try:
+            with self._lock:
+                # Una sola write in O_APPEND: le righe di processi diversi non si mescolano
+                fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, line)
+                finally:
+                    os.close(fd)
+        except OSError:
+            return SpanExportResult.FAILURE
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
@@ -0,0 +1,124 @@
+"""
+Tracing end-to-end: dal click in Streamlit all'esecuzione dei tool.
+
+- ogni azione dell'interfaccia (`ui_action`) apre lo span radice di una
+  nuova trace
+- AdkClient apre uno span client per ogni richiesta e propaga il contesto
+  nell'header W3C `traceparent`
+- adk_server (TraceContextMiddleware) riprende il contesto dall'header: gli
+  span di ADK (invocation, agent_run, call_llm, execute_tool ...) e quelli
+  dei tool diventano figli della stessa trace
+- gli span vengono esportati in formato OTLP JSON (una riga per batch, come
+  il file exporter dell'OpenTelemetry Collector) in ADK_TRACE_FILE,
+  default .traces/spans.jsonl; più processi possono scrivere sullo stesso file
+
+ADK_TRACING=0 disattiva l'export (la propagazione degli header resta).
+Il nome del servizio nei resource attributes è OTEL_SERVICE_NAME se impostato.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Iterator, MutableMapping, Optional
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+TRACING_ENABLED = os.environ.get("ADK_TRACING", "1") == "1"
+TRACE_FILE = Path(os.environ.get("ADK_TRACE_FILE", ".traces/spans.jsonl"))
+
+tracer = trace.get_tracer("adk_common")
+
+_setup_lock = threading.Lock()
+_configured = False
+_deferred_service: Optional[str] = None
+
+
+def setup_tracing(service_name: str, deferred: bool = False) -> None:
+    """
+    Configura (una volta per processo) il TracerProvider globale con
+    l'export su file. Se un TracerProvider dell'SDK è già installato (es. da
+    google.adk.cli.fast_api) gli aggiunge solo il processor.
+
+    deferred=True (front-end): l'SDK si importa e il provider si installa al
+    primo span aperto da ui_action/client_span, non durante il primo render.
+    """
+    global _configured, _deferred_service
+    if deferred:
+        _deferred_service = _deferred_service or service_name
+        return
+    with _setup_lock:
+        if _configured or not TRACING_ENABLED:
+            return
+        _configured = True
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+        from adk_common.trace_export import OtlpJsonFileExporter
+
+        processor = BatchSpanProcessor(OtlpJsonFileExporter(TRACE_FILE))
+        provider = trace.get_tracer_provider()
+        if isinstance(provider, TracerProvider):
+            provider.add_span_processor(processor)
+            return
+        provider = TracerProvider(resource=Resource.create({
+            "service.name": os.environ.get("OTEL_SERVICE_NAME", service_name),
+        }))
+        provider.add_span_processor(processor)
+        trace.set_tracer_provider(provider)
+
+
+def _ensure_tracing() -> None:
+    if _deferred_service is not None and TRACING_ENABLED and not _configured:
+        setup_tracing(_deferred_service)
+
+
+def current_trace_id() -> Optional[str]:
+    """Trace id (hex) dello span corrente, None fuori da una trace"""
+    context = trace.get_current_span().get_span_context()
+    return format(context.trace_id, "032x") if context.is_valid else None
+
+
+@contextmanager
+def ui_action(name: str, **attributes: Any) -> Iterator[trace.Span]:
+    """
+    Span radice di un'azione dell'utente: ogni chiamata apre una trace
+    nuova. Utilizzabile anche come decoratore:
+
+        @ui_action("send_message", app=APP_NAME)
+        def send_message(message): ...
+    """
+    _ensure_tracing()
+    with tracer.start_as_current_span(
+        f"ui {name}", context=otel_context.Context(), kind=SpanKind.INTERNAL, attributes=attributes,
+    ) as span:
+        yield span
+
+
+@contextmanager
+def client_span(method: str, path: str, headers: MutableMapping[str, str]) -> Iterator[trace.Span]:
+    """Span di una richiesta HTTP uscente; scrive `traceparent` in headers"""
+    _ensure_tracing()
+    with tracer.start_as_current_span(
+        f"{method} {path.split('?')[0]}", kind=SpanKind.CLIENT,
+        attributes={"http.request.method": method, "url.path": path},
+    ) as span:
+        propagate.inject(headers)
+        yield span
+
+
+def record_status(span: trace.Span, status_code: int) -> None:
+    span.set_attribute("http.response.status_code", status_code)
+    if status_code >= 500:
+        span.set_status(Status(StatusCode.ERROR))
+
+
+def annotate(**attributes: Any) -> None:
+    """Aggiunge attributi allo span corrente (es. dentro un tool)"""
+    span = trace.get_current_span()
+    if span.is_recording():
+        for key, value in attributes.items():
+            span.set_attribute(key, value)
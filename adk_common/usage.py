@@ -0,0 +1,206 @@
+"""
+Contabilità dei token consumati dagli agenti.
+
+Ogni evento ADK prodotto da una chiamata al modello porta `usageMetadata`
+(promptTokenCount, candidatesTokenCount, totalTokenCount, ...). Qui:
+
+- TokenUsage somma i contatori degli eventi di un turno
+- UsageLedger salva un record per turno (SQLite, stesso file dello stato chat)
+  e aggrega per sessione, utente e app
+- check_budget confronta il consumo di una sessione con il budget configurato
+
+Budget (0 = disattivato):
+
+- ADK_SESSION_TOKEN_BUDGET: token massimi per sessione (default 200000)
+- ADK_SESSION_TOKEN_WARN_RATIO: frazione del budget oltre cui avvisare (default 0.8)
+
+Export locale:
+
+    python -m adk_common.usage export usage.csv [--app agent_approval]
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, fields
+from enum import Enum
+from typing import Any, Dict, Iterable, Optional
+
+from adk_common.state_store import STATE_DB_PATH
+
+SESSION_TOKEN_BUDGET = int(os.environ.get("ADK_SESSION_TOKEN_BUDGET", "200000"))
+SESSION_TOKEN_WARN_RATIO = float(os.environ.get("ADK_SESSION_TOKEN_WARN_RATIO", "0.8"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS token_usage (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    app_name TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    total_tokens INTEGER NOT NULL,
+    model_calls INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS token_usage_by_session ON token_usage (app_name, user_id, session_id);
+"""
+
+
+@dataclass(slots=True)
+class TokenUsage:
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    total_tokens: int = 0
+    model_calls: int = 0
+    # Turni (chiamate a /run) sommati in questo oggetto
+    turns: int = 0
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        return TokenUsage(*(getattr(self, f.name) + getattr(other, f.name) for f in fields(self)))
+
+    @classmethod
+    def from_event(cls, event: Dict[str, Any]) -> "TokenUsage":
+        metadata = event.get("usageMetadata") or {}
+        if not metadata:
+            return cls()
+        prompt = metadata.get("promptTokenCount") or 0
+        output = metadata.get("candidatesTokenCount") or 0
+        return cls(
+            prompt_tokens=prompt,
+            output_tokens=output,
+            cached_tokens=metadata.get("cachedContentTokenCount") or 0,
+            total_tokens=metadata.get("totalTokenCount") or prompt + output,
+            model_calls=1,
+        )
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict[str, Any]]) -> "TokenUsage":
+        """Consumo di un turno: somma degli eventi restituiti da /run"""
+        usage = cls(turns=1)
+        for event in events:
+            # Gli eventi parziali (streaming) ripetono i contatori: conta solo quelli finali
+            if not event.get("partial"):
+                usage = usage + cls.from_event(event)
+        return usage
+
+    def to_dict(self) -> Dict[str, int]:
+        return asdict(self)
+
+
+class BudgetStatus(str, Enum):
+    OK = "ok"
+    WARN = "warn"
+    STOP = "stop"
+
+
+def check_budget(session_usage: TokenUsage, budget: int = SESSION_TOKEN_BUDGET,
+                 warn_ratio: float = SESSION_TOKEN_WARN_RATIO) -> BudgetStatus:
+    """
+    Stato del budget di una sessione prima di un nuovo turno.
+
+    Il prossimo turno è stimato con la media dei turni precedenti: si blocca
+    quando supererebbe il budget, invece di accorgersene dopo.
+    """
+    if budget <= 0:
+        return BudgetStatus.OK
+    average_turn = session_usage.total_tokens / session_usage.turns if session_usage.turns else 0
+    if session_usage.total_tokens + average_turn > budget:
+        return BudgetStatus.STOP
+    if session_usage.total_tokens >= budget * warn_ratio:
+        return BudgetStatus.WARN
+    return BudgetStatus.OK
+
+
+class UsageLedger:
+    """Registro dei consumi per turno su SQLite (WAL)"""
+
+    _COLUMNS = ("prompt_tokens", "output_tokens", "cached_tokens", "total_tokens", "model_calls")
+
+    def __init__(self, path: str = STATE_DB_PATH):
+        self.path = path
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=10)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def record_turn(self, app_name: str, user_id: str, session_id: str, usage: TokenUsage) -> None:
+        with self._connection() as connection:
+            connection.execute(
+                "INSERT INTO token_usage (app_name, user_id, session_id, prompt_tokens, output_tokens, "
+                "cached_tokens, total_tokens, model_calls, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (app_name, user_id, session_id, usage.prompt_tokens, usage.output_tokens,
+                 usage.cached_tokens, usage.total_tokens, usage.model_calls, time.time()),
+            )
+
+    def totals(self, app_name: str, user_id: Optional[str] = None, session_id: Optional[str] = None) -> TokenUsage:
+        """Consumo aggregato per app, per utente (user_id) o per sessione (user_id + session_id)"""
+        query = ("SELECT " + ", ".join(f"COALESCE(SUM({column}), 0)" for column in self._COLUMNS)
+                 + ", COUNT(*) FROM token_usage WHERE app_name = ?")
+        params = [app_name]
+        if user_id is not None:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        if session_id is not None:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        return TokenUsage(*self._connection().execute(query, params).fetchone())
+
+    def export_csv(self, path: str, app_name: Optional[str] = None) -> int:
+        """Esporta un record per turno in CSV; restituisce il numero di righe"""
+        import csv  # solo per l'export da riga di comando
+
+        query = "SELECT app_name, user_id, session_id, " + ", ".join(self._COLUMNS) + ", created_at FROM token_usage"
+        params = []
+        if app_name is not None:
+            query += " WHERE app_name = ?"
+            params.append(app_name)
+        rows = self._connection().execute(query + " ORDER BY id", params).fetchall()
+        with open(path, "w", newline="", encoding="utf-8") as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(("app_name", "user_id", "session_id", *self._COLUMNS, "created_at"))
+            writer.writerows(rows)
+        return len(rows)
+
+
+_ledger: Optional[UsageLedger] = None
+_ledger_lock = threading.Lock()
+
+
+def get_usage_ledger() -> UsageLedger:
+    """Registro condiviso dal processo (stesso file di ADK_STATE_DB)"""
+    global _ledger
+    with _ledger_lock:
+        if _ledger is None:
+            _ledger = UsageLedger()
+        return _ledger
+
+
+def main() -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Consumo token degli agenti")
+    subcommands = parser.add_subparsers(dest="command", required=True)
+    export = subcommands.add_parser("export", help="Esporta i consumi per turno in CSV")
+    export.add_argument("path")
+    export.add_argument("--app", default=None, help="Solo questa app")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        rows = get_usage_ledger().export_csv(args.path, app_name=args.app)
+        print(f"{rows} turni esportati in {args.path}")
+
+
+if __name__ == "__main__":
+    main()
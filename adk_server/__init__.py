@@ -0,0 +1,3 @@
+"""
+adk_server - Stand-in locale di `adk api_server` per gli agenti di questo repo.
+"""
@@ -0,0 +1,76 @@
+"""
+Avvia lo stand-in server: python -m adk_server [--port 8000] [--agents-dir .]
+"""
+
+import argparse
+import os
+
+import uvicorn
+
+from adk_server.agent_registry import AGENT_IDLE_TTL, PREWARM_APPS, AgentRegistry
+from adk_server.app import create_app
+from adk_server.session_lifecycle import (
+    MAX_SESSIONS_PER_USER,
+    SESSION_IDLE_TTL,
+    SESSION_MEMORY_BUDGET,
+    SWEEP_INTERVAL,
+    ManagedSessionService,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in locale di adk api_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--agents-dir", default=".", help="Cartella con i package degli agenti")
+    parser.add_argument(
+        "--compression-min-size",
+        type=int,
+        default=1024,
+        help="Risposte più piccole (byte) non vengono compresse (default: 1024)"
+    )
+    parser.add_argument("--session-ttl", type=float, default=SESSION_IDLE_TTL, help="Secondi di inattività prima di eliminare una sessione")
+    parser.add_argument("--max-sessions-per-user", type=int, default=MAX_SESSIONS_PER_USER)
+    parser.add_argument(
+        "--session-memory-mb",
+        type=float,
+        default=SESSION_MEMORY_BUDGET / (1024 * 1024),
+        help="Budget di memoria stimato per tutte le sessioni"
+    )
+    parser.add_argument("--sweep-interval", type=float, default=SWEEP_INTERVAL)
+    parser.add_argument(
+        "--prewarm",
+        default=",".join(PREWARM_APPS),
+        help="App da caricare all'avvio, separate da virgola (es. simple_agent,agent_approval)"
+    )
+    parser.add_argument(
+        "--agent-idle-ttl",
+        type=float,
+        default=AGENT_IDLE_TTL,
+        help="Secondi di inattività prima di scaricare un agente (0 = mai)"
+    )
+    args = parser.parse_args()
+
+    session_service = ManagedSessionService(
+        idle_ttl=args.session_ttl,
+        max_sessions_per_user=args.max_sessions_per_user,
+        memory_budget_bytes=int(args.session_memory_mb * 1024 * 1024),
+    )
+    registry = AgentRegistry(
+        os.path.abspath(args.agents_dir),
+        session_service,
+        prewarm=[name.strip() for name in args.prewarm.split(",") if name.strip()],
+        idle_ttl=args.agent_idle_ttl,
+    )
+    app = create_app(
+        agents_dir=args.agents_dir,
+        compression_min_size=args.compression_min_size,
+        session_service=session_service,
+        sweep_interval=args.sweep_interval,
+        registry=registry,
+    )
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Registry pigro degli agenti per adk_server.
+
+Il nome di un'app è risolto nel package omonimo sotto agents_dir solo al
+primo uso: import del modulo, costruzione di root_agent e del Runner
+avvengono in un thread, così il primo turno di un'app fredda non blocca le
+richieste alle altre. Poi il Runner resta caldo in memoria.
+
+- ADK_PREWARM_APPS="simple_agent,agent_approval": app caricate all'avvio,
+  prima che il server accetti traffico, e mai scaricate
+- ADK_AGENT_IDLE_TTL: secondi senza richieste dopo cui un'app viene
+  scaricata (Runner e moduli del package);
+  default 0 = mai. Gli stream già in corso tengono il loro Runner fino alla
+  fine; la richiesta successiva ricarica l'app.
+
+Risorse dell'agente (pool di thread o processi dei tool, connessioni): se il
+modulo `<app>.agent` o il package `<app>` definisce una funzione
+`shutdown()`, lo scaricamento la chiama prima di rimuovere i moduli.
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from google.adk.cli.utils import envs
+from google.adk.cli.utils.agent_loader import AgentLoader
+from google.adk.runners import Runner
+from google.adk.sessions import BaseSessionService
+
+from adk_common.metrics import counter, histogram
+
+logger = logging.getLogger(__name__)
+
+PREWARM_APPS = [name.strip() for name in os.environ.get("ADK_PREWARM_APPS", "").split(",") if name.strip()]
+AGENT_IDLE_TTL = float(os.environ.get("ADK_AGENT_IDLE_TTL", "0"))
+
+AGENT_LOADS = counter("adk_agent_loads_total", "Caricamenti di agenti (import + costruzione Runner)", ("app",))
+AGENT_UNLOADS = counter("adk_agent_unloads_total", "App scaricate per inattività", ("app",))
+AGENT_LOAD_DURATION = histogram(
+    "adk_agent_load_seconds", "Durata del caricamento di un agente", ("app",),
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+
+
+class AgentRegistry:
+    """
+    Runner per nome di app, costruiti al primo uso.
+
+    Uso:
+        registry = AgentRegistry(agents_dir, session_service)
+        runner = await registry.get_runner("simple_agent")
+    """
+
+    def __init__(self, agents_dir: str, session_service: BaseSessionService,
+                 prewarm: Iterable[str] = PREWARM_APPS, idle_ttl: float = AGENT_IDLE_TTL,
+                 clock: Callable[[], float] = time.monotonic):
+        self.agents_dir = agents_dir
+        self.session_service = session_service
+        self.prewarm = list(prewarm)
+        self.idle_ttl = idle_ttl
+        self._clock = clock
+        self._runners: Dict[str, Runner] = {}
+        self._last_used: Dict[str, float] = {}
+        self._loading: Dict[str, "asyncio.Task[Runner]"] = {}
+
+    @property
+    def loaded_apps(self) -> List[str]:
+        return sorted(self._runners)
+
+    def _build(self, app_name: str) -> Runner:
+        envs.load_dotenv_for_agent(os.path.basename(app_name), self.agents_dir)
+        # Un AgentLoader per caricamento: la sua cache non ha un'API per
+        # scaricare un'app, l'unica cache degli agenti è _runners
+        agent = AgentLoader(self.agents_dir).load_agent(app_name)
+        return Runner(app_name=app_name, agent=agent, session_service=self.session_service)
+
+    async def _load(self, app_name: str) -> Runner:
+        started = time.perf_counter()
+        # Import e costruzione in un thread: l'event loop continua a servire le altre app
+        runner = await asyncio.to_thread(self._build, app_name)
+        elapsed = time.perf_counter() - started
+        AGENT_LOADS.labels(app=app_name).inc()
+        AGENT_LOAD_DURATION.labels(app=app_name).observe(elapsed)
+        logger.info("Agente %s caricato in %.2fs", app_name, elapsed)
+        self._runners[app_name] = runner
+        return runner
+
+    async def get_runner(self, app_name: str) -> Runner:
+        self._last_used[app_name] = self._clock()
+        runner = self._runners.get(app_name)
+        if runner is not None:
+            return runner
+        # Richieste concorrenti per la stessa app fredda aspettano lo stesso caricamento
+        task = self._loading.get(app_name)
+        if task is None:
+            task = self._loading[app_name] = asyncio.ensure_future(self._load(app_name))
+            task.add_done_callback(lambda _: self._loading.pop(app_name, None))
+        return await asyncio.shield(task)
+
+    async def warm_up(self) -> None:
+        """Carica le app di ADK_PREWARM_APPS (gli errori non bloccano l'avvio)"""
+        for app_name in self.prewarm:
+            try:
+                await self.get_runner(app_name)
+            except Exception as e:
+                logger.exception("Pre-warm di %s fallito: %s", app_name, e)
+
+    def unload(self, app_name: str) -> None:
+        self._runners.pop(app_name, None)
+        self._last_used.pop(app_name, None)
+        package = os.path.basename(app_name)
+        self._shutdown_agent(package)
+        # Senza i moduli del package gli oggetti dell'agente possono essere liberati
+        for module_name in [name for name in sys.modules if name == package or name.startswith(f"{package}.")]:
+            del sys.modules[module_name]
+        AGENT_UNLOADS.labels(app=app_name).inc()
+        logger.info("Agente %s scaricato per inattività", app_name)
+
+    def _shutdown_agent(self, package: str) -> None:
+        """Chiama lo shutdown() dell'agente, se c'è: un errore non blocca lo scaricamento"""
+        for module_name in (f"{package}.agent", package):
+            shutdown = getattr(sys.modules.get(module_name), "shutdown", None)
+            if callable(shutdown):
+                try:
+                    shutdown()
+                except Exception:
+                    logger.exception("Errore nello shutdown dell'agente %s", package)
+                return
+
+    def unload_idle(self) -> List[str]:
+        if self.idle_ttl <= 0:
+            return []
+        now = self._clock()
+        idle = [
+            app_name for app_name in self._runners
+            if app_name not in self.prewarm and app_name not in self._loading
+            and now - self._last_used.get(app_name, now) >= self.idle_ttl
+        ]
+        for app_name in idle:
+            self.unload(app_name)
+        return idle
+
+    async def run_sweeper(self, interval: Optional[float] = None) -> None:
+        if self.idle_ttl <= 0:
+            return
+        interval = interval or max(self.idle_ttl / 4, 1)
+        while True:
+            await asyncio.sleep(interval)
+            self.unload_idle()
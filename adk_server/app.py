@@ -0,0 +1,290 @@
+"""
+Stand-in locale di `adk api_server`.
+
+Espone lo stesso sottoinsieme di endpoint usato dalle app Streamlit
+(/list-apps, sessioni, /run, /run_sse, websocket /run_live) con lo stesso
+formato JSON, più /healthz per la readiness probe dei client, ma
+costruito qui: così possiamo aggiungere funzionalità lato server
+(compressione, ciclo di vita delle sessioni, ...) senza toccare google.adk.
+
+Avvio: python -m adk_server --port 8000
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Callable, Dict, List, Literal, Optional
+
+from fastapi import FastAPI, HTTPException, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from google.adk.agents import LiveRequest, LiveRequestQueue, RunConfig
+from google.adk.agents.run_config import StreamingMode
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+from pydantic import BaseModel
+
+from adk_common.approvals import APPROVAL_TOOL_NAME, expired_response
+from adk_common.metrics import CONTENT_TYPE, REGISTRY
+from adk_common.tracing import setup_tracing
+from adk_server.agent_registry import AgentRegistry
+from adk_server.approval_expiry import ApprovalExpiryScheduler, PendingApproval, approval_status
+from adk_server.compression import CompressionMiddleware
+from adk_server.fair_queue import FairScheduler, Overloaded, admission_key
+from adk_server.server_metrics import (
+    ACTIVE_SESSIONS, APPROVAL_DECISIONS_TOTAL, LIVE_CONNECTIONS, PENDING_APPROVALS, RunMetricsMiddleware,
+    install_tool_metrics, on_event,
+)
+from adk_server.session_lifecycle import SWEEP_INTERVAL, ManagedSessionService
+from adk_server.trace_context import TraceContextMiddleware
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRunRequest(BaseModel):
+    """Body di /run e /run_sse (come in google.adk.cli.fast_api)"""
+    app_name: str
+    user_id: str
+    session_id: str
+    new_message: types.Content
+    streaming: bool = False
+
+
+class _AdmittedStreamingResponse(StreamingResponse):
+    """Stream SSE che restituisce lo slot di ammissione quando finisce, anche se il client si disconnette"""
+
+    def __init__(self, *args, on_close: Callable[[], None], **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+
+def too_many_requests(error: Overloaded) -> HTTPException:
+    return HTTPException(status_code=429, detail=error.reason, headers={"Retry-After": str(error.retry_after)})
+
+
+def create_app(agents_dir: str = ".", compression_min_size: int = 1024,
+               session_service: Optional[ManagedSessionService] = None,
+               sweep_interval: float = SWEEP_INTERVAL,
+               admission: Optional[FairScheduler] = None,
+               registry: Optional[AgentRegistry] = None) -> FastAPI:
+    """
+    Crea l'app FastAPI.
+
+    Args:
+        agents_dir: Cartella che contiene i package degli agenti (simple_agent, agent_approval, ...)
+        compression_min_size: Sotto questa dimensione (byte) le risposte non vengono compresse
+        session_service: Servizio sessioni con TTL/limiti (default: configurato da variabili ADK_SESSION_*)
+        sweep_interval: Secondi tra due passate dello sweeper delle sessioni
+        admission: Controllo di ammissione di /run e /run_sse (default: configurato da variabili ADK_ADMISSION_*)
+        registry: Registry degli agenti (default: ADK_PREWARM_APPS / ADK_AGENT_IDLE_TTL)
+    """
+    agents_dir = os.path.abspath(agents_dir)
+    setup_tracing("adk-server")
+    install_tool_metrics()
+    session_service = session_service or ManagedSessionService()
+    # Il websocket /run_live resta fuori: è una connessione lunga, non un turno
+    admission = admission or FairScheduler()
+    # Agenti e Runner costruiti al primo uso (ADK_PREWARM_APPS all'avvio, ADK_AGENT_IDLE_TTL per scaricarli)
+    registry = registry or AgentRegistry(agents_dir, session_service)
+
+    async def expire_approval(pending: PendingApproval) -> None:
+        """Approval scaduto: functionResponse di rifiuto all'agente, che chiude il flusso"""
+        session = await session_service.get_session(
+            app_name=pending.app_name, user_id=pending.user_id, session_id=pending.session_id
+        )
+        if session is None:
+            return  # sessione già eliminata (TTL, budget, DELETE)
+        APPROVAL_DECISIONS_TOTAL.labels(decision="expired").inc()
+        rejection = types.Content(role="user", parts=[types.Part(function_response=types.FunctionResponse(
+            id=pending.call_id, name=APPROVAL_TOOL_NAME, response=expired_response(pending.expires_at),
+        ))])
+        async for _ in (await registry.get_runner(pending.app_name)).run_async(
+            user_id=pending.user_id, session_id=pending.session_id, new_message=rejection
+        ):
+            pass
+
+    approval_scheduler = ApprovalExpiryScheduler(expire_approval)
+    session_service.event_listeners.append(approval_scheduler.on_event)
+    session_service.event_listeners.append(on_event)
+    ACTIVE_SESSIONS.set_function(lambda: session_service.session_count)
+    PENDING_APPROVALS.set_function(lambda: approval_scheduler.pending_count)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Il server accetta traffico solo dopo il pre-warm
+        await registry.warm_up()
+        tasks = [
+            asyncio.create_task(session_service.run_sweeper(sweep_interval)),
+            asyncio.create_task(approval_scheduler.run()),
+            asyncio.create_task(registry.run_sweeper()),
+        ]
+        try:
+            yield
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    app = FastAPI(title="ADK stand-in server", lifespan=lifespan)
+    app.add_middleware(RunMetricsMiddleware)
+    app.add_middleware(CompressionMiddleware, minimum_size=compression_min_size)
+    # Aggiunto per ultimo = più esterno: lo span copre anche la compressione
+    app.add_middleware(TraceContextMiddleware)
+
+    async def require_session(app_name: str, user_id: str, session_id: str) -> Session:
+        session = await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return session
+
+    @app.get("/healthz")
+    def healthz() -> Dict[str, Any]:
+        """Readiness probe per i client (circuit breaker di adk_common.client)"""
+        return {
+            "status": "ok",
+            "sessions": session_service.session_count,
+            "pending_approvals": approval_scheduler.pending_count,
+            "admission": {"in_flight": admission.in_flight, "queued": admission.queued},
+            "loaded_apps": registry.loaded_apps,
+        }
+
+    @app.get("/metrics")
+    def metrics() -> PlainTextResponse:
+        """Scrape endpoint Prometheus"""
+        return PlainTextResponse(REGISTRY.expose(), media_type=CONTENT_TYPE)
+
+    @app.get("/list-apps")
+    def list_apps() -> List[str]:
+        return sorted(
+            entry.name for entry in os.scandir(agents_dir)
+            if entry.is_dir() and not entry.name.startswith((".", "__"))
+        )
+
+    @app.get("/apps/{app_name}/users/{user_id}/sessions/{session_id}", response_model_exclude_none=True)
+    async def get_session(app_name: str, user_id: str, session_id: str) -> Session:
+        return await require_session(app_name, user_id, session_id)
+
+    @app.get("/apps/{app_name}/users/{user_id}/sessions/{session_id}/approval")
+    async def get_approval_status(app_name: str, user_id: str, session_id: str) -> Dict[str, Any]:
+        """Stato dell'ultimo approval della sessione, per le app in attesa di una decisione"""
+        return approval_status(await require_session(app_name, user_id, session_id))
+
+    @app.post("/apps/{app_name}/users/{user_id}/sessions/{session_id}", response_model_exclude_none=True)
+    async def create_session_with_id(
+        app_name: str, user_id: str, session_id: str, state: Optional[Dict[str, Any]] = None
+    ) -> Session:
+        if await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id):
+            raise HTTPException(status_code=400, detail=f"Session already exists: {session_id}")
+        return await session_service.create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+
+    @app.post("/apps/{app_name}/users/{user_id}/sessions", response_model_exclude_none=True)
+    async def create_session(app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None) -> Session:
+        return await session_service.create_session(app_name=app_name, user_id=user_id, state=state)
+
+    @app.delete("/apps/{app_name}/users/{user_id}/sessions/{session_id}")
+    async def delete_session(app_name: str, user_id: str, session_id: str):
+        await session_service.delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+
+    @app.post("/run", response_model_exclude_none=True)
+    async def agent_run(req: AgentRunRequest) -> List[Event]:
+        await require_session(req.app_name, req.user_id, req.session_id)
+        runner = await registry.get_runner(req.app_name)
+        try:
+            async with admission.slot(admission_key(req.app_name, req.user_id)):
+                return [
+                    event
+                    async for event in runner.run_async(
+                        user_id=req.user_id, session_id=req.session_id, new_message=req.new_message
+                    )
+                ]
+        except Overloaded as e:
+            raise too_many_requests(e)
+
+    @app.post("/run_sse")
+    async def agent_run_sse(req: AgentRunRequest) -> StreamingResponse:
+        await require_session(req.app_name, req.user_id, req.session_id)
+        # Ammissione prima di rispondere: il 429 deve arrivare prima dello stream
+        try:
+            await admission.acquire(admission_key(req.app_name, req.user_id))
+        except Overloaded as e:
+            raise too_many_requests(e)
+        admitted_at = time.monotonic()
+
+        async def event_generator():
+            try:
+                runner = await registry.get_runner(req.app_name)
+                stream_mode = StreamingMode.SSE if req.streaming else StreamingMode.NONE
+                async for event in runner.run_async(
+                    user_id=req.user_id,
+                    session_id=req.session_id,
+                    new_message=req.new_message,
+                    run_config=RunConfig(streaming_mode=stream_mode),
+                ):
+                    yield f"data: {event.model_dump_json(exclude_none=True, by_alias=True)}\n\n"
+            except Exception as e:
+                logger.exception("Errore in /run_sse: %s", e)
+                yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+        return _AdmittedStreamingResponse(
+            event_generator(), media_type="text/event-stream",
+            on_close=lambda: admission.release(time.monotonic() - admitted_at),
+        )
+
+    @app.websocket("/run_live")
+    async def agent_run_live(
+        websocket: WebSocket, app_name: str, user_id: str, session_id: str,
+        modalities: List[Literal["TEXT", "AUDIO"]] = Query(default=["TEXT"]),
+    ) -> None:
+        await websocket.accept()
+        if not await session_service.get_session(app_name=app_name, user_id=user_id, session_id=session_id):
+            # Si accetta prima, così il client distingue "sessione inesistente" da "server giù"
+            await websocket.close(code=1002, reason="Session not found")
+            return
+
+        live_request_queue = LiveRequestQueue()
+
+        async def forward_events():
+            runner = await registry.get_runner(app_name)
+            async for event in runner.run_live(
+                user_id=user_id,
+                session_id=session_id,
+                live_request_queue=live_request_queue,
+                run_config=RunConfig(response_modalities=modalities),
+            ):
+                await websocket.send_text(event.model_dump_json(exclude_none=True, by_alias=True))
+
+        async def process_messages():
+            while True:
+                request = LiveRequest.model_validate_json(await websocket.receive_text())
+                live_request_queue.send(request)
+                if request.close:
+                    return
+
+        tasks = [asyncio.create_task(forward_events()), asyncio.create_task(process_messages())]
+        LIVE_CONNECTIONS.inc()
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        try:
+            for task in done:
+                task.result()
+        except WebSocketDisconnect:
+            logger.info("Client live disconnesso (%s/%s)", user_id, session_id)
+        except Exception as e:
+            logger.exception("Errore in /run_live: %s", e)
+            # Il reason di un close frame è limitato a 123 byte
+            await websocket.close(code=1011, reason=str(e)[:123])
+        finally:
+            LIVE_CONNECTIONS.dec()
+            for task in pending:
+                task.cancel()
+
+    return app
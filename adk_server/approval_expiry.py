@@ -0,0 +1,141 @@
+"""
+Scadenza delle richieste di approval.
+
+Ogni functionResponse di request_human_approval con status "pending_approval"
+porta `expires_at` (vedi adk_common.approvals). Lo scheduler:
+
+- riceve gli eventi appesi alle sessioni (listener di ManagedSessionService)
+  e tiene un heap di deadline: niente scansione periodica delle sessioni
+- considera chiuso l'approval quando l'utente decide (si/no) o quando arriva
+  un'altra risposta del tool per la stessa chiamata
+- alla scadenza invoca `resolve`, che in adk_server manda all'agente una
+  functionResponse di rifiuto (status "rejected", reason "expired")
+
+Le entry dell'heap non vengono mai rimosse in mezzo: un approval chiuso
+resta nell'heap e viene scartato quando arriva in cima (lazy deletion).
+
+`approval_status` ricava dagli eventi della sessione lo stato dell'ultimo
+approval (pending / expired / closed): adk_server lo espone alle app, che
+così tolgono i pulsanti quando il server ha chiuso l'approval invece di
+confrontare la deadline con il proprio orologio.
+"""
+
+import asyncio
+import heapq
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+
+from adk_common.approvals import APPROVAL_DECISIONS, APPROVAL_TOOL_NAME
+
+logger = logging.getLogger(__name__)
+
+SessionKey = Tuple[str, str, str]
+
+
+@dataclass(order=True)
+class PendingApproval:
+    expires_at: float
+    app_name: str = field(compare=False)
+    user_id: str = field(compare=False)
+    session_id: str = field(compare=False)
+    call_id: str = field(compare=False)
+
+    @property
+    def key(self) -> SessionKey:
+        return self.app_name, self.user_id, self.session_id
+
+
+def approval_status(session: Session, now: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Stato dell'ultimo approval della sessione, dagli eventi più recenti:
+    "pending" (con expires_at e seconds_left calcolati con l'orologio del
+    server), "expired" (rifiutato dallo scheduler), "closed" (deciso
+    dall'utente o chiuso dal tool) oppure "none"
+    """
+    now = now if now is not None else time.time()
+    decided = False
+    for event in reversed(session.events):
+        for part in (event.content.parts if event.content and event.content.parts else []):
+            function_response = part.function_response
+            if function_response and function_response.name == APPROVAL_TOOL_NAME:
+                response = function_response.response or {}
+                status = {"call_id": function_response.id, "expires_at": response.get("expires_at"), "now": now}
+                if response.get("status") == "pending_approval" and not decided:
+                    expires_at = response.get("expires_at")
+                    return {**status, "status": "pending",
+                            "seconds_left": expires_at - now if expires_at else None}
+                if response.get("reason") == "expired":
+                    return {**status, "status": "expired", "message": response.get("message")}
+                return {**status, "status": "closed"}
+            if (part.text and event.author == "user"
+                    and part.text.strip().lower() in APPROVAL_DECISIONS):
+                decided = True
+    return {"status": "none", "now": now}
+
+
+class ApprovalExpiryScheduler:
+    """Heap di deadline degli approval aperti, al più uno per sessione"""
+
+    def __init__(self, resolve: Callable[[PendingApproval], Awaitable[None]]):
+        self.resolve = resolve
+        self._heap: List[PendingApproval] = []
+        self._open: Dict[SessionKey, PendingApproval] = {}
+        self._wakeup = asyncio.Event()
+
+    def on_event(self, session: Session, event: Event) -> None:
+        """Listener per ManagedSessionService.append_event"""
+        if not event.content or not event.content.parts:
+            return
+        key = (session.app_name, session.user_id, session.id)
+        for part in event.content.parts:
+            function_response = part.function_response
+            if function_response and function_response.name == APPROVAL_TOOL_NAME:
+                response = function_response.response or {}
+                if response.get("status") == "pending_approval" and response.get("expires_at"):
+                    pending = PendingApproval(float(response["expires_at"]), *key, function_response.id)
+                    self._open[key] = pending
+                    heapq.heappush(self._heap, pending)
+                    self._wakeup.set()
+                elif key in self._open and self._open[key].call_id == function_response.id:
+                    del self._open[key]
+            elif (part.text and event.author == "user"
+                  and part.text.strip().lower() in APPROVAL_DECISIONS):
+                self._open.pop(key, None)
+
+    def pop_expired(self, now: float) -> List[PendingApproval]:
+        expired = []
+        while self._heap and self._heap[0].expires_at <= now:
+            pending = heapq.heappop(self._heap)
+            if self._open.get(pending.key) is pending:
+                del self._open[pending.key]
+                expired.append(pending)
+        return expired
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._open)
+
+    async def run(self) -> None:
+        """Loop dello scheduler: dorme fino alla prossima deadline o a un nuovo approval"""
+        while True:
+            for pending in self.pop_expired(time.time()):
+                logger.info(
+                    "Approval %s scaduto (%s/%s/%s): rifiutato",
+                    pending.call_id, pending.app_name, pending.user_id, pending.session_id,
+                )
+                try:
+                    await self.resolve(pending)
+                except Exception as e:
+                    logger.exception("Errore chiudendo l'approval scaduto %s: %s", pending.call_id, e)
+
+            timeout = max(self._heap[0].expires_at - time.time(), 0) if self._heap else None
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,203 @@
+"""
+Middleware ASGI di compressione per lo stand-in server.
+
+- Risposte: br (se brotli è installato) o gzip secondo Accept-Encoding,
+  solo sopra `minimum_size` byte. Gli stream SSE non vengono compressi,
+  altrimenti il buffer del compressore ritarderebbe gli eventi.
+- Richieste: decomprime i body con Content-Encoding gzip/br, come quelli
+  inviati da adk_common.client con ADK_COMPRESS_REQUESTS=1.
+"""
+
+import zlib
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import PlainTextResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Limite al body decompresso, contro le "zip bomb"
+MAX_DECOMPRESSED_BODY = 32 * 1024 * 1024
+_BROTLI_INPUT_CHUNK = 64 * 1024
+
+_UNCOMPRESSED_CONTENT_TYPES = ("text/event-stream",)
+
+
+def choose_encoding(accept_encoding: str):
+    """Sceglie la codifica preferita tra quelle accettate dal client"""
+    accepted = {item.split(";")[0].strip().lower() for item in accept_encoding.split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=4)
+            self._compress = self._compressor.process
+            self._flush = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            self._compress = self._compressor.compress
+            self._flush = self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._flush()
+
+
+def _brotli_decompress(body: bytes) -> bytes:
+    """Decomprime a blocchi: il limite vale su ogni blocco prodotto, non solo sul totale finale"""
+    decompressor = brotli.Decompressor()
+    chunks = []
+    remaining = MAX_DECOMPRESSED_BODY + 1
+    for start in range(0, len(body), _BROTLI_INPUT_CHUNK):
+        data = decompressor.process(body[start:start + _BROTLI_INPUT_CHUNK], output_buffer_limit=remaining)
+        while True:
+            chunks.append(data)
+            remaining -= len(data)
+            if remaining <= 0:
+                raise OverflowError("body decompresso troppo grande")
+            if decompressor.can_accept_more_data():
+                break
+            # Output fermato al limite del buffer: il resto esce con input vuoto
+            data = decompressor.process(b"", output_buffer_limit=remaining)
+    return b"".join(chunks)
+
+
+def _decompress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        if brotli is None:
+            raise ValueError("brotli non installato")
+        data = _brotli_decompress(body)
+    else:
+        decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+        data = decompressor.decompress(body, MAX_DECOMPRESSED_BODY + 1)
+    if len(data) > MAX_DECOMPRESSED_BODY:
+        raise OverflowError("body decompresso troppo grande")
+    return data
+
+
+class CompressionMiddleware:
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("content-encoding", "").lower()
+        if content_encoding in ("gzip", "br"):
+            try:
+                scope, receive = await self._decompressed_request(scope, receive, content_encoding)
+            except OverflowError as e:
+                await PlainTextResponse(str(e), status_code=413)(scope, receive, send)
+                return
+            except Exception as e:
+                # zlib.error, brotli.error, ValueError: body corrotto o codifica non supportata
+                await PlainTextResponse(f"Body compresso non valido: {e}", status_code=400)(scope, receive, send)
+                return
+
+        encoding = choose_encoding(headers.get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressingResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+    async def _decompressed_request(self, scope, receive, encoding):
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        body = _decompress(b"".join(chunks), encoding)
+
+        scope = dict(scope)
+        scope["headers"] = list(scope["headers"])
+        request_headers = MutableHeaders(scope=scope)
+        del request_headers["content-encoding"]
+        request_headers["content-length"] = str(len(body))
+
+        sent = False
+
+        async def decompressed_receive():
+            nonlocal sent
+            if sent:
+                return await receive()
+            sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        return scope, decompressed_receive
+
+
+class _CompressingResponder:
+    """Intercetta i messaggi http.response.* e comprime il body se conviene"""
+
+    def __init__(self, send, encoding: str, minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self._start_message = None
+        self._compressor = None
+        self._passthrough = False
+
+    async def send(self, message):
+        message_type = message["type"]
+        if message_type == "http.response.start":
+            self._start_message = message
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            if "content-encoding" in headers or content_type.startswith(_UNCOMPRESSED_CONTENT_TYPES):
+                self._passthrough = True
+                await self._send(message)
+            return
+
+        if message_type != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self._start_message is not None:
+            start_message, self._start_message = self._start_message, None
+            headers = MutableHeaders(raw=start_message["headers"])
+
+            if not more_body and len(body) < self.minimum_size:
+                self._passthrough = True
+                await self._send(start_message)
+                await self._send(message)
+                return
+
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            self._compressor = _Compressor(self.encoding)
+
+            if not more_body:
+                body = self._compressor.compress(body) + self._compressor.finish()
+                headers["Content-Length"] = str(len(body))
+                await self._send(start_message)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+
+            # Body in streaming: lunghezza finale non nota
+            del headers["Content-Length"]
+            await self._send(start_message)
+
+        chunk = self._compressor.compress(body)
+        if not more_body:
+            chunk += self._compressor.finish()
+        await self._send({"type": "http.response.body", "body": chunk, "more_body": more_body})
@@ -0,0 +1,183 @@
+"""
+Controllo di ammissione lato server per /run e /run_sse.
+
+Il limiter dei client (adk_common.admission) protegge il singolo processo
+Streamlit, non il server: un utente che tempesta "Trasferimento" da un'app
+di test può occupare tutta la concorrenza. Qui:
+
+- al più ADK_ADMISSION_CONCURRENCY esecuzioni dell'agente in corso
+- chi eccede aspetta in una coda per chiave (utente, app o entrambi:
+  ADK_ADMISSION_KEY = user | app | app_user, default user)
+- gli slot liberi vanno alla coda con il tempo virtuale più basso
+  (weighted fair queuing): ogni ammissione costa 1/peso alla chiave, quindi
+  a parità di peso si alternano round-robin, e un utente con tante
+  richieste non ritarda quelli con una sola
+- code piene (ADK_ADMISSION_QUEUE_PER_KEY per chiave, ADK_ADMISSION_QUEUE_TOTAL
+  in totale) -> 429 immediato con Retry-After stimato dal tempo medio di
+  servizio
+
+Pesi: ADK_ADMISSION_WEIGHTS="qa_bot=0.25,alice=2" (chiave=peso, default 1).
+"""
+
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from adk_common.metrics import counter, gauge, histogram
+
+ADMISSION_CONCURRENCY = int(os.environ.get("ADK_ADMISSION_CONCURRENCY", "8"))
+ADMISSION_QUEUE_PER_KEY = int(os.environ.get("ADK_ADMISSION_QUEUE_PER_KEY", "4"))
+ADMISSION_QUEUE_TOTAL = int(os.environ.get("ADK_ADMISSION_QUEUE_TOTAL", "64"))
+ADMISSION_KEY = os.environ.get("ADK_ADMISSION_KEY", "user")
+
+
+def _parse_weights(spec: str) -> Dict[str, float]:
+    weights = {}
+    for item in spec.split(","):
+        key, _, weight = item.partition("=")
+        if key.strip() and weight.strip():
+            weights[key.strip()] = max(float(weight), 0.01)
+    return weights
+
+
+ADMISSION_WEIGHTS = _parse_weights(os.environ.get("ADK_ADMISSION_WEIGHTS", ""))
+
+ADMISSION_IN_FLIGHT = gauge("adk_admission_in_flight", "Esecuzioni dell'agente ammesse e in corso")
+ADMISSION_QUEUED = gauge("adk_admission_queued", "Richieste in coda di ammissione")
+ADMISSION_REJECTED = counter("adk_admission_rejected_total", "Richieste rifiutate con 429", ("reason",))
+ADMISSION_WAIT = histogram("adk_admission_wait_seconds", "Attesa in coda prima dell'ammissione")
+
+
+class Overloaded(Exception):
+    """Coda piena: rispondere 429 con Retry-After"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+@dataclass
+class _KeyQueue:
+    weight: float = 1.0
+    virtual_time: float = 0.0
+    waiters: Deque[asyncio.Future] = field(default_factory=deque)
+
+
+def admission_key(app_name: str, user_id: str, mode: str = ADMISSION_KEY) -> str:
+    if mode == "app":
+        return app_name
+    if mode == "app_user":
+        return f"{app_name}/{user_id}"
+    return user_id
+
+
+class FairScheduler:
+    """
+    Semaforo asyncio con code per chiave e weighted fair queuing.
+
+    Uso:
+        async with scheduler.slot(key):
+            ...  # esecuzione dell'agente
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_CONCURRENCY,
+                 max_queue_per_key: int = ADMISSION_QUEUE_PER_KEY,
+                 max_queue_total: int = ADMISSION_QUEUE_TOTAL,
+                 weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.max_queue_per_key = max_queue_per_key
+        self.max_queue_total = max_queue_total
+        self.weights = ADMISSION_WEIGHTS if weights is None else weights
+        self.in_flight = 0
+        self.queued = 0
+        self._queues: Dict[str, _KeyQueue] = {}
+        # Tempo virtuale globale: una chiave che torna attiva non recupera il tempo "perso"
+        self._virtual_time = 0.0
+        # Media mobile della durata di un'esecuzione, per il Retry-After
+        self._service_time = 1.0
+        ADMISSION_IN_FLIGHT.set_function(lambda: self.in_flight)
+        ADMISSION_QUEUED.set_function(lambda: self.queued)
+
+    def retry_after(self, queue_length: int) -> int:
+        """Secondi stimati prima che si liberi posto per `queue_length` richieste davanti"""
+        return max(1, math.ceil(self._service_time * (queue_length + 1) / self.max_concurrency))
+
+    def _queue_for(self, key: str) -> _KeyQueue:
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = _KeyQueue(weight=self.weights.get(key, 1.0))
+        return queue
+
+    def _charge(self, queue: _KeyQueue) -> None:
+        queue.virtual_time = max(queue.virtual_time, self._virtual_time) + 1 / queue.weight
+
+    def _dispatch(self) -> None:
+        """Assegna gli slot liberi alle code con tempo virtuale più basso"""
+        while self.in_flight < self.max_concurrency:
+            active = [(key, queue) for key, queue in self._queues.items() if queue.waiters]
+            if not active:
+                return
+            key, queue = min(active, key=lambda item: max(item[1].virtual_time, self._virtual_time))
+            waiter = queue.waiters.popleft()
+            self.queued -= 1
+            if waiter.done():
+                continue  # richiesta cancellata (client disconnesso) non ancora ripulita da acquire
+            self._virtual_time = max(self._virtual_time, queue.virtual_time)
+            self._charge(queue)
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    async def acquire(self, key: str) -> None:
+        if self.in_flight < self.max_concurrency and self.queued == 0:
+            self.in_flight += 1
+            return
+        queue = self._queue_for(key)
+        if len(queue.waiters) >= self.max_queue_per_key:
+            ADMISSION_REJECTED.labels(reason="key_queue_full").inc()
+            raise Overloaded(f"Troppe richieste in coda per {key}", self.retry_after(self.queued))
+        if self.queued >= self.max_queue_total:
+            ADMISSION_REJECTED.labels(reason="queue_full").inc()
+            raise Overloaded("Server saturo", self.retry_after(self.queued))
+
+        waiter = asyncio.get_running_loop().create_future()
+        queue.waiters.append(waiter)
+        self.queued += 1
+        started = time.monotonic()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # Ammessa proprio mentre veniva cancellata: restituisce lo slot
+                self.release()
+            elif waiter in queue.waiters:
+                queue.waiters.remove(waiter)
+                self.queued -= 1
+            # altrimenti _dispatch l'ha già tolta dalla coda scartandola
+            raise
+        finally:
+            ADMISSION_WAIT.observe(time.monotonic() - started)
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        self.in_flight -= 1
+        if service_time is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * service_time
+        self._dispatch()
+        if self.queued == 0:
+            # Senza code la storia non conta: si riparte da zero alla prossima contesa
+            self._queues.clear()
+            self._virtual_time = 0.0
+
+    @asynccontextmanager
+    async def slot(self, key: str) -> AsyncIterator[None]:
+        await self.acquire(key)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
@@ -0,0 +1,116 @@
+"""
+Metriche lato server, esposte da adk_server su GET /metrics.
+
+Si raccolgono senza toccare gli agenti:
+- RunMetricsMiddleware: durata e status di /run e /run_sse (stream compreso)
+- on_event (listener di ManagedSessionService): turni, richieste di approval
+  per risk_level, decisioni, token di prompt e token serviti dalla cache
+- ToolMetricsSpanProcessor: invocazioni e durata di ogni tool, dagli span
+  "execute_tool <nome>" che ADK apre attorno a ogni chiamata
+"""
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+from opentelemetry import trace
+from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+from opentelemetry.trace import StatusCode
+
+from adk_common.approvals import APPROVAL_DECISIONS, APPROVAL_TOOL_NAME
+from adk_common.metrics import RUN_DURATION, RUN_REQUESTS, TURNS, counter, gauge, histogram
+
+TOOL_CALLS = counter("adk_tool_calls_total", "Invocazioni dei tool", ("tool", "status"))
+TOOL_DURATION = histogram(
+    "adk_tool_duration_seconds", "Durata delle invocazioni dei tool", ("tool",),
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+APPROVAL_REQUESTS = counter("adk_approval_requests_total", "Richieste di approval", ("risk_level",))
+APPROVAL_DECISIONS_TOTAL = counter("adk_approval_decisions_total", "Decisioni sugli approval", ("decision",))
+PENDING_APPROVALS = gauge("adk_pending_approvals", "Approval in attesa di decisione")
+ACTIVE_SESSIONS = gauge("adk_active_sessions", "Sessioni in memoria")
+LIVE_CONNECTIONS = gauge("adk_live_connections", "Websocket /run_live aperti")
+PROMPT_TOKENS = counter("adk_prompt_tokens_total", "Token di prompt inviati al modello", ("app",))
+CACHED_PROMPT_TOKENS = counter(
+    "adk_cached_prompt_tokens_total", "Token di prompt serviti dalla cache del modello", ("app",)
+)
+
+_RUN_PATHS = frozenset({"/run", "/run_sse"})
+_TOOL_SPAN_PREFIX = "execute_tool "
+
+
+class RunMetricsMiddleware:
+    """Middleware ASGI: durata (fino all'ultimo byte) e status delle richieste agli agenti"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in _RUN_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            with RUN_DURATION.labels(path=path).time():
+                await self.app(scope, receive, send_with_status)
+        finally:
+            RUN_REQUESTS.labels(path=path, status=status).inc()
+
+
+def on_event(session: Session, event: Event) -> None:
+    """Listener per ManagedSessionService.append_event (solo eventi non parziali)"""
+    if event.usage_metadata:
+        PROMPT_TOKENS.labels(app=session.app_name).inc(event.usage_metadata.prompt_token_count or 0)
+        CACHED_PROMPT_TOKENS.labels(app=session.app_name).inc(event.usage_metadata.cached_content_token_count or 0)
+    if not event.content or not event.content.parts:
+        return
+    for part in event.content.parts:
+        if part.text and event.author == "user":
+            TURNS.labels(app=session.app_name).inc()
+            decision = part.text.strip().lower()
+            if decision in APPROVAL_DECISIONS:
+                APPROVAL_DECISIONS_TOTAL.labels(decision=decision).inc()
+        elif part.function_response and part.function_response.name == APPROVAL_TOOL_NAME:
+            response = part.function_response.response or {}
+            if response.get("status") == "pending_approval":
+                APPROVAL_REQUESTS.labels(risk_level=str(response.get("risk_level", "unknown")).lower()).inc()
+
+
+class ToolMetricsSpanProcessor(SpanProcessor):
+    """Conta e cronometra i tool dagli span di ADK"""
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if not span.name.startswith(_TOOL_SPAN_PREFIX) or span.name.endswith("(merged)"):
+            return
+        tool = span.name[len(_TOOL_SPAN_PREFIX):]
+        status = "error" if span.status.status_code is StatusCode.ERROR else "ok"
+        TOOL_CALLS.labels(tool=tool, status=status).inc()
+        if span.start_time and span.end_time:
+            TOOL_DURATION.labels(tool=tool).observe((span.end_time - span.start_time) / 1e9)
+
+
+_tool_metrics_installed = False
+
+
+def install_tool_metrics() -> None:
+    """
+    Aggancia ToolMetricsSpanProcessor al TracerProvider globale. Senza
+    tracing configurato (ADK_TRACING=0) installa un provider senza export,
+    così gli span dei tool esistono comunque.
+    """
+    global _tool_metrics_installed
+    if _tool_metrics_installed:
+        return
+    _tool_metrics_installed = True
+    provider = trace.get_tracer_provider()
+    if not isinstance(provider, TracerProvider):
+        provider = TracerProvider()
+        trace.set_tracer_provider(provider)
+    provider.add_span_processor(ToolMetricsSpanProcessor())
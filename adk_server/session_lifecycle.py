@@ -0,0 +1,142 @@
+"""
+Ciclo di vita delle sessioni in memoria.
+
+Ogni "Nuova Sessione" o reload di una app crea una sessione ADK nuova e
+InMemorySessionService non ne elimina mai nessuna. ManagedSessionService
+aggiunge:
+
+- TTL di inattività: le sessioni non usate da `idle_ttl` secondi vengono eliminate
+- limite per utente: oltre `max_sessions_per_user` si elimina la meno recente
+- budget globale di memoria: oltre `memory_budget_bytes` si eliminano le
+  sessioni meno recenti (LRU) finché si rientra
+
+La dimensione di una sessione è stimata sommando la lunghezza JSON dei suoi
+eventi al momento dell'append. Lo sweeper periodico (`run_sweeper`) applica
+TTL e budget; il limite per utente è applicato alla creazione.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+
+logger = logging.getLogger(__name__)
+
+SESSION_IDLE_TTL = float(os.environ.get("ADK_SESSION_IDLE_TTL", "3600"))
+MAX_SESSIONS_PER_USER = int(os.environ.get("ADK_MAX_SESSIONS_PER_USER", "10"))
+SESSION_MEMORY_BUDGET = int(float(os.environ.get("ADK_SESSION_MEMORY_BUDGET_MB", "512")) * 1024 * 1024)
+SWEEP_INTERVAL = float(os.environ.get("ADK_SESSION_SWEEP_INTERVAL", "60"))
+
+SessionKey = Tuple[str, str, str]
+
+
+class ManagedSessionService(InMemorySessionService):
+    """InMemorySessionService con TTL, limite per utente e budget di memoria"""
+
+    def __init__(self, idle_ttl: float = SESSION_IDLE_TTL, max_sessions_per_user: int = MAX_SESSIONS_PER_USER,
+                 memory_budget_bytes: int = SESSION_MEMORY_BUDGET):
+        super().__init__()
+        self.idle_ttl = idle_ttl
+        self.max_sessions_per_user = max_sessions_per_user
+        self.memory_budget_bytes = memory_budget_bytes
+        # Ordine = LRU (la meno recente in testa), valore = ultimo accesso
+        self._last_access: "OrderedDict[SessionKey, float]" = OrderedDict()
+        self._sizes: Dict[SessionKey, int] = {}
+        self.total_bytes = 0
+        # Chiamati a ogni evento appeso (non parziale), es. lo scheduler degli approval
+        self.event_listeners: List[Callable[[Session, Event], None]] = []
+
+    def _touch(self, key: SessionKey) -> None:
+        self._last_access[key] = time.monotonic()
+        self._last_access.move_to_end(key)
+
+    def _forget(self, key: SessionKey) -> None:
+        self._last_access.pop(key, None)
+        self.total_bytes -= self._sizes.pop(key, 0)
+
+    def _evict(self, key: SessionKey, reason: str) -> None:
+        app_name, user_id, session_id = key
+        logger.info("Sessione %s/%s/%s eliminata (%s)", app_name, user_id, session_id, reason)
+        self._delete_session_impl(app_name=app_name, user_id=user_id, session_id=session_id)
+        user_sessions = self.sessions.get(app_name, {})
+        if user_id in user_sessions and not user_sessions[user_id]:
+            del user_sessions[user_id]
+        self._forget(key)
+
+    async def create_session(self, *, app_name: str, user_id: str, state: Optional[Dict[str, Any]] = None,
+                             session_id: Optional[str] = None) -> Session:
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        key = (app_name, user_id, session.id)
+        self._sizes[key] = 0
+        self._touch(key)
+
+        # Limite per utente: elimina le sessioni meno recenti dello stesso utente
+        user_keys = [k for k in self._last_access if k[:2] == (app_name, user_id) and k != key]
+        excess = len(user_keys) + 1 - self.max_sessions_per_user
+        for old_key in user_keys[:max(excess, 0)]:
+            self._evict(old_key, "limite sessioni per utente")
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None) -> Optional[Session]:
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch((app_name, user_id, session_id))
+        return session
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._forget((app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        key = (session.app_name, session.user_id, session.id)
+        if key in self._sizes and not event.partial:
+            size = len(event.model_dump_json(exclude_none=True))
+            self._sizes[key] += size
+            self.total_bytes += size
+            self._touch(key)
+        if not event.partial:
+            for listener in self.event_listeners:
+                listener(session, event)
+        return event
+
+    def sweep(self) -> int:
+        """Applica TTL e budget di memoria; restituisce il numero di sessioni eliminate"""
+        evicted = 0
+        deadline = time.monotonic() - self.idle_ttl
+        # L'OrderedDict è in ordine LRU: ci si ferma alla prima sessione ancora attiva
+        while self._last_access:
+            key, last_access = next(iter(self._last_access.items()))
+            if last_access > deadline:
+                break
+            self._evict(key, "inattiva")
+            evicted += 1
+
+        while self._last_access and self.total_bytes > self.memory_budget_bytes:
+            self._evict(next(iter(self._last_access)), "budget di memoria")
+            evicted += 1
+        return evicted
+
+    @property
+    def session_count(self) -> int:
+        return len(self._last_access)
+
+    async def run_sweeper(self, interval: float = SWEEP_INTERVAL) -> None:
+        """Loop dello sweeper, da avviare come task in background"""
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.sweep()
+            if evicted:
+                logger.info(
+                    "Sweeper: %d sessioni eliminate, %d attive, %.1f MB stimati",
+                    evicted, self.session_count, self.total_bytes / (1024 * 1024),
+                )
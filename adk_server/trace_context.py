@@ -0,0 +1,41 @@
+"""
+Middleware ASGI che riprende la trace del client.
+
+Legge `traceparent` dalla richiesta (HTTP o websocket), apre uno span
+server figlio dello span client e lo rende corrente per tutta la durata
+della chiamata, stream SSE e websocket compresi: gli span di ADK e dei tool
+finiscono così nella trace dell'azione Streamlit che li ha causati.
+"""
+
+from opentelemetry import context as otel_context
+from opentelemetry import propagate
+from opentelemetry.trace import SpanKind
+
+from adk_common.tracing import record_status, tracer
+
+
+class TraceContextMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        carrier = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope["headers"]}
+        method = scope.get("method", "WEBSOCKET")
+        token = otel_context.attach(propagate.extract(carrier))
+        try:
+            with tracer.start_as_current_span(
+                f"{method} {scope['path']}", kind=SpanKind.SERVER,
+                attributes={"http.request.method": method, "url.path": scope["path"]},
+            ) as span:
+                async def send_with_status(message):
+                    if message["type"] == "http.response.start":
+                        record_status(span, message["status"])
+                    await send(message)
+
+                await self.app(scope, receive, send_with_status)
+        finally:
+            otel_context.detach(token)
@@ -2,21 +2,38 @@
 agent.py - Versione per Streamlit (SENZA input())
 """
 
+import logging
+import os
+import time
+
 from google.adk.agents import Agent
 from google.adk.tools import LongRunningFunctionTool
 from typing import Dict, Any
 
+from adk_common.approvals import approval_deadline
+from adk_common.context_window import ContextWindow
+from adk_common.fake_llm import resolve_model
+from adk_common.prompt_cache import PromptCache
+from adk_common.tracing import annotate, current_trace_id
+
+logger = logging.getLogger(__name__)
+
 def request_human_approval(action: str, details: str, risk_level: str = "medium") -> Dict[str, Any]:
     """
     Richiede approvazione umana per un'azione importante.
     VERSIONE STREAMLIT: Non usa input(), restituisce richiesta di approvazione
     """
-    print(f"\n🚨 RICHIESTA APPROVAZIONE UMANA")
-    print(f"Azione: {action}")
-    print(f"Dettagli: {details}")
-    print(f"Livello rischio: {risk_level}")
-    print("=" * 50)
-    print("⏳ In attesa di approvazione da interfaccia Streamlit...")
+    # Ora di creazione reale e scadenza in base al rischio: scaduta la deadline
+    # adk_server chiude la richiesta come rifiutata (vedi adk_server.approval_expiry)
+    created_at = time.time()
+    annotate(**{"approval.action": action, "approval.risk_level": risk_level})
+    # Log strutturato invece di print(): il trace id (campo trace_id) lo collega allo span
+    logger.info(
+        "🚨 Richiesta approvazione umana: %s (rischio %s), in attesa dell'interfaccia Streamlit",
+        action, risk_level,
+        extra={"trace_id": current_trace_id(), "approval_action": action,
+               "approval_details": details, "risk_level": risk_level},
+    )
     
     # NON usiamo input() - restituiamo immediatamente una richiesta di approvazione
     return {
@@ -27,15 +44,23 @@ def request_human_approval(action: str, details: str, risk_level: str = "medium"
         'message': f"🚨 Richiesta approvazione per: {action}",
         'needs_human_approval': True,
         'pending': True,
-        'timestamp': 'now'
+        'timestamp': created_at,
+        'expires_at': approval_deadline(risk_level, created_at)
     }
 
 # Creazione tool
 approval_tool = LongRunningFunctionTool(func=request_human_approval)
 
+# Finestra di contesto: le richieste di approval ancora aperte restano sempre intere
+context_window = ContextWindow(max_turns=int(os.environ.get("APPROVAL_AGENT_CONTEXT_TURNS", "10")))
+
+# Istruzioni e dichiarazione del tool sono uguali in ogni richiesta: prefisso in cache sul backend
+prompt_cache = PromptCache()
+
 # IMPORTANTE: La variabile DEVE chiamarsi 'root_agent'
+# APPROVAL_AGENT_MODEL=fake usa il modello finto deterministico (test e benchmark senza rete)
 root_agent = Agent(
-    model="gemini-2.0-flash",
+    model=prompt_cache.wrap(resolve_model("APPROVAL_AGENT_MODEL")),
     name="human_approval_agent",
     description="Agente che richiede approvazione umana per azioni importanti",
     instruction="""
@@ -76,5 +101,8 @@ root_agent = Agent(
     - Se "no": annulla l'azione e spiega che è stata annullata
     - Se "dettagli": fornisci più informazioni sull'azione
     """,
-    tools=[approval_tool]
+    tools=[approval_tool],
+    # prompt_cache per primo: ContextWindow vede se le istruzioni sono già in cache
+    before_model_callback=[prompt_cache.before_model_callback, context_window.before_model_callback],
+    after_model_callback=prompt_cache.after_model_callback,
 )
\ No newline at end of file
@@ -3,12 +3,30 @@ Streamlit UI completo con rilevamento approval STRUTTURATO CORRETTO
 Basato sulla struttura ADK reale scoperta tramite debug
 """
 
+import os
 import streamlit as st
-import requests
-import json
-import uuid
 import time
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Optional
+import sys
+from pathlib import Path
+
+# Rende importabile adk_common con `streamlit run <cartella>/<app>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from adk_common.admission import queue_indicator
+from adk_common.circuit import BackendTimeout, BackendUnavailable
+from adk_common.approvals import seconds_left, with_deadline
+from adk_common.client import describe_error, get_client
+from adk_common.decoding import StreamError
+from adk_common.event_store import EventRecorder
+from adk_common.live import close_live_session, live_session_for
+from adk_common.messages import ChatMessage, Role
+from adk_common.state_store import ChatState
+from adk_common.tracing import ui_action
+from adk_common.events import (
+    approval_from_event, create_rich_approval_message, detect_approval_structured, extract_assistant_message,
+)
+from adk_common.usage import BudgetStatus, TokenUsage, check_budget, get_usage_ledger
 
 # Set page config
 st.set_page_config(
@@ -21,32 +39,81 @@ st.set_page_config(
 API_BASE_URL = "http://localhost:8000"
 APP_NAME = "agent_approval"  # Cambia questo con il nome del tuo agente
 
+client = get_client(API_BASE_URL)
+usage_ledger = get_usage_ledger()
+
+# Ogni quanti secondi chiedere ad adk_server se l'approval aperto è ancora valido
+APPROVAL_POLL_INTERVAL = float(os.environ.get("ADK_APPROVAL_POLL_INTERVAL", "5"))
+
 # Initialize session state
-if "user_id" not in st.session_state:
-    st.session_state.user_id = f"user-{uuid.uuid4()}"
-if "session_id" not in st.session_state:
-    st.session_state.session_id = None
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "pending_approval" not in st.session_state:
-    st.session_state.pending_approval = False
-if "approval_details" not in st.session_state:
-    st.session_state.approval_details = None
+# user_id, session_id, messages, pending_approval, approval_details: ripristinati dal backend condiviso
+chat_state = ChatState(st.session_state, st.query_params, APP_NAME)
+if "last_turn_usage" not in st.session_state:
+    st.session_state.last_turn_usage = None
+if "live_mode" not in st.session_state:
+    st.session_state.live_mode = False
+if not st.session_state.live_mode:
+    # Live mode disattivata: il websocket e il thread reader non servono più
+    close_live_session(st.session_state)
+
+if "server_clock_offset" not in st.session_state:
+    st.session_state.server_clock_offset = 0.0
+
+@st.fragment(run_every=APPROVAL_POLL_INTERVAL)
+def watch_approval():
+    """
+    Stato dell'approval aperto secondo adk_server, a ogni rerun e ogni
+    APPROVAL_POLL_INTERVAL secondi anche senza interazioni: quando il server
+    lo ha chiuso (scaduto e rifiutato da adk_server.approval_expiry) si
+    tolgono i pulsanti e si avvisa. L'orologio locale non decide nulla.
+    """
+    if not st.session_state.pending_approval or not st.session_state.session_id:
+        return
+    status = client.approval_status(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+    if status is None:
+        return  # server non raggiungibile: l'approval resta com'è
+    # Countdown dei pulsanti con l'orologio del server
+    st.session_state.server_clock_offset = status["now"] - time.time()
+    if status["status"] == "pending":
+        return
+    chat_state.set_approval(False)
+    if status["status"] == "expired":
+        chat_state.append_message(ChatMessage(
+            Role.SYSTEM,
+            status.get("message") or "⌛ Richiesta di approvazione scaduta senza risposta: azione rifiutata automaticamente"
+        ))
+    # Rerun dell'intera app: spariscono pulsanti e badge "Approval Pending"
+    st.rerun()
 
+watch_approval()
+
+def record_usage(events) -> None:
+    """Salva i token consumati dal turno (usageMetadata degli eventi)"""
+    usage = TokenUsage.from_events(events)
+    st.session_state.last_turn_usage = usage
+    if usage.model_calls:
+        usage_ledger.record_turn(APP_NAME, st.session_state.user_id, st.session_state.session_id, usage)
+
+def session_budget_status() -> BudgetStatus:
+    if not st.session_state.session_id:
+        return BudgetStatus.OK
+    return check_budget(usage_ledger.totals(APP_NAME, st.session_state.user_id, st.session_state.session_id))
+
+@ui_action("create_session")
 def create_session():
     """Create a new session"""
     session_id = f"session-{int(time.time())}"
+    previous_session_id = st.session_state.session_id
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({})
+        response = client.post_json(
+            f"/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
+            {}
         )
         if response.status_code == 200:
-            st.session_state.session_id = session_id
-            st.session_state.messages = []
-            st.session_state.pending_approval = False
-            st.session_state.approval_details = None
+            chat_state.start_session(session_id)
+            # La sessione sostituita non serve più: il server può liberarne la memoria
+            if previous_session_id:
+                client.delete_session(APP_NAME, st.session_state.user_id, previous_session_id)
             return True
         else:
             st.error(f"Errore creazione sessione: {response.text}")
@@ -55,189 +122,194 @@ def create_session():
         st.error(f"Errore connessione: {e}")
         return False
 
-def detect_approval_structured(events) -> Tuple[bool, Optional[Dict[str, Any]]]:
-    """
-    🎯 RILEVAMENTO STRUTTURATO CORRETTO: Basato sulla struttura ADK reale
+def approval_panel(approval_details: Optional[Dict[str, Any]], disabled: bool = False,
+                   key_prefix: str = "") -> Optional[str]:
+    """Header dell'approval e pulsanti; restituisce la decisione cliccata (si/no/dettagli)"""
+    # Header con dettagli ricchi se disponibili
+    if approval_details:
+        risk = approval_details.get("risk_level", "medium").upper()
+        action = approval_details.get("action", "Azione")
+        risk_emoji = {"LOW": "🟢", "MEDIUM": "🟡", "HIGH": "🔴"}.get(risk, "⚠️")
+        st.error(f"🚨 **APPROVAZIONE RICHIESTA** - {action} ({risk_emoji} {risk})")
+    else:
+        st.error("🚨 **APPROVAZIONE RICHIESTA**")
     
-    Returns:
-        Tuple[bool, Optional[Dict]]: (approval_detected, approval_details)
-    """
-    approval_detected = False
-    approval_details = None
+    remaining = seconds_left(approval_details, now=time.time() + st.session_state.server_clock_offset)
+    if remaining is not None:
+        st.caption(f"⌛ Scade tra {int(remaining // 60)} min {int(remaining % 60)} s: poi viene rifiutata automaticamente")
     
-    for event in events:
-        if "content" in event and "parts" in event["content"]:
-            for part in event["content"]["parts"]:
-                
-                # ✅ METODO 1: functionCall (quando l'agente chiama il tool)
-                if "functionCall" in part:  # ← camelCase!
-                    function_call = part["functionCall"]
-                    # Controlliamo se ha i parametri dell'approval
-                    if "args" in function_call:
-                        args = function_call["args"]
-                        # Se ha action/details, probabilmente è approval
-                        if "action" in args or "details" in args:
-                            approval_detected = True
-                            approval_details = args
-                            break
-                
-                # ✅ METODO 2: functionResponse (risposta del tool - più preciso)
-                if "functionResponse" in part:  # ← camelCase!
-                    function_response = part["functionResponse"]
-                    if function_response.get("name") == "request_human_approval":
-                        approval_detected = True
-                        # I dettagli sono nella response
-                        approval_details = function_response.get("response", {})
-                        break
-        
-        # Se abbiamo trovato approval, interrompi
-        if approval_detected:
-            break
+    # Pulsanti approval
+    col1, col2, col3 = st.columns(3)
+    decision = None
     
-    return approval_detected, approval_details
+    with col1:
+        if st.button("✅ APPROVA", type="primary", use_container_width=True,
+                     disabled=disabled, key=f"{key_prefix}approve"):
+            decision = "si"
+    
+    with col2:
+        if st.button("❌ RIFIUTA", type="secondary", use_container_width=True,
+                     disabled=disabled, key=f"{key_prefix}reject"):
+            decision = "no"
+    
+    with col3:
+        if st.button("ℹ️ DETTAGLI", use_container_width=True,
+                     disabled=disabled, key=f"{key_prefix}details"):
+            decision = "dettagli"
+    
+    return decision
 
-def extract_assistant_message(events) -> str:
+def stream_turn(text: str):
     """
-    Estrae il messaggio dell'assistente dagli eventi
+    Eventi (ridotti) del turno appena arrivano, chunk parziali compresi:
+    connessione live oppure /run_sse. Gli eventi interi vanno direttamente
+    nel log eventi, uno alla volta.
     """
-    assistant_message = ""
-    
-    for event in events:
-        # Cerca messaggi del modello
-        if (event.get("content", {}).get("role") == "model" and 
-            "parts" in event.get("content", {})):
-            parts = event["content"]["parts"]
-            for part in parts:
-                if "text" in part:
-                    assistant_message = part["text"]
-                    break
-            if assistant_message:
-                break
+    recorder = EventRecorder(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+    if st.session_state.live_mode:
+        # Il recorder resta legato alla connessione: un batch del log per turno
+        live = live_session_for(st.session_state, API_BASE_URL, APP_NAME, on_event=recorder)
+        # Eventi arrivati tra un turno e l'altro (iniziativa dell'agente)
+        yield from live.drain()
+        live.send_text(text)
+        yield from live.iter_turn()
+        return
     
-    return assistant_message
+    response = client.post_json(
+        "/run_sse",
+        {
+            "app_name": APP_NAME,
+            "user_id": st.session_state.user_id,
+            "session_id": st.session_state.session_id,
+            "new_message": {
+                "role": "user",
+                "parts": [{"text": text}]
+            },
+            "streaming": True
+        },
+        stream=True,
+        on_wait=queue_indicator(st.empty())
+    )
+    if response.status_code != 200:
+        raise StreamError(describe_error(response))
+    yield from client.iter_events(response, sse=True, on_event=recorder)
 
-def create_rich_approval_message(approval_details: Optional[Dict[str, Any]]) -> str:
+def consume_turn(text: str) -> List[Dict[str, Any]]:
     """
-    Crea un messaggio di approval ricco di dettagli REALI
+    Consuma il turno mentre è ancora in corso: la card di approval compare
+    appena arriva la functionCall, il testo dell'assistente si aggiorna chunk
+    per chunk. Restituisce gli eventi finali (senza chunk parziali), come /run.
     """
-    if not approval_details:
-        return "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
-    
-    # Estrai dettagli reali dall'ADK
-    action = approval_details.get("action", "Azione sconosciuta")
-    details = approval_details.get("details", "Nessun dettaglio disponibile")
-    risk_level = approval_details.get("risk_level", "medium")
-    status = approval_details.get("status", "pending")
+    text_placeholder = st.empty()
+    approval_placeholder = st.empty()
+    events = []
+    streamed_text = ""
+    approval_shown = False
     
-    # Normalizza risk_level
-    risk_level_upper = risk_level.upper() if risk_level else "MEDIUM"
-    
-    # Emoji per livello di rischio
-    risk_emoji = {
-        "LOW": "🟢",
-        "MEDIUM": "🟡", 
-        "HIGH": "🔴"
-    }
-    
-    # Tronca testi troppo lunghi per UI
-    action_display = action[:50] + "..." if len(action) > 50 else action
-    details_display = details[:100] + "..." if len(details) > 100 else details
-    
-    message = f"""🚨 **RICHIESTA APPROVAZIONE**
-
-{risk_emoji.get(risk_level_upper, '⚠️')} **Livello Rischio:** {risk_level_upper}
-🎯 **Azione:** {action_display}
-📋 **Dettagli:** {details_display}
-📊 **Status:** {status}
-
-**Usa i pulsanti sotto per rispondere:**
-✅ **SI** - Approva l'azione
-❌ **NO** - Rifiuta l'azione  
-ℹ️ **DETTAGLI** - Richiedi più informazioni"""
+    for event in stream_turn(text):
+        parts = event.get("content", {}).get("parts", [])
+        if event.get("partial"):
+            streamed_text += "".join(part.get("text", "") for part in parts)
+            if streamed_text:
+                text_placeholder.chat_message("assistant").write(streamed_text + " ▌")
+            continue
+        
+        events.append(event)
+        if not approval_shown:
+            approval_details = approval_from_event(event)
+            if approval_details is not None:
+                approval_shown = True
+                approval_details = with_deadline(approval_details, [event])
+                # Salvato subito: se lo script viene interrotto l'approval resta in attesa
+                chat_state.set_approval(True, approval_details)
+                with approval_placeholder.container():
+                    st.warning(create_rich_approval_message(approval_details))
+                    # I click interromperebbero lo script a turno in corso: si attivano alla fine
+                    approval_panel(approval_details, disabled=True, key_prefix="streaming_")
+                    st.caption("⏳ Turno ancora in corso: i pulsanti si attivano appena termina")
+        
+        final_text = extract_assistant_message([event])
+        if final_text:
+            # Testo completo di un segmento: sostituisce i chunk, il prossimo riparte da zero
+            streamed_text = ""
+            text_placeholder.chat_message("assistant").write(final_text)
     
-    return message
+    text_placeholder.empty()
+    approval_placeholder.empty()
+    return events
 
-def send_test_message(message: str):
+@ui_action("send_message")
+def send_test_message(message: str, retry: bool = False):
     """Send a test message with STRUCTURED approval detection"""
     # Auto-create session
     if not st.session_state.session_id:
         if not create_session():
             return False
     
-    # Add to chat
-    st.session_state.messages.append({"role": "user", "content": message})
+    # Budget token: il turno non parte se la sessione lo sforerebbe
+    if session_budget_status() is BudgetStatus.STOP:
+        st.error("🛑 Budget token della sessione esaurito: crea una nuova sessione")
+        return False
+    
+    # Add to chat (un reinvio è già in chat)
+    if not retry:
+        chat_state.append_message(ChatMessage(Role.USER, message))
     
     try:
         # Send to API
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
-                "app_name": APP_NAME,
-                "user_id": st.session_state.user_id,
-                "session_id": st.session_state.session_id,
-                "new_message": {
-                    "role": "user",
-                    "parts": [{"text": message}]
-                }
-            })
-        )
+        events = consume_turn(message)
         
-        if response.status_code != 200:
-            st.error(f"Errore API: {response.text}")
-            return False
-        
-        # Process response with STRUCTURED detection
-        events = response.json()
+        # Process response with STRUCTURED detection (gli eventi interi sono già nel log)
+        record_usage(events)
         
         # 🎯 USA IL RILEVAMENTO STRUTTURATO CORRETTO
         approval_detected, approval_details = detect_approval_structured(events)
+        if approval_detected:
+            # Deadline reale dalla functionResponse del tool
+            approval_details = with_deadline(approval_details, events)
         assistant_message = extract_assistant_message(events)
         
         # Update state
         if approval_detected:
-            st.session_state.pending_approval = True
-            st.session_state.approval_details = approval_details
+            chat_state.set_approval(True, approval_details)
         
         # Add assistant message
         if assistant_message:
-            st.session_state.messages.append({"role": "assistant", "content": assistant_message})
+            chat_state.append_message(ChatMessage(Role.ASSISTANT, assistant_message))
         
         # Add approval notice with RICH details
         if approval_detected:
-            approval_message = create_rich_approval_message(approval_details)
-            st.session_state.messages.append({
-                "role": "system", 
-                "content": approval_message
-            })
+            # Il markdown viene generato al render da create_rich_approval_message()
+            chat_state.append_message(ChatMessage(Role.SYSTEM, approval=approval_details or {}))
         
         return True
         
+    except BackendTimeout:
+        # La richiesta è arrivata al server: un reinvio duplicherebbe il turno
+        st.error("⏱️ Il backend non ha risposto in tempo: il turno potrebbe essere ancora in esecuzione, ricarica la conversazione prima di riprovare")
+        return False
+    except BackendUnavailable:
+        chat_state.queue_retry(message)
+        st.warning("⚠️ Backend non raggiungibile: il messaggio verrà reinviato appena torna disponibile")
+        return False
     except Exception as e:
         st.error(f"Errore: {e}")
         return False
 
+@ui_action("send_approval")
 def send_approval(decision: str):
     """Send approval decision"""
+    # Niente controllo del budget: la decisione chiude un flusso già avviato
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
-                "app_name": APP_NAME,
-                "user_id": st.session_state.user_id,
-                "session_id": st.session_state.session_id,
-                "new_message": {
-                    "role": "user",
-                    "parts": [{"text": decision}]
-                }
-            })
-        )
-        
-        # Reset approval state
-        st.session_state.pending_approval = False
+        # Copia presa prima del turno: consume_turn aggiorna l'approval se ne arriva uno nuovo
         approval_details_copy = st.session_state.approval_details.copy() if st.session_state.approval_details else None
-        st.session_state.approval_details = None
+        events = consume_turn(decision)
+        
+        # Reset approval state (a meno che il turno non abbia chiesto un nuovo approval)
+        new_approval, new_approval_details = detect_approval_structured(events)
+        if new_approval:
+            new_approval_details = with_deadline(new_approval_details, events)
+        chat_state.set_approval(new_approval, new_approval_details if new_approval else None)
         
         # Add decision to chat with emoji
         decision_emoji = {"si": "✅", "no": "❌", "dettagli": "ℹ️"}
@@ -248,20 +320,22 @@ def send_approval(decision: str):
             action = approval_details_copy.get("action", "Azione")
             decision_display += f" - {action}"
         
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": decision_display
-        })
+        chat_state.append_message(ChatMessage(
+            Role.USER,
+            decision_display
+        ))
         
         # Get final response
-        if response.status_code == 200:
-            events = response.json()
+        if events:
+            record_usage(events)
             final_message = extract_assistant_message(events)
             if final_message:
-                st.session_state.messages.append({
-                    "role": "assistant", 
-                    "content": final_message
-                })
+                chat_state.append_message(ChatMessage(
+                    Role.ASSISTANT,
+                    final_message
+                ))
+            if new_approval:
+                chat_state.append_message(ChatMessage(Role.SYSTEM, approval=new_approval_details or {}))
         
         return True
         
@@ -274,6 +348,19 @@ def send_approval(decision: str):
 # ============================================================================
 
 st.title("🛡️ Test Approval Strutturato")
+
+# Modalità degradata: con il backend giù i click falliscono subito e i
+# messaggi non inviati restano in coda, reinviati appena torna raggiungibile
+if st.session_state.retry_queue and client.backend_available():
+    for queued_message in chat_state.pop_retries():
+        send_test_message(queued_message, retry=True)
+if client.degraded:
+    st.warning(
+        f"⚠️ Backend ADK non raggiungibile: modalità degradata "
+        f"({len(st.session_state.retry_queue)} messaggi in attesa di reinvio, "
+        f"prossimo tentativo tra {client.breaker.retry_in:.0f}s)"
+    )
+    st.button("🔄 Riprova ora")
 st.caption("Interfaccia con rilevamento approval strutturato e dettagli ricchi")
 
 # Status indicators con informazioni dettagliate
@@ -342,43 +429,20 @@ st.divider()
 # Chat Messages
 st.subheader("💬 Conversazione")
 for msg in st.session_state.messages[-10:]:  # Show last 10 messages
-    if msg["role"] == "user":
-        st.chat_message("user").write(msg["content"])
-    elif msg["role"] == "assistant":
-        st.chat_message("assistant").write(msg["content"])
-    elif msg["role"] == "system":
-        st.chat_message("assistant").warning(msg["content"])
+    if msg.role is Role.USER:
+        st.chat_message("user").write(msg.render())
+    elif msg.role is Role.ASSISTANT:
+        st.chat_message("assistant").write(msg.render())
+    elif msg.role is Role.SYSTEM:
+        st.chat_message("assistant").warning(msg.render())
 
 # Enhanced Approval Interface
 if st.session_state.pending_approval:
     st.divider()
-    
-    # Header con dettagli ricchi se disponibili
-    if st.session_state.approval_details:
-        risk = st.session_state.approval_details.get("risk_level", "medium").upper()
-        action = st.session_state.approval_details.get("action", "Azione")
-        risk_emoji = {"LOW": "🟢", "MEDIUM": "🟡", "HIGH": "🔴"}.get(risk, "⚠️")
-        st.error(f"🚨 **APPROVAZIONE RICHIESTA** - {action} ({risk_emoji} {risk})")
-    else:
-        st.error("🚨 **APPROVAZIONE RICHIESTA**")
-    
-    # Pulsanti approval
-    col1, col2, col3 = st.columns(3)
-    
-    with col1:
-        if st.button("✅ APPROVA", type="primary", use_container_width=True):
-            send_approval("si")
-            st.rerun()
-    
-    with col2:
-        if st.button("❌ RIFIUTA", type="secondary", use_container_width=True):
-            send_approval("no")
-            st.rerun()
-    
-    with col3:
-        if st.button("ℹ️ DETTAGLI", use_container_width=True):
-            send_approval("dettagli")
-            st.rerun()
+    decision = approval_panel(st.session_state.approval_details)
+    if decision:
+        send_approval(decision)
+        st.rerun()
 
 # Manual input
 st.divider()
@@ -391,9 +455,7 @@ if user_input:
 col1, col2 = st.columns(2)
 with col1:
     if st.button("🗑️ Pulisci Chat", use_container_width=True):
-        st.session_state.messages = []
-        st.session_state.pending_approval = False
-        st.session_state.approval_details = None
+        chat_state.clear_messages()
         st.rerun()
 
 with col2:
@@ -409,6 +471,9 @@ with st.sidebar:
     st.success("🎯 Metodo: STRUTTURATO")
     st.caption("Usa functionCall/functionResponse ADK")
     
+    # Connessione websocket persistente per sessione (richiede un modello Live API)
+    st.toggle("⚡ Modalità live (/run_live)", key="live_mode")
+    
     st.divider()
     
     # Statistiche sessione
@@ -421,6 +486,23 @@ with st.sidebar:
     }
     st.json(stats)
     
+    # Consumo token: ultimo turno, sessione, utente, app
+    st.subheader("🪙 Token")
+    budget_status = session_budget_status()
+    if budget_status is BudgetStatus.STOP:
+        st.error("🛑 Budget sessione esaurito")
+    elif budget_status is BudgetStatus.WARN:
+        st.warning("⚠️ Budget sessione quasi esaurito")
+    usage_by_scope = {
+        "turno": st.session_state.last_turn_usage or TokenUsage(),
+        "sessione": usage_ledger.totals(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+        if st.session_state.session_id else TokenUsage(),
+        "utente": usage_ledger.totals(APP_NAME, st.session_state.user_id),
+        "app": usage_ledger.totals(APP_NAME),
+    }
+    st.json({scope: usage.to_dict() for scope, usage in usage_by_scope.items()})
+    st.caption("Export: `python -m adk_common.usage export usage.csv`")
+    
     # Dettagli approval se disponibili
     if st.session_state.approval_details:
         st.divider()
@@ -4,10 +4,20 @@ Focus solo sui test di approvazione
 """
 
 import streamlit as st
-import requests
-import json
-import uuid
 import time
+import sys
+from pathlib import Path
+
+# Rende importabile adk_common con `streamlit run <cartella>/<app>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from adk_common.admission import queue_indicator
+from adk_common.circuit import BackendTimeout, BackendUnavailable
+from adk_common.client import describe_error, get_client
+from adk_common.event_store import EventRecorder
+from adk_common.messages import ChatMessage, Role
+from adk_common.state_store import ChatState
+from adk_common.tracing import ui_action
 
 # Set page config
 st.set_page_config(
@@ -20,29 +30,27 @@ st.set_page_config(
 API_BASE_URL = "http://localhost:8000"
 APP_NAME = "agent_approval"
 
+client = get_client(API_BASE_URL)
+
 # Initialize session state
-if "user_id" not in st.session_state:
-    st.session_state.user_id = f"user-{uuid.uuid4()}"
-if "session_id" not in st.session_state:
-    st.session_state.session_id = None
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "pending_approval" not in st.session_state:
-    st.session_state.pending_approval = False
+# user_id, session_id, messages, pending_approval, approval_details: ripristinati dal backend condiviso
+chat_state = ChatState(st.session_state, st.query_params, APP_NAME)
 
+@ui_action("create_session")
 def create_session():
     """Create a new session"""
     session_id = f"session-{int(time.time())}"
+    previous_session_id = st.session_state.session_id
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({})
+        response = client.post_json(
+            f"/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
+            {}
         )
         if response.status_code == 200:
-            st.session_state.session_id = session_id
-            st.session_state.messages = []
-            st.session_state.pending_approval = False
+            chat_state.start_session(session_id)
+            # La sessione sostituita non serve più: il server può liberarne la memoria
+            if previous_session_id:
+                client.delete_session(APP_NAME, st.session_state.user_id, previous_session_id)
             return True
         else:
             st.error(f"Errore creazione sessione: {response.text}")
@@ -51,22 +59,23 @@ def create_session():
         st.error(f"Errore connessione: {e}")
         return False
 
-def send_test_message(message: str):
+@ui_action("send_message")
+def send_test_message(message: str, retry: bool = False):
     """Send a test message"""
     # Auto-create session
     if not st.session_state.session_id:
         if not create_session():
             return False
     
-    # Add to chat
-    st.session_state.messages.append({"role": "user", "content": message})
+    # Add to chat (un reinvio è già in chat)
+    if not retry:
+        chat_state.append_message(ChatMessage(Role.USER, message))
     
     try:
         # Send to API
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
+        response = client.post_json(
+            "/run",
+            {
                 "app_name": APP_NAME,
                 "user_id": st.session_state.user_id,
                 "session_id": st.session_state.session_id,
@@ -74,15 +83,21 @@ def send_test_message(message: str):
                     "role": "user",
                     "parts": [{"text": message}]
                 }
-            })
+            },
+            stream=True,
+            on_wait=queue_indicator(st.empty())
         )
         
         if response.status_code != 200:
-            st.error(f"Errore API: {response.text}")
+            st.error(f"Errore API: {describe_error(response)}")
             return False
         
         # Process response
-        events = response.json()
+        # Nel log eventi gli eventi interi (indagini sugli approval), scritti uno alla
+        # volta mentre arrivano; in memoria solo quelli ridotti
+        events = client.decode_events(
+            response, on_event=EventRecorder(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+        )
         approval_detected = False
         assistant_message = ""
         
@@ -90,7 +105,7 @@ def send_test_message(message: str):
             # Check for approval request
             if "request_human_approval" in str(event).lower():
                 approval_detected = True
-                st.session_state.pending_approval = True
+                chat_state.set_approval(True)
             
             # Get assistant message
             if event.get("content", {}).get("role") == "model":
@@ -100,28 +115,36 @@ def send_test_message(message: str):
         
         # Add assistant message
         if assistant_message:
-            st.session_state.messages.append({"role": "assistant", "content": assistant_message})
+            chat_state.append_message(ChatMessage(Role.ASSISTANT, assistant_message))
         
         # Add approval notice
         if approval_detected:
-            st.session_state.messages.append({
-                "role": "system", 
-                "content": "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
-            })
+            chat_state.append_message(ChatMessage(
+                Role.SYSTEM,
+                "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
+            ))
         
         return True
         
+    except BackendTimeout:
+        # La richiesta è arrivata al server: un reinvio duplicherebbe il turno
+        st.error("⏱️ Il backend non ha risposto in tempo: il turno potrebbe essere ancora in esecuzione, ricarica la conversazione prima di riprovare")
+        return False
+    except BackendUnavailable:
+        chat_state.queue_retry(message)
+        st.warning("⚠️ Backend non raggiungibile: il messaggio verrà reinviato appena torna disponibile")
+        return False
     except Exception as e:
         st.error(f"Errore: {e}")
         return False
 
+@ui_action("send_approval")
 def send_approval(decision: str):
     """Send approval decision"""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
+        response = client.post_json(
+            "/run",
+            {
                 "app_name": APP_NAME,
                 "user_id": st.session_state.user_id,
                 "session_id": st.session_state.session_id,
@@ -129,30 +152,34 @@ def send_approval(decision: str):
                     "role": "user",
                     "parts": [{"text": decision}]
                 }
-            })
+            },
+            stream=True,
+            on_wait=queue_indicator(st.empty())
         )
         
-        st.session_state.pending_approval = False
+        chat_state.set_approval(False)
         
         # Add decision to chat
         decision_emoji = {"si": "✅", "no": "❌", "dettagli": "ℹ️"}
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": f"{decision_emoji.get(decision, '🔄')} **{decision.upper()}**"
-        })
+        chat_state.append_message(ChatMessage(
+            Role.USER,
+            f"{decision_emoji.get(decision, '🔄')} **{decision.upper()}**"
+        ))
         
         # Get final response
         if response.status_code == 200:
-            events = response.json()
+            events = client.decode_events(
+                response, on_event=EventRecorder(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+            )
             for event in events:
                 if event.get("content", {}).get("role") == "model":
                     parts = event.get("content", {}).get("parts", [])
                     if parts and "text" in parts[0]:
                         final_message = parts[0]["text"]
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": final_message
-                        })
+                        chat_state.append_message(ChatMessage(
+                            Role.ASSISTANT,
+                            final_message
+                        ))
         
         return True
         
@@ -165,6 +192,19 @@ def send_approval(decision: str):
 # ============================================================================
 
 st.title("🛡️ Test Approval")
+
+# Modalità degradata: con il backend giù i click falliscono subito e i
+# messaggi non inviati restano in coda, reinviati appena torna raggiungibile
+if st.session_state.retry_queue and client.backend_available():
+    for queued_message in chat_state.pop_retries():
+        send_test_message(queued_message, retry=True)
+if client.degraded:
+    st.warning(
+        f"⚠️ Backend ADK non raggiungibile: modalità degradata "
+        f"({len(st.session_state.retry_queue)} messaggi in attesa di reinvio, "
+        f"prossimo tentativo tra {client.breaker.retry_in:.0f}s)"
+    )
+    st.button("🔄 Riprova ora")
 st.caption("Testa il meccanismo di approvazione dell'agente")
 
 # Status
@@ -217,12 +257,12 @@ st.divider()
 # Chat Messages
 st.subheader("💬 Chat")
 for msg in st.session_state.messages[-5:]:  # Show only last 5 messages
-    if msg["role"] == "user":
-        st.chat_message("user").write(msg["content"])
-    elif msg["role"] == "assistant":
-        st.chat_message("assistant").write(msg["content"])
-    elif msg["role"] == "system":
-        st.chat_message("assistant").warning(msg["content"])
+    if msg.role is Role.USER:
+        st.chat_message("user").write(msg.render())
+    elif msg.role is Role.ASSISTANT:
+        st.chat_message("assistant").write(msg.render())
+    elif msg.role is Role.SYSTEM:
+        st.chat_message("assistant").warning(msg.render())
 
 # Approval Buttons
 if st.session_state.pending_approval:
@@ -255,6 +295,5 @@ if user_input:
 
 # Clear chat
 if st.button("🗑️ Pulisci Chat"):
-    st.session_state.messages = []
-    st.session_state.pending_approval = False
+    chat_state.clear_messages()
     st.rerun()
\ No newline at end of file
@@ -1,8 +1,19 @@
 import streamlit as st
-import requests
-import json
-import uuid
 import time
+import sys
+from pathlib import Path
+
+# Rende importabile adk_common con `streamlit run <cartella>/<app>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from adk_common.admission import queue_indicator
+from adk_common.circuit import BackendTimeout, BackendUnavailable
+from adk_common.client import describe_error, get_client
+from adk_common.event_store import EventRecorder
+from adk_common.live import LiveUnavailable, close_live_session, live_session_for
+from adk_common.messages import ChatMessage, Role
+from adk_common.state_store import ChatState
+from adk_common.tracing import ui_action
 
 # Set page config
 st.set_page_config(
@@ -15,16 +26,18 @@ st.set_page_config(
 API_BASE_URL = "http://localhost:8000"
 APP_NAME = "agent"
 
+client = get_client(API_BASE_URL)
+
 # Initialize session state variables
-if "user_id" not in st.session_state:
-    st.session_state.user_id = f"user-{uuid.uuid4()}"
-    
-if "session_id" not in st.session_state:
-    st.session_state.session_id = None
-    
-if "messages" not in st.session_state:
-    st.session_state.messages = []
+# user_id, session_id, messages, pending_approval, approval_details: ripristinati dal backend condiviso
+chat_state = ChatState(st.session_state, st.query_params, APP_NAME)
+if "live_mode" not in st.session_state:
+    st.session_state.live_mode = False
+if not st.session_state.live_mode:
+    # Live mode disattivata: il websocket e il thread reader non servono più
+    close_live_session(st.session_state)
 
+@ui_action("create_session")
 def create_session():
     """
     Create a new session with the simple agent.
@@ -41,21 +54,28 @@ def create_session():
         POST /apps/{app_name}/users/{user_id}/sessions/{session_id}
     """
     session_id = f"session-{int(time.time())}"
-    response = requests.post(
-        f"{API_BASE_URL}/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
-        headers={"Content-Type": "application/json"},
-        data=json.dumps({})
-    )
+    previous_session_id = st.session_state.session_id
+    try:
+        response = client.post_json(
+            f"/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
+            {}
+        )
+    except BackendUnavailable as e:
+        st.error(f"Failed to create session: {e}")
+        return False
     
     if response.status_code == 200:
-        st.session_state.session_id = session_id
-        st.session_state.messages = []
+        chat_state.start_session(session_id)
+        # La sessione sostituita non serve più: il server può liberarne la memoria
+        if previous_session_id:
+            client.delete_session(APP_NAME, st.session_state.user_id, previous_session_id)
         return True
     else:
         st.error(f"Failed to create session: {response.text}")
         return False
 
-def send_message(message):
+@ui_action("send_message")
+def send_message(message, retry=False):
     """
     Send a message to the simple agent and process the response.
     
@@ -89,48 +109,96 @@ def send_message(message):
             return False
         st.success("✅ Sessione creata automaticamente!")
     
-    # Add user message to chat
-    st.session_state.messages.append({"role": "user", "content": message})
+    # Add user message to chat (un reinvio è già in chat)
+    if not retry:
+        chat_state.append_message(ChatMessage(Role.USER, message))
+    
+    # Modalità live: il turno viaggia sulla connessione websocket della sessione
+    if st.session_state.live_mode:
+        try:
+            # Il recorder resta legato alla connessione: un batch del log per turno
+            live = live_session_for(st.session_state, API_BASE_URL, APP_NAME, on_event=EventRecorder(
+                APP_NAME, st.session_state.user_id, st.session_state.session_id
+            ))
+            # Eventi arrivati tra un turno e l'altro (iniziativa dell'agente), prima del nuovo turno
+            events = [event for event in live.drain() if not event.get("partial")]
+            live.send_text(message)
+            events += live.collect_turn()
+        except (LiveUnavailable, TimeoutError) as e:
+            st.error(f"Live error: {e}")
+            return False
+        return handle_events(events)
     
     # Send message to API
-    response = requests.post(
-        f"{API_BASE_URL}/run",
-        headers={"Content-Type": "application/json"},
-        data=json.dumps({
-            "app_name": APP_NAME,
-            "user_id": st.session_state.user_id,
-            "session_id": st.session_state.session_id,
-            "new_message": {
-                "role": "user",
-                "parts": [{"text": message}]
-            }
-        })
-    )
-    
-    if response.status_code != 200:
-        st.error(f"Error: {response.text}")
+    try:
+        response = client.post_json(
+            "/run",
+            {
+                "app_name": APP_NAME,
+                "user_id": st.session_state.user_id,
+                "session_id": st.session_state.session_id,
+                "new_message": {
+                    "role": "user",
+                    "parts": [{"text": message}]
+                }
+            },
+            stream=True,
+            on_wait=queue_indicator(st.empty())
+        )
+        if response.status_code != 200:
+            st.error(f"Error: {describe_error(response)}")
+            return False
+        
+        # Process the response: il body arriva in streaming, dentro il try
+        # Nel log eventi gli eventi interi, scritti uno alla volta; in memoria quelli ridotti
+        events = client.decode_events(
+            response, on_event=EventRecorder(APP_NAME, st.session_state.user_id, st.session_state.session_id)
+        )
+    except BackendTimeout:
+        # La richiesta è arrivata al server: un reinvio duplicherebbe il turno
+        st.error("⏱️ Il backend non ha risposto in tempo: il turno potrebbe essere ancora in esecuzione, ricarica la conversazione prima di riprovare")
+        return False
+    except BackendUnavailable:
+        chat_state.queue_retry(message)
+        st.warning("⚠️ Backend non raggiungibile: il messaggio verrà reinviato appena torna disponibile")
         return False
     
-    # Process the response
-    events = response.json()
-    
+    return handle_events(events)
+
+def handle_events(events):
+    """Adds the assistant's response from the turn's (slim) events to the chat"""
     # Extract assistant's text response
     assistant_message = None
     
     for event in events:
-        # Look for the final text response from the model
-        if event.get("content", {}).get("role") == "model" and "text" in event.get("content", {}).get("parts", [{}])[0]:
-            assistant_message = event["content"]["parts"][0]["text"]
+        # Look for the final text response from the model (i contenuti senza parti non hanno testo)
+        if event.get("content", {}).get("role") == "model":
+            parts = event["content"].get("parts", [])
+            if parts and "text" in parts[0]:
+                assistant_message = parts[0]["text"]
     
     # Add assistant response to chat
     if assistant_message:
-        st.session_state.messages.append({"role": "assistant", "content": assistant_message})
+        chat_state.append_message(ChatMessage(Role.ASSISTANT, assistant_message))
     
     return True
 
 # UI Components
 st.title("💬 Simple Agent Chat")
 
+# Modalità degradata: con il backend giù i click falliscono subito e i
+# messaggi non inviati restano in coda, reinviati appena torna raggiungibile
+if st.session_state.retry_queue and client.backend_available():
+    for queued_message in chat_state.pop_retries():
+        send_message(queued_message, retry=True)
+if client.degraded:
+    st.warning(
+        f"⚠️ Backend ADK non raggiungibile: modalità degradata "
+        f"({len(st.session_state.retry_queue)} messaggi in attesa di reinvio, "
+        f"prossimo tentativo tra {client.breaker.retry_in:.0f}s)"
+    )
+    st.button("🔄 Riprova ora")
+
 # Sidebar for session management
 with st.sidebar:
     st.header("Session Management")
@@ -145,6 +213,9 @@ with st.sidebar:
         if st.button("➕ Create Session Now"):
             create_session()
     
+    # Connessione websocket persistente per sessione (richiede un modello Live API)
+    st.toggle("⚡ Live mode (/run_live)", key="live_mode")
+    
     st.divider()
     st.caption("This app interacts with the Simple Agent via the ADK API Server.")
     st.caption("Make sure the ADK API Server is running on port 8000.")
@@ -154,10 +225,10 @@ st.subheader("Conversation")
 
 # Display messages
 for msg in st.session_state.messages:
-    if msg["role"] == "user":
-        st.chat_message("user").write(msg["content"])
+    if msg.role is Role.USER:
+        st.chat_message("user").write(msg.render())
     else:
-        st.chat_message("assistant").write(msg["content"])
+        st.chat_message("assistant").write(msg.render())
 
 # MODIFICA PRINCIPALE: Input sempre disponibile, sessione creata al volo
 user_input = st.chat_input("Type your message...")
@@ -3,11 +3,21 @@ Streamlit con DEBUG per capire dove appare esattamente request_human_approval
 """
 
 import streamlit as st
-import requests
-import json
-import uuid
 import time
-from typing import Dict, Any, Tuple, Optional
+import sys
+from pathlib import Path
+
+# Rende importabile adk_common con `streamlit run <cartella>/<app>.py`
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from adk_common.admission import queue_indicator
+from adk_common.circuit import BackendTimeout, BackendUnavailable
+from adk_common.client import describe_error, get_client
+from adk_common.event_store import EventLogReader, list_logged_apps, list_logged_sessions, record_events
+from adk_common.messages import ChatMessage, Role
+from adk_common.state_store import ChatState
+from adk_common.tracing import ui_action
+from adk_common.events import debug_approval_detection
 
 # Set page config
 st.set_page_config(
@@ -20,31 +30,33 @@ st.set_page_config(
 API_BASE_URL = "http://localhost:8000"
 APP_NAME = "agent_approval"
 
+client = get_client(API_BASE_URL)
+
 # Initialize session state
-if "user_id" not in st.session_state:
-    st.session_state.user_id = f"user-{uuid.uuid4()}"
-if "session_id" not in st.session_state:
-    st.session_state.session_id = None
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "pending_approval" not in st.session_state:
-    st.session_state.pending_approval = False
+# user_id, session_id, messages, pending_approval, approval_details: ripristinati dal backend condiviso
+chat_state = ChatState(st.session_state, st.query_params, APP_NAME)
 if "debug_events" not in st.session_state:
     st.session_state.debug_events = []
+if "history_page" not in st.session_state:
+    st.session_state.history_page = 0
 
+HISTORY_PAGE_SIZE = 50
+
+@ui_action("create_session")
 def create_session():
     """Create a new session"""
     session_id = f"session-{int(time.time())}"
+    previous_session_id = st.session_state.session_id
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({})
+        response = client.post_json(
+            f"/apps/{APP_NAME}/users/{st.session_state.user_id}/sessions/{session_id}",
+            {}
         )
         if response.status_code == 200:
-            st.session_state.session_id = session_id
-            st.session_state.messages = []
-            st.session_state.pending_approval = False
+            chat_state.start_session(session_id)
+            # La sessione sostituita non serve più: il server può liberarne la memoria
+            if previous_session_id:
+                client.delete_session(APP_NAME, st.session_state.user_id, previous_session_id)
             st.session_state.debug_events = []
             return True
         else:
@@ -54,82 +66,23 @@ def create_session():
         st.error(f"Errore connessione: {e}")
         return False
 
-def debug_approval_detection(events):
-    """
-    🔍 DEBUG: Analizza dove appare esattamente request_human_approval
-    """
-    approval_found_locations = []
-    
-    for i, event in enumerate(events):
-        event_str = str(event)
-        
-        # Ricerca grezza (che funziona)
-        if "request_human_approval" in event_str.lower():
-            approval_found_locations.append({
-                "event_index": i,
-                "method": "string_search",
-                "event_keys": list(event.keys()) if isinstance(event, dict) else "not_dict",
-                "event_preview": str(event)[:200] + "..." if len(str(event)) > 200 else str(event)
-            })
-        
-        # Analisi strutturata per debug
-        if isinstance(event, dict):
-            # Check content.parts
-            if "content" in event and "parts" in event.get("content", {}):
-                for part in event["content"]["parts"]:
-                    if "function_call" in part:
-                        approval_found_locations.append({
-                            "event_index": i,
-                            "method": "content.parts.function_call",
-                            "function_name": part["function_call"].get("name"),
-                            "event_preview": str(part)[:200]
-                        })
-            
-            # Check actions
-            if "actions" in event:
-                approval_found_locations.append({
-                    "event_index": i,
-                    "method": "actions",
-                    "actions_content": str(event["actions"])[:200],
-                    "event_preview": str(event)[:200]
-                })
-            
-            # Check tool_use
-            if "tool_use" in event:
-                approval_found_locations.append({
-                    "event_index": i,
-                    "method": "tool_use",
-                    "tool_content": str(event["tool_use"])[:200],
-                    "event_preview": str(event)[:200]
-                })
-            
-            # Check long_running_tool_ids
-            if "long_running_tool_ids" in event:
-                approval_found_locations.append({
-                    "event_index": i,
-                    "method": "long_running_tool_ids",
-                    "tool_ids": event["long_running_tool_ids"],
-                    "event_preview": str(event)[:200]
-                })
-    
-    return approval_found_locations
-
-def send_test_message(message: str):
+@ui_action("send_message")
+def send_test_message(message: str, retry: bool = False):
     """Send a test message with FULL DEBUG"""
     # Auto-create session
     if not st.session_state.session_id:
         if not create_session():
             return False
     
-    # Add to chat
-    st.session_state.messages.append({"role": "user", "content": message})
+    # Add to chat (un reinvio è già in chat)
+    if not retry:
+        chat_state.append_message(ChatMessage(Role.USER, message))
     
     try:
         # Send to API
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
+        response = client.post_json(
+            "/run",
+            {
                 "app_name": APP_NAME,
                 "user_id": st.session_state.user_id,
                 "session_id": st.session_state.session_id,
@@ -137,15 +90,18 @@ def send_test_message(message: str):
                     "role": "user",
                     "parts": [{"text": message}]
                 }
-            })
+            },
+            stream=True,
+            on_wait=queue_indicator(st.empty())
         )
         
         if response.status_code != 200:
-            st.error(f"Errore API: {response.text}")
+            st.error(f"Errore API: {describe_error(response)}")
             return False
         
         # Process response
-        events = response.json()
+        events = client.decode_events(response, slim=False)
+        record_events(APP_NAME, st.session_state.user_id, st.session_state.session_id, events)
         
         # 🔍 DEBUG: Salva eventi per analisi
         st.session_state.debug_events = events
@@ -161,7 +117,7 @@ def send_test_message(message: str):
             # Check for approval request (metodo che FUNZIONA)
             if "request_human_approval" in str(event).lower():
                 approval_detected = True
-                st.session_state.pending_approval = True
+                chat_state.set_approval(True)
             
             # Get assistant message
             if event.get("content", {}).get("role") == "model":
@@ -171,36 +127,44 @@ def send_test_message(message: str):
         
         # Add assistant message
         if assistant_message:
-            st.session_state.messages.append({"role": "assistant", "content": assistant_message})
+            chat_state.append_message(ChatMessage(Role.ASSISTANT, assistant_message))
         
         # Add approval notice
         if approval_detected:
-            st.session_state.messages.append({
-                "role": "system", 
-                "content": "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
-            })
+            chat_state.append_message(ChatMessage(
+                Role.SYSTEM,
+                "🚨 **APPROVAL RICHIESTO** - Usa i pulsanti sotto"
+            ))
             
             # DEBUG: Mostra dove è stato trovato
             if approval_locations:
                 debug_msg = f"🔍 **DEBUG:** Approval trovato in {len(approval_locations)} location(s)"
-                st.session_state.messages.append({
-                    "role": "debug",
-                    "content": debug_msg
-                })
+                chat_state.append_message(ChatMessage(
+                    Role.DEBUG,
+                    debug_msg
+                ))
         
         return True
         
+    except BackendTimeout:
+        # La richiesta è arrivata al server: un reinvio duplicherebbe il turno
+        st.error("⏱️ Il backend non ha risposto in tempo: il turno potrebbe essere ancora in esecuzione, ricarica la conversazione prima di riprovare")
+        return False
+    except BackendUnavailable:
+        chat_state.queue_retry(message)
+        st.warning("⚠️ Backend non raggiungibile: il messaggio verrà reinviato appena torna disponibile")
+        return False
     except Exception as e:
         st.error(f"Errore: {e}")
         return False
 
+@ui_action("send_approval")
 def send_approval(decision: str):
     """Send approval decision"""
     try:
-        response = requests.post(
-            f"{API_BASE_URL}/run",
-            headers={"Content-Type": "application/json"},
-            data=json.dumps({
+        response = client.post_json(
+            "/run",
+            {
                 "app_name": APP_NAME,
                 "user_id": st.session_state.user_id,
                 "session_id": st.session_state.session_id,
@@ -208,30 +172,33 @@ def send_approval(decision: str):
                     "role": "user",
                     "parts": [{"text": decision}]
                 }
-            })
+            },
+            stream=True,
+            on_wait=queue_indicator(st.empty())
         )
         
-        st.session_state.pending_approval = False
+        chat_state.set_approval(False)
         
         # Add decision to chat
         decision_emoji = {"si": "✅", "no": "❌", "dettagli": "ℹ️"}
-        st.session_state.messages.append({
-            "role": "user", 
-            "content": f"{decision_emoji.get(decision, '🔄')} **{decision.upper()}**"
-        })
+        chat_state.append_message(ChatMessage(
+            Role.USER,
+            f"{decision_emoji.get(decision, '🔄')} **{decision.upper()}**"
+        ))
         
         # Get final response
         if response.status_code == 200:
-            events = response.json()
+            events = client.decode_events(response, slim=False)
+            record_events(APP_NAME, st.session_state.user_id, st.session_state.session_id, events)
             for event in events:
                 if event.get("content", {}).get("role") == "model":
                     parts = event.get("content", {}).get("parts", [])
                     if parts and "text" in parts[0]:
                         final_message = parts[0]["text"]
-                        st.session_state.messages.append({
-                            "role": "assistant", 
-                            "content": final_message
-                        })
+                        chat_state.append_message(ChatMessage(
+                            Role.ASSISTANT,
+                            final_message
+                        ))
         
         return True
         
@@ -244,6 +211,19 @@ def send_approval(decision: str):
 # ============================================================================
 
 st.title("🔍 Debug Approval Detection")
+
+# Modalità degradata: con il backend giù i click falliscono subito e i
+# messaggi non inviati restano in coda, reinviati appena torna raggiungibile
+if st.session_state.retry_queue and client.backend_available():
+    for queued_message in chat_state.pop_retries():
+        send_test_message(queued_message, retry=True)
+if client.degraded:
+    st.warning(
+        f"⚠️ Backend ADK non raggiungibile: modalità degradata "
+        f"({len(st.session_state.retry_queue)} messaggi in attesa di reinvio, "
+        f"prossimo tentativo tra {client.breaker.retry_in:.0f}s)"
+    )
+    st.button("🔄 Riprova ora")
 st.caption("Scopriamo dove appare esattamente request_human_approval negli eventi")
 
 # Status
@@ -272,14 +252,14 @@ st.divider()
 # Chat Messages
 st.subheader("💬 Chat")
 for msg in st.session_state.messages[-5:]:
-    if msg["role"] == "user":
-        st.chat_message("user").write(msg["content"])
-    elif msg["role"] == "assistant":
-        st.chat_message("assistant").write(msg["content"])
-    elif msg["role"] == "system":
-        st.chat_message("assistant").warning(msg["content"])
-    elif msg["role"] == "debug":
-        st.chat_message("assistant").info(msg["content"])
+    if msg.role is Role.USER:
+        st.chat_message("user").write(msg.render())
+    elif msg.role is Role.ASSISTANT:
+        st.chat_message("assistant").write(msg.render())
+    elif msg.role is Role.SYSTEM:
+        st.chat_message("assistant").warning(msg.render())
+    elif msg.role is Role.DEBUG:
+        st.chat_message("assistant").info(msg.render())
 
 # Approval Buttons
 if st.session_state.pending_approval:
@@ -339,8 +319,42 @@ if st.session_state.debug_events:
             st.code(str(event)[:500] + "..." if len(str(event)) > 500 else str(event))
             st.divider()
 
+# STORICO EVENTI (event store su disco, sopravvive a "Pulisci Debug" e ai restart)
+st.divider()
+st.subheader("🗄️ Storico Eventi")
+
+# Tutte le app che scrivono nell'event store, non solo quella di questa pagina
+logged_apps = list_logged_apps()
+history_app = st.selectbox(
+    "App",
+    logged_apps,
+    index=logged_apps.index(APP_NAME) if APP_NAME in logged_apps else 0
+) if logged_apps else None
+logged_sessions = list_logged_sessions(history_app) if history_app else []
+if logged_sessions:
+    selected = st.selectbox(
+        "Sessione",
+        logged_sessions,
+        format_func=lambda item: f"{item[1]} ({item[0][-8:]})"
+    )
+    with EventLogReader(history_app, *selected) as reader:
+        total_pages = max((len(reader) - 1) // HISTORY_PAGE_SIZE + 1, 1)
+        page = st.number_input(
+            f"Pagina (1-{total_pages}) - {len(reader)} eventi",
+            min_value=1,
+            max_value=total_pages,
+            value=min(st.session_state.history_page + 1, total_pages)
+        )
+        st.session_state.history_page = page - 1
+        
+        for item in reader.page((page - 1) * HISTORY_PAGE_SIZE, HISTORY_PAGE_SIZE):
+            timestamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(item["timestamp"]))
+            with st.expander(f"#{item['position']} - batch {item['batch']} - {timestamp}"):
+                st.json(item["event"])
+else:
+    st.info("Nessun evento registrato")
+
 if st.button("🗑️ Pulisci Debug"):
     st.session_state.debug_events = []
-    st.session_state.messages = []
-    st.session_state.pending_approval = False
+    chat_state.clear_messages()
     st.rerun()
\ No newline at end of file
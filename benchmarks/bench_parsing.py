@@ -0,0 +1,159 @@
+"""
+Benchmark del percorso di parsing/rendering degli eventi ADK.
+
+Riproduce i payload in benchmarks/corpus/ (eventi /run catturati) più
+alcuni casi sintetici grandi attraverso le funzioni di adk_common.events,
+misura tempo e picco di allocazioni per chiamata e li confronta con
+benchmarks/baseline.json.
+
+Uso:
+    python benchmarks/bench_parsing.py                    # confronta con la baseline
+    python benchmarks/bench_parsing.py --update-baseline  # riscrive la baseline
+
+Esce con codice 1 se una misura supera la baseline oltre la tolleranza.
+"""
+
+import argparse
+import copy
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from adk_common.events import (
+    create_rich_approval_message,
+    debug_approval_detection,
+    detect_approval_structured,
+    extract_assistant_message,
+)
+
+CORPUS_DIR = Path(__file__).resolve().parent / "corpus"
+BASELINE_PATH = Path(__file__).resolve().parent / "baseline.json"
+
+
+def load_corpus():
+    """Carica i payload catturati: nome file -> lista di eventi"""
+    return {path.stem: json.loads(path.read_text(encoding="utf-8")) for path in sorted(CORPUS_DIR.glob("*.json"))}
+
+
+def synthetic_cases(corpus):
+    """Costruisce i casi grandi a partire dai payload reali"""
+    approval = corpus["approval_request"]
+    calculator = corpus["calculator"]
+
+    # Tool response da ~1 MB prima della richiesta di approvazione
+    big_response = copy.deepcopy(calculator[1])
+    big_response["content"]["parts"][0]["functionResponse"]["response"]["rows"] = [
+        {"id": i, "descrizione": f"riga {i} " + "x" * 80} for i in range(10_000)
+    ]
+    large_tool_response = [calculator[0], big_response, calculator[2]] + approval
+
+    # Centinaia di eventi: lunga catena di calcoli, approval in fondo
+    long_turn = [copy.deepcopy(event) for _ in range(150) for event in calculator] + approval
+
+    return {
+        "synthetic_large_tool_response": large_tool_response,
+        "synthetic_long_turn": long_turn,
+    }
+
+
+def measure(func, args, repeat):
+    """Restituisce (mediana in microsecondi, picco di allocazioni in KiB) per chiamata"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return round(statistics.median(timings) * 1e6, 1), round(peak / 1024, 1)
+
+
+def run_benchmarks(repeat):
+    corpus = load_corpus()
+    cases = {**corpus, **synthetic_cases(corpus)}
+    results = {}
+
+    for name, events in cases.items():
+        _, approval_details = detect_approval_structured(events)
+        calls = {
+            "detect_approval_structured": (detect_approval_structured, (events,)),
+            "extract_assistant_message": (extract_assistant_message, (events,)),
+            "debug_approval_detection": (debug_approval_detection, (events,)),
+            "create_rich_approval_message": (create_rich_approval_message, (approval_details,)),
+        }
+        results[name] = {}
+        for func_name, (func, args) in calls.items():
+            time_us, peak_kib = measure(func, args, repeat)
+            results[name][func_name] = {"time_us": time_us, "peak_kib": peak_kib}
+
+    return results
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Restituisce la lista delle regressioni rispetto alla baseline"""
+    regressions = []
+    for case, functions in results.items():
+        for func_name, current in functions.items():
+            reference = baseline.get(case, {}).get(func_name)
+            if not reference:
+                continue
+            # Soglie minime assolute: sotto pochi microsecondi / KiB è solo rumore
+            if current["time_us"] > max(reference["time_us"] * (1 + time_tolerance), reference["time_us"] + 5):
+                regressions.append(f"{case}/{func_name}: tempo {reference['time_us']} -> {current['time_us']} µs")
+            if current["peak_kib"] > max(reference["peak_kib"] * (1 + memory_tolerance), reference["peak_kib"] + 1):
+                regressions.append(f"{case}/{func_name}: picco {reference['peak_kib']} -> {current['peak_kib']} KiB")
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f"{'caso':<32} {'funzione':<30} {'µs/call':>10} {'base':>10} {'KiB peak':>10} {'base':>10}")
+    for case, functions in results.items():
+        for func_name, current in functions.items():
+            reference = baseline.get(case, {}).get(func_name, {})
+            print(
+                f"{case:<32} {func_name:<30} {current['time_us']:>10} {reference.get('time_us', '-'):>10} "
+                f"{current['peak_kib']:>10} {reference.get('peak_kib', '-'):>10}"
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parsing eventi ADK")
+    parser.add_argument("--repeat", type=int, default=50, help="Ripetizioni per misura (default: 50)")
+    parser.add_argument("--update-baseline", action="store_true", help="Salva i risultati come nuova baseline")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Regressione tempo ammessa (default: 0.5 = +50%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Regressione memoria ammessa (default: 0.2 = +20%%)")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat)
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+    print_table(results, baseline)
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nBaseline aggiornata: {BASELINE_PATH}")
+        return 0
+
+    regressions = compare(results, baseline, args.time_tolerance, args.memory_tolerance)
+    if regressions:
+        print("\n❌ Regressioni:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+
+    print("\n✅ Nessuna regressione")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
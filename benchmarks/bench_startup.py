@@ -0,0 +1,157 @@
+"""
+Benchmark dell'avvio a freddo di app Streamlit e moduli agente.
+
+Ogni misura gira in un processo Python nuovo (niente moduli già in cache):
+- import: tempo di `import <modulo>` per i moduli agente, adk_server e i
+  moduli adk_common usati dalle app
+- first render: prima esecuzione di ogni script Streamlit con AppTest, con
+  streamlit già importato (come nel server di Streamlit): import dello
+  script, set_page_config, creazione del client e rendering iniziale.
+  Senza backend su localhost:8000 la creazione della sessione fallisce
+  subito (connessione rifiutata), che è il caso peggiore per il primo paint.
+
+Uso:
+    python benchmarks/bench_startup.py                  # tutte le misure
+    python benchmarks/bench_startup.py --only apps      # solo first render
+    python benchmarks/bench_startup.py --top 15 simple_agent.agent
+                                                        # moduli più lenti (-X importtime)
+    python benchmarks/bench_startup.py --json startup.json
+
+Il confronto prima/dopo si fa lanciandolo su due commit.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+AGENT_MODULES = ["simple_agent.agent", "agent_approval.agent", "adk_server.app"]
+COMMON_MODULES = [
+    "adk_common.client",
+    "adk_common.tracing",
+    "adk_common.metrics",
+    "adk_common.live",
+    "adk_common.usage",
+    "adk_common.state_store",
+]
+APP_SCRIPTS = [
+    "apps/chat.py",
+    "apps/chat_session.py",
+    "apps/debug_stream.py",
+    "approval_apps/streamlit_ui.py",
+    "approval_apps/second_streamlit.py",
+]
+
+_IMPORT_PROBE = """
+import time
+started = time.perf_counter()
+import {module}
+print(time.perf_counter() - started)
+"""
+
+_RENDER_PROBE = """
+import time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({script!r}, default_timeout=60)
+started = time.perf_counter()
+at.run()
+elapsed = time.perf_counter() - started
+if at.exception:
+    raise SystemExit("eccezione nello script: " + str(at.exception[0].message))
+print(elapsed)
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(ROOT), env.get("PYTHONPATH")]))
+    return env
+
+
+def _run_probe(code: str) -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "errore")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code: str, repeat: int) -> dict:
+    # Un giro a vuoto: compila i .pyc, così si misura l'import e non la compilazione
+    _run_probe(code)
+    timings = [_run_probe(code) for _ in range(repeat)]
+    return {"median_ms": statistics.median(timings) * 1000, "min_ms": min(timings) * 1000}
+
+
+def import_breakdown(module: str, top: int) -> list:
+    """Moduli con il tempo cumulativo più alto secondo `python -X importtime`"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=_env(), capture_output=True, text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            rows.append((int(cumulative) / 1000, name.rstrip()))
+    return sorted(rows, reverse=True)[:top]
+
+
+def run_benchmarks(only: str, repeat: int) -> dict:
+    results = {}
+    if only in ("all", "modules"):
+        for module in AGENT_MODULES + COMMON_MODULES:
+            try:
+                results[f"import {module}"] = measure(_IMPORT_PROBE.format(module=module), repeat)
+            except RuntimeError as e:
+                print(f"⚠️  import {module}: {e}", file=sys.stderr)
+    if only in ("all", "apps"):
+        for script in APP_SCRIPTS:
+            try:
+                results[f"render {script}"] = measure(_RENDER_PROBE.format(script=str(ROOT / script)), repeat)
+            except RuntimeError as e:
+                print(f"⚠️  render {script}: {e}", file=sys.stderr)
+    return results
+
+
+def print_table(results: dict) -> None:
+    print(f"{'misura':<48} {'mediana':>10} {'min':>10}")
+    print("-" * 70)
+    for name, result in results.items():
+        print(f"{name:<48} {result['median_ms']:>8.1f}ms {result['min_ms']:>8.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark avvio a freddo app e agenti")
+    parser.add_argument("module", nargs="?", help="Con --top: modulo da analizzare")
+    parser.add_argument("--only", choices=("all", "modules", "apps"), default="all")
+    parser.add_argument("--repeat", type=int, default=5, help="Processi per misura (default: 5)")
+    parser.add_argument("--top", type=int, default=0, help="Mostra i N import più lenti di `module`")
+    parser.add_argument("--json", type=Path, help="Salva i risultati in un file JSON")
+    args = parser.parse_args()
+
+    if args.top:
+        if not args.module:
+            parser.error("--top richiede il nome di un modulo")
+        for cumulative_ms, name in import_breakdown(args.module, args.top):
+            print(f"{cumulative_ms:>10.1f}ms  {name}")
+        return 0
+
+    results = run_benchmarks(args.only, args.repeat)
+    print_table(results)
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"\nRisultati salvati in {args.json}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
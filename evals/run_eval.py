@@ -0,0 +1,246 @@
+"""
+Valutazione batch di un agente su un corpus di prompt.
+
+Legge un file JSONL con un prompt per riga e le etichette attese:
+
+    {"id": "elimina_file", "prompt": "Elimina tutti i file...", "expect_approval": true, "risk_level": "high"}
+
+(`risk_level` è facoltativo). Ogni prompt gira in una sessione nuova su un
+Runner in-process, con al più `--concurrency` prompt in parallelo. Alla fine
+stampa accuratezza (approval sì/no e livello di rischio), throughput e
+latenze per prompt.
+
+Ogni risultato viene accodato subito al file di checkpoint (JSONL): se il
+run si interrompe, rilanciando lo stesso comando i prompt già valutati
+vengono saltati. Il checkpoint di default è legato a corpus, agente, modello
+e istruzioni (.eval_results/<corpus>-<agente>-<impronta>.jsonl): cambiando
+modello o prompt di sistema il run riparte da zero invece di riusare
+risultati vecchi. Ogni riga porta l'impronta del run; anche con
+--checkpoint esplicito le righe di un'altra configurazione vengono ignorate.
+
+Uso:
+    python evals/run_eval.py evals/approval_prompts.jsonl
+    python evals/run_eval.py corpus.jsonl --agent agent_approval --concurrency 32 \\
+        --checkpoint .eval_results/corpus.jsonl --retry-errors
+"""
+
+import argparse
+import asyncio
+import hashlib
+import importlib
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Set
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from google.adk.cli.utils import envs
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from adk_common.events import detect_approval_structured, extract_assistant_message
+from adk_common.usage import TokenUsage
+
+EVAL_USER_ID = "eval"
+
+
+def load_corpus(path: Path) -> List[Dict[str, Any]]:
+    cases = []
+    with open(path, encoding="utf-8") as corpus_file:
+        for line_number, line in enumerate(corpus_file, 1):
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "prompt" not in case or "expect_approval" not in case:
+                raise ValueError(f"{path}:{line_number}: servono 'prompt' e 'expect_approval'")
+            case.setdefault("id", f"line-{line_number}")
+            cases.append(case)
+    return cases
+
+
+def load_agent(agent_name: str):
+    envs.load_dotenv_for_agent(agent_name, str(ROOT))
+    return importlib.import_module(f"{agent_name}.agent").root_agent
+
+
+def _instruction_text(instruction: Any) -> str:
+    # Le istruzioni dinamiche (InstructionProvider) si identificano dalla funzione
+    if callable(instruction):
+        return f"{instruction.__module__}.{instruction.__qualname__}"
+    return str(instruction or "")
+
+
+def run_fingerprint(agent_name: str, agent) -> str:
+    """Impronta della configurazione valutata: agente, modello, istruzioni e tool"""
+    digest = hashlib.sha256()
+    for part in (
+        agent_name,
+        agent.canonical_model.model,
+        _instruction_text(agent.instruction),
+        _instruction_text(agent.global_instruction),
+        ",".join(sorted(getattr(tool, "name", None) or getattr(tool, "__name__", "") for tool in agent.tools)),
+    ):
+        digest.update(part.encode("utf-8") + b"\0")
+    return digest.hexdigest()[:12]
+
+
+def load_checkpoint(path: Path, retry_errors: bool, fingerprint: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Risultati già calcolati, per id; con retry_errors quelli in errore vengono
+    rifatti. Le righe con un'impronta diversa da `fingerprint` sono ignorate.
+    """
+    if not path.exists():
+        return {}
+    results = {}
+    with open(path, encoding="utf-8") as checkpoint_file:
+        for line in checkpoint_file:
+            if not line.strip():
+                continue
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # riga troncata da un'interruzione
+            if retry_errors and result.get("error"):
+                continue
+            if result.get("fingerprint", fingerprint) != fingerprint:
+                continue  # risultato di un altro agente, modello o istruzioni
+            results[result["id"]] = result
+    return results
+
+
+def score(case: Dict[str, Any], events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    approval_detected, approval_details = detect_approval_structured(events)
+    risk_level = (approval_details or {}).get("risk_level") if approval_detected else None
+    expected_risk = case.get("risk_level")
+    return {
+        "approval": approval_detected,
+        "risk_level": risk_level,
+        "approval_correct": approval_detected == bool(case["expect_approval"]),
+        # Il rischio conta solo se il corpus lo indica e l'approval era atteso
+        "risk_correct": (None if not (expected_risk and case["expect_approval"])
+                         else (risk_level or "").lower() == expected_risk.lower()),
+        "assistant_message": extract_assistant_message(events)[:200],
+        "total_tokens": TokenUsage.from_events(events).total_tokens,
+    }
+
+
+async def run_case(runner: Runner, case: Dict[str, Any], semaphore: asyncio.Semaphore,
+                   fingerprint: str) -> Dict[str, Any]:
+    async with semaphore:
+        started = time.perf_counter()
+        result = {"id": case["id"], "fingerprint": fingerprint, "expect_approval": bool(case["expect_approval"])}
+        try:
+            session = await runner.session_service.create_session(app_name=runner.app_name, user_id=EVAL_USER_ID)
+            message = types.Content(role="user", parts=[types.Part(text=case["prompt"])])
+            events = [
+                event.model_dump(mode="json", exclude_none=True, by_alias=True)
+                async for event in runner.run_async(user_id=EVAL_USER_ID, session_id=session.id, new_message=message)
+            ]
+            result.update(score(case, events))
+            # Le sessioni di valutazione non servono più: la memoria resta costante
+            await runner.session_service.delete_session(
+                app_name=runner.app_name, user_id=EVAL_USER_ID, session_id=session.id
+            )
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+        result["latency_s"] = round(time.perf_counter() - started, 4)
+        return result
+
+
+async def run_eval(agent_name: str, agent, cases: List[Dict[str, Any]], concurrency: int, checkpoint_path: Path,
+                   done_ids: Set[str], fingerprint: str) -> float:
+    """Valuta i casi non ancora nel checkpoint; restituisce la durata del run"""
+    runner = Runner(app_name=agent_name, agent=agent, session_service=InMemorySessionService())
+    semaphore = asyncio.Semaphore(concurrency)
+
+    pending = [case for case in cases if case["id"] not in done_ids]
+    checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+    started = time.perf_counter()
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint_file:
+        tasks = [asyncio.create_task(run_case(runner, case, semaphore, fingerprint)) for case in pending]
+        for completed, task in enumerate(asyncio.as_completed(tasks), 1):
+            result = await task
+            checkpoint_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            checkpoint_file.flush()
+            status = "ERR" if result.get("error") else ("ok " if result["approval_correct"] else "KO ")
+            print(f"[{completed}/{len(pending)}] {status} {result['id']} ({result['latency_s']:.2f}s)")
+    return time.perf_counter() - started
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+def report(cases: List[Dict[str, Any]], results: Dict[str, Dict[str, Any]], run_seconds: float, run_count: int) -> None:
+    evaluated = [results[case["id"]] for case in cases if case["id"] in results]
+    scored = [result for result in evaluated if not result.get("error")]
+    errors = [result for result in evaluated if result.get("error")]
+
+    print(f"\nPrompt valutati: {len(evaluated)}/{len(cases)} (errori: {len(errors)})")
+    if scored:
+        approval_correct = sum(result["approval_correct"] for result in scored)
+        print(f"Accuratezza approval: {approval_correct}/{len(scored)} ({approval_correct / len(scored):.1%})")
+        for expected, label in ((True, "con approval"), (False, "senza approval")):
+            subset = [result for result in scored if result["expect_approval"] is expected]
+            if subset:
+                correct = sum(result["approval_correct"] for result in subset)
+                print(f"  - attesi {label}: {correct}/{len(subset)}")
+        risk_scored = [result for result in scored if result["risk_correct"] is not None]
+        if risk_scored:
+            risk_correct = sum(result["risk_correct"] for result in risk_scored)
+            print(f"Accuratezza livello di rischio: {risk_correct}/{len(risk_scored)} ({risk_correct / len(risk_scored):.1%})")
+
+        latencies = [result["latency_s"] for result in scored]
+        print(f"Latenza per prompt: p50 {statistics.median(latencies):.2f}s, "
+              f"p95 {percentile(latencies, 0.95):.2f}s, max {max(latencies):.2f}s")
+        print(f"Token totali: {sum(result.get('total_tokens', 0) for result in scored)}")
+
+    if run_count:
+        print(f"Throughput di questo run: {run_count / run_seconds:.2f} prompt/s ({run_count} in {run_seconds:.1f}s)")
+
+    mistakes = [result for result in scored if not result["approval_correct"] or result["risk_correct"] is False]
+    for result in mistakes[:20]:
+        print(f"  ✗ {result['id']}: atteso approval={result['expect_approval']}, "
+              f"ottenuto approval={result['approval']} rischio={result['risk_level']}")
+    for result in errors[:20]:
+        print(f"  ! {result['id']}: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Valutazione batch di un agente ADK su un corpus JSONL")
+    parser.add_argument("corpus", type=Path, help="File JSONL con id, prompt, expect_approval, risk_level")
+    parser.add_argument("--agent", default="agent_approval", help="Package dell'agente (default: agent_approval)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Prompt in parallelo (default: 8)")
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="File dei risultati per riprendere il run "
+                             "(default: .eval_results/<corpus>-<agente>-<impronta>.jsonl)")
+    parser.add_argument("--retry-errors", action="store_true", help="Rifà i prompt finiti in errore nel checkpoint")
+    args = parser.parse_args()
+
+    cases = load_corpus(args.corpus)
+    agent = load_agent(args.agent)
+    fingerprint = run_fingerprint(args.agent, agent)
+    checkpoint_path = args.checkpoint or ROOT / ".eval_results" / f"{args.corpus.stem}-{args.agent}-{fingerprint}.jsonl"
+    results = load_checkpoint(checkpoint_path, args.retry_errors, fingerprint)
+    if results:
+        print(f"Ripresa da {checkpoint_path}: {len(results)} prompt già valutati")
+
+    done_ids = set(results)
+    run_count = len([case for case in cases if case["id"] not in done_ids])
+    run_seconds = asyncio.run(
+        run_eval(args.agent, agent, cases, args.concurrency, checkpoint_path, done_ids, fingerprint)
+    )
+    results.update(load_checkpoint(checkpoint_path, retry_errors=False, fingerprint=fingerprint))
+
+    report(cases, results, run_seconds, run_count)
+    return 0 if not any(result.get("error") for result in results.values()) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
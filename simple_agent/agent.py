@@ -1,8 +1,13 @@
-import asyncio
+import os
 from google.adk.agents import Agent
-from google.adk.sessions import InMemorySessionService
-from google.adk.runners import Runner
-from google.genai import types
+
+from adk_common.context_window import ContextWindow
+from adk_common.fake_llm import resolve_model
+from adk_common.parallel_tools import ParallelToolExecutor
+from adk_common.process_tools import ProcessToolExecutor
+from adk_common.tracing import annotate
+
+from . import fast_path
 
 # Tool semplice per l'agente ADK - Calcolatrice
 # Basato sulla documentazione ADK: https://google.github.io/adk-docs/tools/function-tools/
@@ -25,6 +30,8 @@ def calcola_operazione(operazione: str, numero1: float, numero2: float) -> dict:
         "divisione": "/"
     }
     
+    annotate(**{"calcolo.operazione": operazione})
+
     if operazione.lower() not in operazioni_valide:
         return {
             "status": "error",
@@ -69,12 +76,31 @@ def calcola_operazione(operazione: str, numero1: float, numero2: float) -> dict:
 
 
 
+# I tool marcati CPU-bound (@cpu_bound o ADK_CPU_BOUND_TOOLS) girano in un process pool
+process_tools = ProcessToolExecutor([calcola_operazione])
+
+# Più chiamate a calcola_operazione nella stessa risposta vengono eseguite in parallelo
+parallel_tools = ParallelToolExecutor([calcola_operazione])
+
+# Al modello arrivano solo gli ultimi turni, i precedenti come riassunto
+context_window = ContextWindow(max_turns=int(os.environ.get("SIMPLE_AGENT_CONTEXT_TURNS", "20")))
+
+# SIMPLE_AGENT_MODEL=fake usa il modello finto deterministico (test e benchmark senza rete)
 root_agent = Agent(
-    model="gemini-2.0-flash",
+    model=resolve_model("SIMPLE_AGENT_MODEL"),
     name="simple",
     description="I am a simple agent",
     instruction="You are a helpful assistant.",
-    tools=[calcola_operazione]
+    tools=[calcola_operazione],
+    # Le domande aritmetiche pure ("Quanto fa 25 x 4?") non arrivano al modello
+    before_model_callback=[fast_path.before_model_callback, context_window.before_model_callback],
+    before_tool_callback=[process_tools.before_tool_callback, parallel_tools.before_tool_callback]
 
 
 )
+
+
+def shutdown() -> None:
+    """Chiamata da adk_server quando scarica l'app: libera process pool e thread pool dei tool"""
+    process_tools.shutdown()
+    parallel_tools.shutdown()
@@ -0,0 +1,148 @@
+"""
+Fast path deterministico per le richieste aritmetiche pure.
+
+Prompt come "Quanto fa 25 x 4?" o "What is 2+2?" non hanno bisogno del
+modello: il before_model_callback li riconosce e risponde al posto di
+Gemini in due passi, producendo in sessione gli stessi eventi di un turno
+normale (functionCall -> functionResponse -> testo):
+
+1. ultimo contenuto = testo utente riconosciuto -> restituisce una
+   functionCall a calcola_operazione con id FAST_PATH_ID_PREFIX... e ne
+   segna l'id nello stato di sessione (FAST_PATH_STATE_KEY)
+2. ultimo contenuto = functionResponse di calcola_operazione con la
+   chiamata segnata nello stato -> restituisce il testo finale con il
+   risultato
+
+Tutto ciò che non corrisponde esattamente al pattern va al modello.
+"""
+
+import re
+import uuid
+from typing import Any, Dict, Optional
+
+from google.adk.agents.callback_context import CallbackContext
+from google.adk.models import LlmRequest, LlmResponse
+from google.genai import types
+
+from adk_common.metrics import CACHE_REQUESTS
+
+# Gli id "adk-..." vengono rimossi da ADK prima di inviare i contenuti al modello
+FAST_PATH_ID_PREFIX = "adk-fastpath-"
+# ...quindi la chiamata in corso si riconosce dallo stato di sessione
+FAST_PATH_STATE_KEY = "fast_path:pending_call"
+
+_OPERATORS = {
+    "+": "addizione", "più": "addizione", "piu": "addizione", "plus": "addizione",
+    "-": "sottrazione", "meno": "sottrazione", "minus": "sottrazione",
+    "x": "moltiplicazione", "×": "moltiplicazione", "*": "moltiplicazione",
+    "per": "moltiplicazione", "times": "moltiplicazione", "multiplied by": "moltiplicazione",
+    # ":" escluso: "10:30" è un orario, non una divisione
+    "/": "divisione", "÷": "divisione",
+    "diviso": "divisione", "diviso per": "divisione", "divided by": "divisione",
+}
+
+# Un solo separatore decimale; "1,000", "1.000" e "1.000,5" non corrispondono
+# o vengono scartati in _number (separatore delle migliaia o decimale?)
+_NUMBER = r"-?\d+(?:[.,]\d+)?"
+_IT_PREFIX = r"quanto\s+fa|quanto\s+(?:è|e')|calcola(?:mi)?"
+_EN_PREFIX = r"what\s+is|what's|how\s+much\s+is|calculate|compute"
+_OPERATOR = "|".join(re.escape(op).replace(r"\ ", r"\s+") for op in sorted(_OPERATORS, key=len, reverse=True))
+
+_ARITHMETIC = re.compile(
+    rf"\s*(?:(?P<it>{_IT_PREFIX})|(?P<en>{_EN_PREFIX}))?\s*"
+    rf"(?P<a>{_NUMBER})\s*(?P<op>{_OPERATOR})\s*(?P<b>{_NUMBER})\s*[?.!=]*\s*",
+    re.IGNORECASE,
+)
+
+
+def _number(text: str):
+    """Intero o decimale; None se il separatore è ambiguo (seguito da esattamente 3 cifre)"""
+    integer, separator, fraction = text.replace(",", ".").partition(".")
+    if not separator:
+        return int(integer)
+    if len(fraction) == 3:
+        return None
+    return float(text.replace(",", "."))
+
+
+def parse_arithmetic(text: str) -> Optional[Dict[str, Any]]:
+    """
+    Riconosce una richiesta aritmetica pura.
+
+    Returns:
+        dict con operazione, numero1, numero2 e lingua ("it"/"en"), oppure None
+    """
+    match = _ARITHMETIC.fullmatch(text)
+    if not match:
+        return None
+    operator = re.sub(r"\s+", " ", match.group("op").lower())
+    numero1, numero2 = _number(match.group("a")), _number(match.group("b"))
+    if numero1 is None or numero2 is None:
+        return None  # meglio il modello che un risultato sbagliato
+    return {
+        "operazione": _OPERATORS[operator],
+        "numero1": numero1,
+        "numero2": numero2,
+        "lingua": "en" if match.group("en") else "it",
+    }
+
+
+def _user_text(content: types.Content) -> Optional[str]:
+    if content.role != "user" or not content.parts or len(content.parts) != 1:
+        return None
+    return content.parts[0].text
+
+
+def _format_answer(request: Dict[str, Any], response: Dict[str, Any]) -> str:
+    if response.get("status") != "success":
+        return response.get("error_message", "Errore nel calcolo")
+    if request["lingua"] == "en":
+        return f"The result of {response['operazione']} is {response['risultato']}"
+    return response["spiegazione"]
+
+
+def before_model_callback(callback_context: CallbackContext, llm_request: LlmRequest) -> Optional[LlmResponse]:
+    if not llm_request.contents:
+        return None
+
+    # Passo 1: messaggio utente aritmetico -> functionCall sintetica
+    text = _user_text(llm_request.contents[-1])
+    if text is not None:
+        request = parse_arithmetic(text)
+        # Il fast path fa da "cache" del modello: hit rate in adk_cache_requests_total
+        CACHE_REQUESTS.labels(cache="fast_path", result="miss" if request is None else "hit").inc()
+        if request is None:
+            if callback_context.state.get(FAST_PATH_STATE_KEY):
+                callback_context.state[FAST_PATH_STATE_KEY] = None
+            return None
+        call_id = callback_context.state[FAST_PATH_STATE_KEY] = f"{FAST_PATH_ID_PREFIX}{uuid.uuid4()}"
+        return LlmResponse(content=types.Content(role="model", parts=[types.Part(
+            function_call=types.FunctionCall(
+                id=call_id,
+                name="calcola_operazione",
+                args={key: request[key] for key in ("operazione", "numero1", "numero2")},
+            )
+        )]))
+
+    # Passo 2: risposta del tool a una nostra chiamata -> testo finale
+    if not callback_context.state.get(FAST_PATH_STATE_KEY):
+        return None
+    parts = llm_request.contents[-1].parts or []
+    function_responses = [part.function_response for part in parts if part.function_response]
+    if len(function_responses) != 1 or function_responses[0].name != "calcola_operazione":
+        return None
+    callback_context.state[FAST_PATH_STATE_KEY] = None
+
+    request = None
+    for content in reversed(llm_request.contents):
+        user_text = _user_text(content)
+        if user_text is not None:
+            request = parse_arithmetic(user_text)
+            break
+    if request is None:
+        return None
+
+    return LlmResponse(content=types.Content(
+        role="model",
+        parts=[types.Part(text=_format_answer(request, function_responses[0].response or {}))]
+    ))
@@ -0,0 +1,34 @@
+"""
+Fixture comuni. Gli agenti leggono il modello da configurazione all'import:
+i test usano sempre FakeLlm, senza chiavi API né rete.
+"""
+
+import os
+
+os.environ.setdefault("SIMPLE_AGENT_MODEL", "fake")
+os.environ.setdefault("APPROVAL_AGENT_MODEL", "fake")
+
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from adk_server.app import create_app
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def server():
+    """adk_server con gli agenti del repository, lifespan compreso (scheduler degli approval)"""
+    with TestClient(create_app(agents_dir=str(REPO_ROOT))) as client:
+        yield client
+
+
+def run_payload(app_name: str, user_id: str, session_id: str, text: str) -> dict:
+    return {
+        "app_name": app_name,
+        "user_id": user_id,
+        "session_id": session_id,
+        "new_message": {"role": "user", "parts": [{"text": text}]},
+    }
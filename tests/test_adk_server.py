@@ -0,0 +1,60 @@
+"""Turni completi attraverso adk_server con gli agenti del repository su FakeLlm"""
+
+import json
+
+from tests.conftest import run_payload
+
+
+def create_session(server, app_name: str, user_id: str = "u") -> str:
+    response = server.post(f"/apps/{app_name}/users/{user_id}/sessions")
+    assert response.status_code == 200
+    return response.json()["id"]
+
+
+def model_texts(events) -> list:
+    return [
+        part["text"] for event in events
+        for part in (event.get("content") or {}).get("parts", []) if "text" in part
+    ]
+
+
+def test_healthz(server):
+    body = server.get("/healthz").json()
+    assert body["status"] == "ok"
+    assert "simple_agent" in server.get("/list-apps").json()
+
+
+def test_run_with_fake_model(server):
+    session_id = create_session(server, "simple_agent")
+    response = server.post("/run", json=run_payload("simple_agent", "u", session_id, "ciao"))
+    assert response.status_code == 200
+    assert model_texts(response.json()) == ["Risposta simulata a: ciao"]
+
+    session = server.get(f"/apps/simple_agent/users/u/sessions/{session_id}").json()
+    assert [event["author"] for event in session["events"]] == ["user", "simple"]
+    assert "simple_agent" in server.get("/healthz").json()["loaded_apps"]
+
+
+def test_fast_path_answers_without_the_model(server):
+    session_id = create_session(server, "simple_agent")
+    events = server.post("/run", json=run_payload("simple_agent", "u", session_id, "Quanto fa 25 x 4?")).json()
+    calls = [part["functionCall"] for event in events for part in event["content"]["parts"] if "functionCall" in part]
+    assert [call["name"] for call in calls] == ["calcola_operazione"]
+    assert model_texts(events) == ["Il risultato di 25 * 4 è 100"]
+
+
+def test_run_sse_streams_events(server):
+    session_id = create_session(server, "simple_agent")
+    payload = {**run_payload("simple_agent", "u", session_id, "ciao a tutti"), "streaming": True}
+    with server.stream("POST", "/run_sse", json=payload) as response:
+        assert response.status_code == 200
+        events = [json.loads(line[5:]) for line in response.iter_lines() if line.startswith("data:")]
+    partial = [event for event in events if event.get("partial")]
+    final = [event for event in events if not event.get("partial")]
+    assert partial
+    assert model_texts(final) == ["Risposta simulata a: ciao a tutti"]
+
+
+def test_unknown_session_is_404(server):
+    response = server.post("/run", json=run_payload("simple_agent", "u", "inesistente", "ciao"))
+    assert response.status_code == 404
@@ -0,0 +1,123 @@
+import threading
+import time
+
+import pytest
+
+from adk_common.admission import AdaptiveLimiter, backoff_delay
+
+
+def hold_slot(limiter: AdaptiveLimiter, release: threading.Event) -> threading.Thread:
+    admitted = threading.Event()
+
+    def run():
+        with limiter.slot():
+            admitted.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    assert admitted.wait(5)
+    return thread
+
+
+def wait_until(condition, timeout: float = 5) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condizione non raggiunta"
+        time.sleep(0.01)
+
+
+def test_waiters_are_admitted_in_fifo_order():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = threading.Event()
+    holder = hold_slot(limiter, release)
+    order = []
+
+    def waiter(name):
+        with limiter.slot():
+            order.append(name)
+
+    threads = []
+    for name in ("primo", "secondo", "terzo"):
+        thread = threading.Thread(target=waiter, args=(name,))
+        thread.start()
+        threads.append(thread)
+        wait_until(lambda: limiter.queued == len(threads))
+
+    release.set()
+    for thread in [holder, *threads]:
+        thread.join(5)
+    assert order == ["primo", "secondo", "terzo"]
+    assert limiter.in_flight == 0
+
+
+def test_queue_position_is_reported_and_cleared():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = threading.Event()
+    holder = hold_slot(limiter, release)
+    positions = []
+
+    def on_wait(position):
+        positions.append(position)
+        release.set()
+
+    with limiter.slot(on_wait):
+        pass
+    holder.join(5)
+    assert positions == [1, 0]
+
+
+def test_on_wait_raising_releases_the_queue_ticket():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = threading.Event()
+    holder = hold_slot(limiter, release)
+
+    def on_wait(position):
+        raise RuntimeError("rerun di Streamlit")
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot(on_wait):
+            pass
+    # Il ticket abbandonato non resta in testa alla coda
+    assert limiter.queued == 0
+
+    release.set()
+    holder.join(5)
+    with limiter.slot():
+        assert limiter.in_flight == 1
+    assert limiter.in_flight == 0
+
+
+def test_on_wait_raising_after_admission_returns_the_slot():
+    limiter = AdaptiveLimiter(initial=1, max_limit=1)
+    release = threading.Event()
+    holder = hold_slot(limiter, release)
+
+    def on_wait(position):
+        if position == 0:
+            raise RuntimeError("stop di Streamlit")
+        release.set()
+
+    with pytest.raises(RuntimeError):
+        with limiter.slot(on_wait):
+            pass
+    holder.join(5)
+    assert limiter.in_flight == 0
+
+
+def test_aimd_limit():
+    limiter = AdaptiveLimiter(initial=4, min_limit=1, max_limit=8)
+    limiter.on_overload()
+    assert limiter.limit == 2
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 1
+    for _ in range(10):
+        limiter.on_success()
+    assert 1 < limiter.limit <= 8
+
+
+def test_backoff_delay_honours_retry_after():
+    assert backoff_delay(0, "3", cap=8) == 3
+    assert backoff_delay(0, "30", cap=8) == 8
+    assert 0 <= backoff_delay(2, "Wed, 21 Oct 2015 07:28:00 GMT", base=0.5, cap=8) <= 2
@@ -0,0 +1,110 @@
+import asyncio
+import time
+
+from google.adk.events import Event
+from google.adk.sessions import Session
+from google.genai import types
+
+from adk_common import approvals
+from adk_common.approvals import APPROVAL_TOOL_NAME
+from adk_server.approval_expiry import ApprovalExpiryScheduler, approval_status
+from tests.conftest import run_payload
+
+
+def approval_event(call_id: str, expires_at: float) -> Event:
+    return Event(author="agent", content=types.Content(role="user", parts=[types.Part(
+        function_response=types.FunctionResponse(
+            id=call_id, name=APPROVAL_TOOL_NAME,
+            response={"status": "pending_approval", "expires_at": expires_at},
+        )
+    )]))
+
+
+def user_event(text: str) -> Event:
+    return Event(author="user", content=types.Content(role="user", parts=[types.Part(text=text)]))
+
+
+def make_session(*events: Event) -> Session:
+    return Session(id="s1", app_name="agent_approval", user_id="u", events=list(events))
+
+
+def test_expired_approval_is_popped_once():
+    scheduler = ApprovalExpiryScheduler(resolve=None)
+    session = make_session()
+    scheduler.on_event(session, approval_event("call-1", expires_at=100))
+    assert scheduler.pending_count == 1
+    assert scheduler.pop_expired(now=99) == []
+    [expired] = scheduler.pop_expired(now=100)
+    assert (expired.call_id, expired.session_id) == ("call-1", "s1")
+    assert scheduler.pop_expired(now=200) == []
+    assert scheduler.pending_count == 0
+
+
+def test_user_decision_closes_the_approval():
+    scheduler = ApprovalExpiryScheduler(resolve=None)
+    session = make_session()
+    scheduler.on_event(session, approval_event("call-1", expires_at=100))
+    scheduler.on_event(session, user_event("si"))
+    assert scheduler.pop_expired(now=200) == []
+
+
+def test_newer_approval_replaces_the_older_one():
+    scheduler = ApprovalExpiryScheduler(resolve=None)
+    session = make_session()
+    scheduler.on_event(session, approval_event("call-1", expires_at=100))
+    scheduler.on_event(session, approval_event("call-2", expires_at=300))
+    assert scheduler.pop_expired(now=200) == []
+    assert [pending.call_id for pending in scheduler.pop_expired(now=300)] == ["call-2"]
+
+
+def test_run_resolves_at_the_deadline():
+    async def scenario():
+        resolved = asyncio.Event()
+        calls = []
+
+        async def resolve(pending):
+            calls.append(pending.call_id)
+            resolved.set()
+
+        scheduler = ApprovalExpiryScheduler(resolve)
+        task = asyncio.create_task(scheduler.run())
+        scheduler.on_event(make_session(), approval_event("call-1", expires_at=time.time() + 0.05))
+        await asyncio.wait_for(resolved.wait(), 5)
+        task.cancel()
+        return calls
+
+    assert asyncio.run(scenario()) == ["call-1"]
+
+
+def test_approval_status():
+    assert approval_status(make_session(), now=0)["status"] == "none"
+    pending = approval_status(make_session(approval_event("call-1", expires_at=100)), now=40)
+    assert pending["status"] == "pending" and pending["seconds_left"] == 60
+    decided = make_session(approval_event("call-1", expires_at=100), user_event("no"))
+    assert approval_status(decided, now=40)["status"] == "closed"
+
+
+def test_expired_approval_is_rejected_with_a_function_response(server, monkeypatch):
+    monkeypatch.setitem(approvals.APPROVAL_DEADLINES, "high", 0.5)
+    session = server.post("/apps/agent_approval/users/u/sessions").json()
+    session_path = f"/apps/agent_approval/users/u/sessions/{session['id']}"
+
+    response = server.post("/run", json=run_payload("agent_approval", "u", session["id"], "elimina il file report.txt"))
+    assert response.status_code == 200
+    assert server.get(f"{session_path}/approval").json()["status"] == "pending"
+
+    deadline = time.monotonic() + 10
+    while server.get(f"{session_path}/approval").json()["status"] != "expired":
+        assert time.monotonic() < deadline, "approval non scaduto"
+        time.sleep(0.1)
+
+    events = server.get(session_path).json()["events"]
+    rejections = [
+        part["functionResponse"] for event in events for part in event["content"]["parts"]
+        if part.get("functionResponse", {}).get("response", {}).get("reason") == "expired"
+    ]
+    assert len(rejections) == 1
+    assert rejections[0]["name"] == APPROVAL_TOOL_NAME
+    assert rejections[0]["response"]["status"] == "rejected"
+    # L'agente chiude il turno con il messaggio di scadenza
+    assert "scaduta" in events[-1]["content"]["parts"][0]["text"]
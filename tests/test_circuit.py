@@ -0,0 +1,66 @@
+from adk_common.circuit import CircuitBreaker, CircuitState
+
+
+class Probe:
+    def __init__(self, healthy: bool):
+        self.healthy = healthy
+        self.states = []
+        self.breaker = None
+
+    def __call__(self) -> bool:
+        self.states.append(self.breaker.state)
+        return self.healthy
+
+
+def make_breaker(healthy: bool, reset_timeout: float = 0) -> CircuitBreaker:
+    probe = Probe(healthy)
+    probe.breaker = CircuitBreaker(probe, failure_threshold=2, reset_timeout=reset_timeout)
+    return probe.breaker
+
+
+def test_opens_after_consecutive_failures():
+    breaker = make_breaker(healthy=True, reset_timeout=60)
+    breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert breaker.is_open
+
+
+def test_open_circuit_fails_fast_without_probing():
+    breaker = make_breaker(healthy=True, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.probe.states == []
+    assert breaker.retry_in > 0
+
+
+def test_half_open_probe_closes_the_circuit():
+    breaker = make_breaker(healthy=True)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.allow()
+    # La probe gira in HALF_OPEN, poi il circuito si richiude
+    assert breaker.probe.states == [CircuitState.HALF_OPEN]
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.failures == 0
+
+
+def test_failed_probe_reopens_the_circuit():
+    breaker = make_breaker(healthy=False)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.probe.states == [CircuitState.HALF_OPEN]
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_failure_while_half_open_reopens_immediately():
+    breaker = make_breaker(healthy=True)
+    breaker.state = CircuitState.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from adk_server.app import create_app
+from adk_server.fair_queue import FairScheduler, Overloaded
+from tests.conftest import REPO_ROOT, run_payload
+
+
+async def admission_order(scheduler: FairScheduler, keys) -> list:
+    """Accoda una richiesta per chiave (nell'ordine dato) dietro uno slot occupato e restituisce l'ordine di ammissione"""
+    order = []
+    await scheduler.acquire("holder")
+
+    async def request(key):
+        async with scheduler.slot(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    tasks = []
+    for key in keys:
+        tasks.append(asyncio.create_task(request(key)))
+        await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+    return order
+
+
+def test_keys_alternate_round_robin():
+    scheduler = FairScheduler(max_concurrency=1, max_queue_per_key=10, weights={})
+    order = asyncio.run(admission_order(scheduler, ["alice", "alice", "alice", "bob"]))
+    # bob non aspetta tutte le richieste di alice
+    assert order == ["alice", "bob", "alice", "alice"]
+    assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+
+def test_weights_favour_heavier_keys():
+    scheduler = FairScheduler(max_concurrency=1, max_queue_per_key=10, weights={"alice": 2})
+    order = asyncio.run(admission_order(scheduler, ["bob", "bob", "alice", "alice", "alice", "alice"]))
+    assert order[:3].count("alice") == 2
+
+
+def test_full_key_queue_is_rejected_with_retry_after():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, max_queue_per_key=1, weights={})
+        await scheduler.acquire("holder")
+        waiting = asyncio.create_task(scheduler.acquire("alice"))
+        await asyncio.sleep(0)
+        with pytest.raises(Overloaded) as error:
+            await scheduler.acquire("alice")
+        assert error.value.retry_after >= 1
+        # Un'altra chiave ha ancora posto in coda
+        other = asyncio.create_task(scheduler.acquire("bob"))
+        await asyncio.sleep(0)
+        assert scheduler.queued == 2
+        waiting.cancel()
+        other.cancel()
+        await asyncio.gather(waiting, other, return_exceptions=True)
+        assert scheduler.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = FairScheduler(max_concurrency=1, weights={})
+        await scheduler.acquire("holder")
+        waiting = asyncio.create_task(scheduler.acquire("alice"))
+        await asyncio.sleep(0)
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        scheduler.release()
+        assert scheduler.in_flight == 0 and scheduler.queued == 0
+
+    asyncio.run(scenario())
+
+
+def test_server_answers_429_with_retry_after():
+    admission = FairScheduler(max_concurrency=1, max_queue_per_key=0, weights={})
+    client = TestClient(create_app(agents_dir=str(REPO_ROOT), admission=admission))
+    session = client.post("/apps/simple_agent/users/alice/sessions").json()
+    asyncio.run(admission.acquire("occupato"))
+
+    response = client.post("/run_sse", json=run_payload("simple_agent", "alice", session["id"], "ciao"))
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) >= 1
@@ -0,0 +1,73 @@
+import asyncio
+import os
+import time
+from pathlib import Path
+
+import pytest
+
+from adk_common.process_tools import ProcessToolExecutor, cpu_bound
+
+# Le funzioni vengono re-importate nei worker (spawn) per nome qualificato:
+# devono stare a livello di modulo
+
+
+@cpu_bound
+def square(n: int) -> dict:
+    return {"status": "success", "value": n * n}
+
+
+@cpu_bound(timeout=1)
+def stuck(n: int) -> dict:
+    time.sleep(60)
+    return {"status": "success"}
+
+
+@cpu_bound
+def crash_once(marker: str) -> dict:
+    """Alla prima chiamata fa morire il worker (BrokenProcessPool), poi risponde"""
+    if not os.path.exists(marker):
+        Path(marker).touch()
+        os._exit(1)
+    return {"status": "success", "retried": True}
+
+
+@pytest.fixture
+def executor():
+    executor = ProcessToolExecutor([square, stuck, crash_once], max_workers=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_runs_in_worker_process(executor):
+    assert asyncio.run(executor._run("square", {"n": 7})) == {"status": "success", "value": 49}
+
+
+def test_pool_serves_more_event_loops(executor):
+    assert asyncio.run(executor._run("square", {"n": 2}))["value"] == 4
+    assert asyncio.run(executor._run("square", {"n": 3}))["value"] == 9
+
+
+def test_timeout_recycles_the_pool(executor):
+    asyncio.run(executor._run("square", {"n": 1}))  # avvio dei worker fuori dal timeout
+    started = time.monotonic()
+    result = asyncio.run(executor._run("stuck", {"n": 1}))
+    assert result["status"] == "error"
+    assert "tempo massimo" in result["error_message"]
+    assert time.monotonic() - started < 10
+    # Il worker bloccato è stato terminato: il pool nuovo risponde subito
+    assert asyncio.run(executor._run("square", {"n": 5}))["value"] == 25
+
+
+def test_broken_pool_is_retried(executor, tmp_path):
+    result = asyncio.run(executor._run("crash_once", {"marker": str(tmp_path / "crashed")}))
+    assert result == {"status": "success", "retried": True}
+
+
+def test_shutdown_falls_back_inline(executor):
+    executor.shutdown()
+
+    class Tool:
+        name = "square"
+        is_long_running = False
+
+    assert asyncio.run(executor.before_tool_callback(Tool(), {"n": 2}, tool_context=None)) is None